@@ -2,6 +2,7 @@
 admin.py - لوحة تحكم المدير/المطور
 """
 
+import json
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
@@ -9,6 +10,8 @@ import plotly.express as px
 import plotly.graph_objects as go
 from config import Config
 from database import Database
+from provider_health import OPEN, HALF_OPEN, ProviderHealth
+from response_cache import ResponseCache
 
 # إعدادات الصفحة للمدير
 st.set_page_config(
@@ -77,13 +80,15 @@ class AdminPanel:
         # شريط التنقل
         menu = st.sidebar.radio(
             "القائمة:",
-            ["📊 الإحصائيات", "👥 المستخدمين", "⚙️ الإعدادات", "🛠️ الصيانة", "📈 التقارير"]
+            ["📊 الإحصائيات", "👥 المستخدمين", "🩺 صحة المزودين", "⚙️ الإعدادات", "🛠️ الصيانة", "📈 التقارير"]
         )
         
         if menu == "📊 الإحصائيات":
             self.show_statistics()
         elif menu == "👥 المستخدمين":
             self.show_users()
+        elif menu == "🩺 صحة المزودين":
+            self.show_provider_health()
         elif menu == "⚙️ الإعدادات":
             self.show_settings()
         elif menu == "🛠️ الصيانة":
@@ -135,6 +140,25 @@ class AdminPanel:
                 fig = px.line(df, x='اليوم', y='الطلبات', 
                             title='الطلبات في آخر 7 أيام')
                 st.plotly_chart(fig)
+        
+        # ذاكرة الردود: الطلبات التي لم تُرسل إلى مزود مدفوع
+        if Config.RESPONSE_CACHE_ENABLED:
+            st.subheader("💾 ذاكرة الردود")
+            cache_stats = ResponseCache(Config.RESPONSE_CACHE_PATH).statistics()
+            
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                st.metric("🎯 نسبة الإصابة", f"{cache_stats['hit_rate'] * 100:.1f}%")
+            
+            with col2:
+                st.metric("🔁 تطابق تام", cache_stats['exact_hits'])
+            
+            with col3:
+                st.metric("🧠 تطابق دلالي", cache_stats['semantic_hits'])
+            
+            with col4:
+                st.metric("📦 الردود المخزنة", f"{cache_stats['entries']} / {cache_stats['max_entries']}")
     
     def show_users(self):
         """إدارة المستخدمين"""
@@ -177,6 +201,44 @@ class AdminPanel:
         else:
             st.info("لا يوجد مستخدمين")
     
+    def show_provider_health(self):
+        """صحة مزودي النماذج اللغوية كما حفظتها المنصة"""
+        st.header("🩺 صحة مزودي النماذج اللغوية")
+        st.caption(f"آخر {Config.LLM_HEALTH_WINDOW_SECONDS / 60:.0f} دقيقة • "
+                   f"الترتيب {'حسب السرعة الحالية' if Config.LLM_ADAPTIVE_ORDER else 'ثابت'}")
+        
+        summary = ProviderHealth.from_store(
+            self.db, window_seconds=Config.LLM_HEALTH_WINDOW_SECONDS).summary()
+        
+        if not summary:
+            st.info("لا توجد إحصاءات بعد")
+            return
+        
+        states = {OPEN: "🔴 موقوف مؤقتاً", HALF_OPEN: "🟡 قيد الاختبار"}
+        
+        cols = st.columns(len(summary))
+        for col, (name, stats) in zip(cols, summary.items()):
+            with col:
+                st.metric(name, states.get(stats["breaker"], "🟢 يعمل"),
+                          f"{stats['open_for_s']:.0f} ثانية متبقية" if stats["open_for_s"] else None,
+                          delta_color="inverse")
+        
+        def ms(value):
+            return round(value) if value is not None else None
+        
+        df = pd.DataFrame([{
+            "المزود": name,
+            "المحاولات": stats["requests"],
+            "نسبة الأخطاء %": round(stats["error_rate"] * 100, 1),
+            "تجاوز المهلة": stats["timeouts"],
+            "حدود المعدل (429)": stats["rate_limited"],
+            "الوسيط (ms)": ms(stats["p50_ms"]),
+            "p95 (ms)": ms(stats["p95_ms"]),
+            "أول جزء - الوسيط (ms)": ms(stats["first_token_p50_ms"]),
+            "إخفاقات متتالية": stats["consecutive_failures"]
+        } for name, stats in summary.items()])
+        st.dataframe(df, use_container_width=True)
+    
     def show_settings(self):
         """إعدادات النظام"""
         st.header("⚙️ إعدادات النظام")
@@ -296,18 +358,67 @@ class AdminPanel:
             with col2:
                 end_date = st.date_input("إلى تاريخ:")
         
-        # إنشاء التقرير
+        # إنشاء التقرير (أوقات قاعدة البيانات بالتوقيت العالمي)
         if st.button("إنشاء التقرير"):
             with st.spinner("جاري إنشاء التقرير..."):
-                # هنا سيتم إنشاء التقرير
-                report_data = self.db.generate_report(report_type)
+                now = datetime.utcnow()
+                if report_type == "مخصص":
+                    start = datetime.combine(start_date, datetime.min.time())
+                    end = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+                else:
+                    days = {"أداء اليوم": 0, "أداء الأسبوع": 7, "أداء الشهر": 30}[report_type]
+                    start = datetime.combine((now - timedelta(days=days)).date(), datetime.min.time())
+                    end = None
+                report_data = self.db.generate_report(start, end)
+                total = report_data["total"]
                 
-                if report_data:
+                if total["requests"]:
                     # عرض التقرير
                     st.subheader("ملخص التقرير")
                     
-                    for key, value in report_data.items():
-                        st.metric(key, value)
+                    def ms(value):
+                        return round(value) if value is not None else None
+                    
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.metric("الطلبات", total["requests"])
+                    with col2:
+                        st.metric("من ذاكرة الردود", total["cache_hits"])
+                    with col3:
+                        st.metric("الرموز", f"{total['prompt_tokens'] + total['completion_tokens']:,}")
+                    with col4:
+                        st.metric("التكلفة التقديرية", f"${total['cost_usd']:.4f}")
+                    
+                    stages = {
+                        "total_ms": "الزمن الكلي",
+                        "first_token_ms": "أول جزء",
+                        "provider_ms": "المزود",
+                        "retrieval_ms": "الاسترجاع",
+                        "prompt_ms": "بناء الموجه",
+                        "lookup_ms": "ذاكرة الردود"
+                    }
+                    st.markdown("**⏱️ أزمنة المراحل (ms)**")
+                    st.dataframe(pd.DataFrame([{
+                        "المرحلة": label,
+                        "الوسيط": ms(total[stage]["p50"]),
+                        "p95": ms(total[stage]["p95"]),
+                        "p99": ms(total[stage]["p99"])
+                    } for stage, label in stages.items()]), use_container_width=True)
+                    
+                    if report_data["providers"]:
+                        st.markdown("**🤖 حسب المزود**")
+                        st.dataframe(pd.DataFrame([{
+                            "المزود": name,
+                            "الطلبات": stats["requests"],
+                            "الزمن الكلي - الوسيط": ms(stats["total_ms"]["p50"]),
+                            "p95": ms(stats["total_ms"]["p95"]),
+                            "p99": ms(stats["total_ms"]["p99"]),
+                            "أول جزء - الوسيط": ms(stats["first_token_ms"]["p50"]),
+                            "رموز الطلب": stats["prompt_tokens"],
+                            "رموز الرد": stats["completion_tokens"],
+                            "رموز تقديرية (طلبات)": stats["estimated_tokens"],
+                            "التكلفة ($)": round(stats["cost_usd"], 4)
+                        } for name, stats in report_data["providers"].items()]), use_container_width=True)
                     
                     # تحميل التقرير
                     report_text = f"""
@@ -315,7 +426,7 @@ class AdminPanel:
                     النوع: {report_type}
                     التاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}
                     
-                    {str(report_data)}
+                    {json.dumps(report_data, ensure_ascii=False, indent=2)}
                     """
                     
                     st.download_button(
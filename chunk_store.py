@@ -0,0 +1,125 @@
+"""
+chunk_store.py - مخزن نصوص الأجزاء (ملف بيانات للإضافة فقط + مصفوفة إزاحات) بقراءة mmap
+"""
+
+import mmap
+import os
+import threading
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+DATA_SUFFIX = ".bin"
+OFFSETS_SUFFIX = ".offsets"
+
+
+class ChunkStore:
+    """نص كل جزء مفهرس حسب معرف FAISS بدون تحليل ملفات عند كل استعلام
+
+    النصوص مخزنة UTF-8 متتالية في ملف واحد، والإزاحة i..i+1 تحدد الجزء i.
+    """
+
+    def __init__(self, base_path: str):
+        self.data_path = base_path + DATA_SUFFIX
+        self.offsets_path = base_path + OFFSETS_SUFFIX
+        self._lock = threading.Lock()
+        self._data: Optional[mmap.mmap] = None
+        self._offsets: Optional[np.ndarray] = None
+
+    def _ensure_files(self):
+        if not os.path.exists(self.offsets_path):
+            open(self.data_path, 'ab').close()
+            np.zeros(1, dtype='<i8').tofile(self.offsets_path)
+
+    def _map(self):
+        """ربط الملفات بالذاكرة (أو إعادة ربطها إذا كبرت)"""
+        self._ensure_files()
+        offsets = np.memmap(self.offsets_path, dtype='<i8', mode='r')
+
+        data = None
+        if offsets[-1] > 0:
+            with open(self.data_path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # الربط القديم يُحرر تلقائياً بعد انتهاء القراء الذين يستخدمونه
+        self._data, self._offsets = data, offsets
+
+    def _mapped(self):
+        with self._lock:
+            if self._offsets is None or (
+                os.path.getsize(self.offsets_path) // 8 != len(self._offsets)
+            ):
+                self._map()
+            return self._data, self._offsets
+
+    def __len__(self) -> int:
+        _, offsets = self._mapped()
+        return len(offsets) - 1
+
+    def append(self, texts: List[str], ids: Iterable[int]):
+        """إضافة نصوص أجزاء جديدة بمعرفاتها (المعرفات تصاعدية)"""
+        with self._lock:
+            self._ensure_files()
+            # آخر إزاحة فقط (قراءة الملف كاملاً لكل دفعة تجعل الفهرسة تربيعية)
+            with open(self.offsets_path, 'rb') as f:
+                count = f.seek(0, os.SEEK_END) // 8
+                f.seek((count - 1) * 8)
+                end = int(np.frombuffer(f.read(8), dtype='<i8')[0])
+
+            new_offsets = []
+            with open(self.data_path, 'r+b') as data:
+                data.seek(end)
+                for chunk_id, text in zip(ids, texts):
+                    # المعرفات المحذوفة أو المتخطاة تبقى أجزاء فارغة
+                    while count - 1 + len(new_offsets) < chunk_id:
+                        new_offsets.append(end)
+                    if count - 1 + len(new_offsets) > chunk_id:
+                        raise ValueError(f"معرف الجزء {chunk_id} موجود مسبقاً في المخزن")
+
+                    encoded = text.encode('utf-8')
+                    data.write(encoded)
+                    end += len(encoded)
+                    new_offsets.append(end)
+
+                data.truncate(end)
+                data.flush()
+                os.fsync(data.fileno())
+
+            # الإزاحات تُكتب بعد البيانات حتى لا يرى القارئ جزءاً غير مكتمل
+            with open(self.offsets_path, 'ab') as f:
+                np.asarray(new_offsets, dtype='<i8').tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def get_view(self, chunk_id: int) -> memoryview:
+        """بايتات الجزء مباشرة من الذاكرة المربوطة بدون نسخ"""
+        data, offsets = self._mapped()
+        if chunk_id < 0 or chunk_id >= len(offsets) - 1 or data is None:
+            return memoryview(b'')
+        return memoryview(data)[int(offsets[chunk_id]):int(offsets[chunk_id + 1])]
+
+    def get(self, chunk_id: int) -> str:
+        """نص الجزء"""
+        return str(self.get_view(int(chunk_id)), 'utf-8')
+
+    def get_many(self, ids: Iterable[int]) -> List[str]:
+        """نصوص عدة أجزاء"""
+        return [self.get(int(chunk_id)) for chunk_id in ids]
+
+    def close(self):
+        """تحرير الذاكرة المربوطة"""
+        with self._lock:
+            if self._data is not None:
+                try:
+                    self._data.close()
+                except BufferError:
+                    # ما زال هناك memoryview مستخدم، سيُحرر عند انتهائه
+                    pass
+            self._data, self._offsets = None, None
+
+    def remove_files(self):
+        """حذف ملفات المخزن (لإعادة البناء الكاملة)"""
+        self.close()
+        for path in (self.data_path, self.offsets_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,123 @@
+"""
+chunker.py - تقسيم النصوص القانونية حسب بنيتها (الأبواب والفصول والمواد)
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# عنوان مادة داخل السطر: "المادة 12:" أو "مادة (١٢) -" أو "المادة الأولى:"
+# الفاصل بعد الرقم يميز العنوان عن الإحالات مثل "وفقاً للمادة 5 من هذا القانون"
+_ARTICLE_NUMBER = r"(?:ال)?ماد[ةه]\s+(?:رقم\s+)?[(\[]?\s*(?P<number>[0-9٠-٩]+|[\u0621-\u064A]+)\s*[)\]]?"
+ARTICLE_PATTERN = re.compile(r"(?:^|(?<=[\s.؛;،]))" + _ARTICLE_NUMBER + r"\s*[:\-–]")
+# في بداية السطر لا يلزم الفاصل: "المادة 12" وحدها أو يليها النص
+ARTICLE_LINE_PATTERN = re.compile(r"^\s*" + _ARTICLE_NUMBER + r"(?=\s|$)")
+
+# عناوين الأقسام في بداية السطر مرتبة من الأعلى إلى الأدنى
+SECTION_LEVELS = ("الكتاب", "القسم", "الباب", "الفصل", "الفرع")
+SECTION_PATTERN = re.compile(r"^\s*(" + "|".join(SECTION_LEVELS) + r")\s+(\S.*?)\s*$")
+# العناوين أسطر قصيرة؛ السطر الطويل الذي يبدأ بـ"القسم" جزء من النص
+_MAX_HEADING_WORDS = 12
+
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+
+# بيانات الجزء: رقم المادة ومسار الأقسام ورقم الجزء داخل المادة
+ChunkInfo = Dict[str, object]
+
+
+class LegalChunker:
+    """جزء لكل مادة، مع تقسيم المواد الطويلة فقط
+
+    يعمل على الأسطر كمولد، فلا يُحمّل القانون كاملاً في الذاكرة.
+    """
+
+    def __init__(self, max_words: int = 400):
+        self.max_words = max_words
+
+    def chunks(self, lines: Iterable[str]) -> Iterator[Tuple[str, ChunkInfo]]:
+        """إنتاج (نص الجزء، {article, section, part}) بترتيب ظهورها في النص"""
+        sections: Dict[str, str] = {}
+        article: Optional[str] = None
+        part = 0
+        buffer: List[str] = []
+
+        def flush():
+            nonlocal part
+            text = "\n".join(buffer).strip()
+            buffer.clear()
+            if text:
+                info = {
+                    'article': article or '',
+                    'section': " / ".join(sections[level] for level in SECTION_LEVELS
+                                          if level in sections),
+                    'part': part
+                }
+                part += 1
+                return text, info
+            return None
+
+        for line in lines:
+            heading = SECTION_PATTERN.match(line)
+            if heading and len(line.split()) <= _MAX_HEADING_WORDS:
+                chunk = flush()
+                if chunk:
+                    yield chunk
+                level = heading.group(1)
+                sections[level] = f"{level} {heading.group(2)}"
+                # عنوان جديد يلغي الأقسام الأدنى منه
+                for lower in SECTION_LEVELS[SECTION_LEVELS.index(level) + 1:]:
+                    sections.pop(lower, None)
+                article, part = None, 0
+                continue
+
+            # السطر قد يحتوي أكثر من مادة
+            matches = list(ARTICLE_PATTERN.finditer(line))
+            line_start = ARTICLE_LINE_PATTERN.match(line)
+            if line_start and (not matches or matches[0].start() >= line_start.end()):
+                matches.insert(0, line_start)
+
+            position = 0
+            for match in matches:
+                yield from self._append(buffer, line[position:match.start()], flush)
+                chunk = flush()
+                if chunk:
+                    yield chunk
+                article, part = match.group('number').translate(_DIGITS), 0
+                position = match.start()
+            yield from self._append(buffer, line[position:], flush)
+
+        chunk = flush()
+        if chunk:
+            yield chunk
+
+    def _append(self, buffer: List[str], segment: str, flush) -> Iterator[Tuple[str, ChunkInfo]]:
+        """إضافة مقطع إلى المادة الحالية وتقسيمها عند تجاوز الحد"""
+        segment = segment.strip()
+        if not segment:
+            return
+
+        words = segment.split()
+        current = sum(len(text.split()) for text in buffer)
+
+        # المادة الطويلة تُقسم عند بلوغ الحد؛ المواد العادية تبقى جزءاً واحداً
+        while current + len(words) > self.max_words:
+            take = self.max_words - current
+            buffer.append(" ".join(words[:take]))
+            words = words[take:]
+            chunk = flush()
+            if chunk:
+                yield chunk
+            current = 0
+
+        if words:
+            buffer.append(" ".join(words))
+
+
+def chunk_file(path, max_words: int = 400, encoding: str = 'utf-8') -> Iterator[Tuple[str, ChunkInfo]]:
+    """تقسيم ملف نصي سطراً بسطر"""
+    with open(path, 'r', encoding=encoding) as f:
+        yield from LegalChunker(max_words).chunks(f)
+
+
+def chunk_text(text: str, max_words: int = 400) -> Iterator[Tuple[str, ChunkInfo]]:
+    """تقسيم نص موجود في الذاكرة"""
+    return LegalChunker(max_words).chunks(text.splitlines())
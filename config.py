@@ -22,6 +22,19 @@ class Config:
     
     # إعدادات قاعدة البيانات
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///adx_platform.db")
+    DB_WAL = os.getenv("DB_WAL", "1") == "1"  # القراءة لا تنتظر الكتابة، وكاتب واحد لا يحجب الباقين طويلاً
+    DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # NORMAL آمن مع WAL ولا يزامن القرص في كل عملية
+    DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))  # ثوانٍ انتظار قفل الكتابة قبل الخطأ
+    DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", "8192"))  # ذاكرة الصفحات لكل اتصال
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # اتصالات مفتوحة تُعاد للاستخدام
+    DB_STATEMENT_CACHE = 128  # استعلامات مُعدة محفوظة في كل اتصال
+    # تسجيل الطلبات والأحداث في الخلفية على دفعات بدلاً من معاملة لكل عملية أثناء الطلب
+    DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "1") == "1"
+    DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL_MS", "200")) / 1000  # ثوانٍ
+    DB_FLUSH_ROWS = int(os.getenv("DB_FLUSH_ROWS", "200"))  # أقصى عمليات في المعاملة الواحدة
+    DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "10000"))
+    DB_FLUSH_TIMEOUT = float(os.getenv("DB_FLUSH_TIMEOUT_MS", "2000")) / 1000  # أقصى انتظار لكتابة الطلبات قبل قراءة الحصة
+    DB_QUEUE_FULL_POLICY = os.getenv("DB_QUEUE_FULL_POLICY", "block")  # block | drop_logs (الطلبات تنتظر دائماً)
     
     # مفاتيح API (يتم تحميلها من متغيرات البيئة)
     API_KEYS = {
@@ -32,9 +45,122 @@ class Config:
         "anthropic": os.getenv("ANTHROPIC_API_KEY")
     }
     
+    # مزودو النماذج اللغوية: sequential (طلب مدفوع واحد في كل مرة) | hedged (بدء المزود التالي إذا تأخر السابق،
+    # أسرع لكن قد يُدفع ثمن طلبين لنفس الاستشارة)
+    LLM_MODE = os.getenv("LLM_MODE", "sequential")
+    LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "4"))  # ثوانٍ قبل بدء المزود التالي
+    LLM_TIMEOUTS = {  # مهلة كل مزود بالثواني
+        "deepseek": float(os.getenv("DEEPSEEK_TIMEOUT", "45")),
+        "openai": float(os.getenv("OPENAI_TIMEOUT", "30")),
+        "gemini": float(os.getenv("GEMINI_TIMEOUT", "30"))
+    }
+    LLM_PRICES = {  # دولار لكل مليون رمز (الطلب، الرد) لتقدير تكلفة كل استشارة
+        "deepseek": (float(os.getenv("DEEPSEEK_PRICE_INPUT", "0.27")), float(os.getenv("DEEPSEEK_PRICE_OUTPUT", "1.10"))),
+        "openai": (float(os.getenv("OPENAI_PRICE_INPUT", "0.50")), float(os.getenv("OPENAI_PRICE_OUTPUT", "1.50"))),
+        "gemini": (float(os.getenv("GEMINI_PRICE_INPUT", "0.50")), float(os.getenv("GEMINI_PRICE_OUTPUT", "1.50")))
+    }
+    # عند بث الرد: المهلة أعلاه لأول جزء، وهذه للفاصل بين الأجزاء قبل الانتقال إلى المزود التالي
+    LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "20"))
+    # ترتيب المزودين حسب سرعتهم الحالية (0 = الترتيب الثابت) وقاطع الدائرة للمزود المتعطل
+    LLM_ADAPTIVE_ORDER = os.getenv("LLM_ADAPTIVE_ORDER", "1") == "1"
+    LLM_HEALTH_WINDOW = int(os.getenv("LLM_HEALTH_WINDOW", "100"))  # آخر محاولات لكل مزود
+    LLM_HEALTH_WINDOW_SECONDS = float(os.getenv("LLM_HEALTH_WINDOW_SECONDS", "900"))  # أقدم منها لا تُحتسب
+    LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))  # إخفاقات متتالية تفتح القاطع
+    LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "60"))  # ثوانٍ، تتضاعف مع كل فتح متتالٍ
+    LLM_BREAKER_MAX_COOLDOWN = float(os.getenv("LLM_BREAKER_MAX_COOLDOWN", "600"))
+    LLM_HEALTH_SAVE_INTERVAL = 30  # ثوانٍ بين حفظ الإحصاءات في قاعدة البيانات
+    
+    # ذاكرة الردود: نفس السؤال (أو سؤال مشابه دلالياً) لنفس الدولة والمؤسسات لا يُرسل للمزود مرة أخرى
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+    RESPONSE_CACHE_PATH = os.path.join(DATA_DIR, "cache", "responses.db")
+    RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "1") == "1"  # 0 = التطابق التام فقط
+    RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))  # تشابه جيب التمام
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL_HOURS", "168")) * 3600  # ثوانٍ
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+    
+    # الاسترجاع قبل سؤال المزود: أقرب نصوص قوانين الدولة إلى القضية تُضاف إلى الموجه
+    RAG_ENABLED = os.getenv("RAG_ENABLED", "1") == "1"
+    RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))  # أجزاء مسترجعة قبل إزالة المكرر
+    RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))  # ميزانية النصوص في الموجه (تقديرية)
+    RAG_DEDUP_THRESHOLD = 0.8  # نسبة التداخل بين جزأين التي يُعد بعدها الأدنى ترتيباً مكرراً
+    
+    # اتصالات HTTP المفتوحة لكل مزود (مشتركة بين كل الجلسات)
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "10"))
+    LLM_BASE_URLS = {  # عناوين بديلة (خوادم متوافقة أو محلية للاختبار)
+        "deepseek": os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+        "openai": os.getenv("OPENAI_BASE_URL"),
+        "gemini": os.getenv("GEMINI_API_ENDPOINT")
+    }
+    
     # إعدادات FAISS
-    FAISS_INDEX_PATH = os.path.join(DATA_DIR, "indexed", "faiss.index")
-    FAISS_METADATA_PATH = os.path.join(DATA_DIR, "indexed", "metadata.json")
+    # كل نسخة من الفهرس (FAISS وفهارس الدول وBM25 والسجل) في مجلد مستقل، والمنشورة يحددها ملف CURRENT
+    FAISS_SNAPSHOTS_DIR = os.path.join(DATA_DIR, "indexed", "snapshots")
+    FAISS_SNAPSHOTS_KEEP = int(os.getenv("FAISS_SNAPSHOTS_KEEP", "2"))  # نسخ قديمة يُحتفظ بها
+    FAISS_INDEX_PATH = os.path.join(DATA_DIR, "indexed", "faiss.index")  # خارج النسخ (للترحيل)
+    FAISS_METADATA_PATH = os.path.join(DATA_DIR, "indexed", "metadata.json")  # الصيغة القديمة (للترحيل)
+    # كل إعادة بناء كاملة تكتب جيل مخازن جديداً بجانب هذه المسارات (metadata.<الجيل>.db ...)
+    FAISS_METADATA_DB_PATH = os.path.join(DATA_DIR, "indexed", "metadata.db")
+    FAISS_CHUNKS_PATH = os.path.join(DATA_DIR, "indexed", "chunks")  # chunks.bin + chunks.offsets
+    FAISS_VECTORS_PATH = os.path.join(DATA_DIR, "indexed", "vectors.f32")  # المتجهات الأصلية لإعادة الحساب الدقيق
+    FAISS_MANIFEST_PATH = os.path.join(DATA_DIR, "indexed", "manifest.json")  # خارج النسخ (للترحيل)
+    FAISS_PARTITIONS_DIR = os.path.join(DATA_DIR, "indexed", "partitions")  # خارج النسخ (للترحيل)
+    LEXICAL_INDEX_DIR = os.path.join(DATA_DIR, "indexed", "lexical")  # خارج النسخ (للترحيل)
+    
+    # البحث: vector | lexical | hybrid (دمج الترتيبين بـ Reciprocal Rank Fusion، الدرجة المدمجة في 'rrf_score')
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "vector")
+    HYBRID_CANDIDATES = 4  # مرشحون من كل ترتيب = top_k × هذا العدد
+    RRF_K = 60
+    
+    # إعادة الترتيب بنموذج cross-encoder (اختيارية) ضمن ميزانية زمنية لكل طلب
+    RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")  # متعدد اللغات
+    RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # مرشحون من البحث الأول
+    RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+    RERANK_BATCH_SIZE = 16
+    RERANK_CACHE_SIZE = 10000  # درجات (استعلام، جزء) في الذاكرة
+    
+    # نوع الفهرس: flat | ivf_flat | hnsw | ivf_pq | sq8 | fp16 | pq
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+    FAISS_INDEX_PARAMS = {
+        "nlist": int(os.getenv("FAISS_NLIST", "1024")),  # عدد مراكز IVF
+        "hnsw_m": int(os.getenv("FAISS_HNSW_M", "32")),  # عدد الجيران في HNSW
+        "pq_m": int(os.getenv("FAISS_PQ_M", "48")),  # عدد مقاطع PQ
+        "pq_bits": 8,
+        "train_sample": 100000  # أقصى عدد متجهات لتدريب المراكز
+    }
+    FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # قوائم IVF التي يتم فحصها
+    FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))  # عمق بحث HNSW
+    FAISS_MMAP = os.getenv("FAISS_MMAP", "0") == "1"  # قراءة الفهارس بالربط بالذاكرة (للقراءة فقط)
+    # الفهارس المضغوطة: إعادة حساب أفضل top_k × هذا العدد بالمتجهات الأصلية (1 = تعطيل)
+    FAISS_RESCORE_FACTOR = int(os.getenv("FAISS_RESCORE_FACTOR", "4"))
+    # مقارنة الذاكرة والدقة لكل نوع تُحسب عند نشر كل نسخة على عينة من المتجهات
+    INDEX_EVAL_MODES = ("flat", "sq8", "fp16", "pq", "ivf_pq")
+    INDEX_EVAL_SAMPLE = 20000
+    INDEX_EVAL_QUERIES = 200
+    
+    # تقسيم الفهرس إلى أجزاء (1 = فهرس واحد)؛ يطبق عند إعادة البناء الكاملة
+    FAISS_SHARDS = int(os.getenv("FAISS_SHARDS", "1"))
+    FAISS_SHARD_BY = os.getenv("FAISS_SHARD_BY", "country")  # country | hash (حسب المعرف)
+    # النسخة المقسمة تُخدم من عملية مستقلة لكل جزء؛ 0 = تحميل كل الأجزاء في عملية البحث
+    FAISS_SHARD_SERVERS = os.getenv("FAISS_SHARD_SERVERS", "1") == "1"
+    FAISS_SHARD_AUTOSTART = os.getenv("FAISS_SHARD_AUTOSTART", "1") == "1"  # تشغيل الخوادم غير العاملة
+    FAISS_SHARD_SOCKET_DIR = os.getenv("FAISS_SHARD_SOCKET_DIR")  # الافتراضي مجلد خاص بمجلد النسخ داخل DATA_DIR
+    # مفتاح مصادقة الخوادم والمنسق؛ بدونه يُولد مفتاح عشوائي في ملف 0600 يقرؤه الطرفان
+    FAISS_SHARD_AUTHKEY = os.getenv("FAISS_SHARD_AUTHKEY", "").encode() or None
+    FAISS_SHARD_AUTHKEY_PATH = os.path.join(DATA_DIR, "shards", "authkey")
+    FAISS_SHARD_TIMEOUT = float(os.getenv("FAISS_SHARD_TIMEOUT", "5"))  # ثوانٍ لكل جزء في الاستعلام
+    
+    # إعدادات خط التضمين
+    EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))  # نصوص في كل استدعاء للنموذج
+    EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "1"))  # عمليات التضمين المتوازية
+    INDEX_WRITE_BATCH = int(os.getenv("INDEX_WRITE_BATCH", "10000"))  # أجزاء في كل إضافة للفهرس
+    CHUNK_MAX_WORDS = int(os.getenv("CHUNK_MAX_WORDS", "400"))  # المواد الأطول تُقسم إلى عدة أجزاء
+    
+    # نموذج التضمين وذاكرة التضمينات المؤقتة
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    EMBEDDING_CACHE_DIR = os.path.join(DATA_DIR, "cache", "embeddings")
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
     
     # مؤسسات دولية معتمدة
     INTERNATIONAL_INSTITUTIONS = {
@@ -0,0 +1,127 @@
+"""
+context_packing.py - تجهيز النصوص القانونية المسترجعة للموجه: إزالة المكرر وتعبئتها ضمن ميزانية رموز
+"""
+
+import math
+import re
+from typing import Dict, List, Set, Tuple
+
+# تقدير سريع لعدد الرموز دون محلل المزود: الكلمات العربية تُقسم إلى رموز أكثر من الإنجليزية
+_PIECES = re.compile(r"[\u0600-\u06FF]+|[A-Za-z]+|[0-9\u0660-\u0669]+|\S")
+_ARABIC = re.compile(r"[\u0600-\u06FF]")
+_ARABIC_CHARS_PER_TOKEN = 2.0
+_LATIN_CHARS_PER_TOKEN = 4.0
+_DIGITS_PER_TOKEN = 3.0
+
+
+def estimate_tokens(text: str) -> int:
+    """عدد رموز تقريبي (يميل إلى الزيادة فلا تُتجاوز الميزانية)"""
+    tokens = 0
+    for piece in _PIECES.findall(text or ""):
+        if _ARABIC.match(piece):
+            tokens += math.ceil(len(piece) / _ARABIC_CHARS_PER_TOKEN)
+        elif piece[0].isalpha():
+            tokens += math.ceil(len(piece) / _LATIN_CHARS_PER_TOKEN)
+        elif piece[0].isdigit():
+            tokens += math.ceil(len(piece) / _DIGITS_PER_TOKEN)
+        else:
+            tokens += 1
+    return tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """قص النص عند حدود الكلمات ليبقى ضمن max_tokens"""
+    words = text.split()
+    kept: List[str] = []
+    used = 0
+    for word in words:
+        cost = estimate_tokens(word)
+        if used + cost > max_tokens:
+            break
+        kept.append(word)
+        used += cost
+    return " ".join(kept) + (" …" if len(kept) < len(words) else "")
+
+
+def shingles(text: str, size: int = 5) -> Set[Tuple[str, ...]]:
+    """مجموعات الكلمات المتتالية (لقياس التداخل بين الأجزاء)"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def deduplicate(passages: List[Dict], threshold: float = 0.8) -> List[Dict]:
+    """حذف الأجزاء المتداخلة مع جزء أعلى ترتيباً (نفس المادة من مصدرين أو نسختين من القانون)
+
+    التداخل = المشترك ÷ حجم الأصغر، فالجزء المحتوى في جزء أطول يُعد مكرراً.
+    """
+    kept: List[Dict] = []
+    kept_shingles: List[Set[Tuple[str, ...]]] = []
+    for passage in passages:
+        current = shingles(passage.get('text') or passage.get('preview', ''))
+        if not current:
+            continue
+        if any(len(current & other) / min(len(current), len(other)) >= threshold
+               for other in kept_shingles):
+            continue
+        kept.append(passage)
+        kept_shingles.append(current)
+    return kept
+
+
+def passage_header(number: int, passage: Dict) -> str:
+    """سطر التعريف بالجزء: [رقم] العنوان • المادة • القسم"""
+    parts = [passage.get('title') or passage.get('source', '')]
+    if passage.get('article'):
+        parts.append(f"المادة {passage['article']}")
+    if passage.get('section'):
+        parts.append(passage['section'])
+    return f"[{number}] " + " • ".join(part for part in parts if part)
+
+
+def pack_context(passages: List[Dict], budget_tokens: int,
+                 min_passage_tokens: int = 60) -> Tuple[str, List[Dict], int]:
+    """تعبئة أفضل الأجزاء بالترتيب حتى نفاد الميزانية
+
+    الجزء الذي لا يتسع كاملاً يُقص إذا بقي له min_passage_tokens على الأقل.
+    يعيد (النص، الأجزاء المستخدمة، الرموز المستخدمة).
+    """
+    blocks: List[str] = []
+    used: List[Dict] = []
+    spent = 0
+    for passage in passages:
+        header = passage_header(len(used) + 1, passage)
+        text = (passage.get('text') or passage.get('preview', '')).strip()
+        cost = estimate_tokens(header) + estimate_tokens(text) + 1
+
+        remaining = budget_tokens - spent
+        if cost > remaining:
+            room = remaining - estimate_tokens(header) - 1
+            if room < min_passage_tokens:
+                break
+            # رمز احتياطي لعلامة القص
+            text = truncate_to_tokens(text, room - 1)
+            cost = estimate_tokens(header) + estimate_tokens(text) + 1
+
+        blocks.append(f"{header}\n{text}")
+        used.append(passage)
+        spent += cost
+
+    return "\n\n".join(blocks), used, spent
+
+
+def build_context(passages: List[Dict], budget_tokens: int,
+                  dedup_threshold: float = 0.8) -> Dict:
+    """{"text": نص السياق، "sources": [...]، "tokens": الرموز التقريبية}"""
+    text, used, tokens = pack_context(deduplicate(passages, dedup_threshold), budget_tokens)
+    return {
+        "text": text,
+        "sources": [{key: passage.get(key, '') for key in ('id', 'title', 'article', 'source', 'score')}
+                    for passage in used],
+        "tokens": tokens
+    }
+
+
+def empty_context() -> Dict:
+    return {"text": "", "sources": [], "tokens": 0}
@@ -2,66 +2,201 @@
 database.py - إدارة قاعدة البيانات
 """
 
+import atexit
 import sqlite3
 import json
+import threading
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from config import Config
+from provider_health import percentile
+from write_behind import WriteBehindQueue
+
+# مقاييس كل طلب (أعمدة في جدول الطلبات، الترحيل 3)
+REQUEST_METRIC_COLUMNS = {
+    "mode": "TEXT",
+    "cache_tier": "TEXT",
+    "provider": "TEXT",
+    "attempts": "INTEGER",
+    "prompt_tokens": "INTEGER",
+    "completion_tokens": "INTEGER",
+    "tokens_estimated": "BOOLEAN",
+    "cost_usd": "REAL",
+    "lookup_ms": "REAL",
+    "retrieval_ms": "REAL",
+    "prompt_ms": "REAL",
+    "provider_ms": "REAL",
+    "first_token_ms": "REAL"
+}
+
+# مراحل الطلب المعروضة في التقارير (response_time بالثواني، والباقي بالميلي ثانية)
+REPORT_STAGES = ["total_ms", "first_token_ms", "provider_ms", "retrieval_ms", "prompt_ms", "lookup_ms"]
+
+def _create_base_tables(cursor: sqlite3.Cursor):
+    # جدول المستخدمين
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT UNIQUE,
+        country TEXT,
+        first_seen TIMESTAMP,
+        last_seen TIMESTAMP,
+        total_requests INTEGER DEFAULT 0,
+        quota_used INTEGER DEFAULT 0,
+        is_banned BOOLEAN DEFAULT FALSE,
+        metadata TEXT
+    )
+    ''')
+    
+    # جدول الطلبات
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        country TEXT,
+        issue_length INTEGER,
+        institutions TEXT,
+        analysis_model TEXT,
+        response_time REAL,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+    ''')
+    
+    # جدول السجلات
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        level TEXT,
+        message TEXT,
+        details TEXT
+    )
+    ''')
+
+def _create_provider_health(cursor: sqlite3.Cursor):
+    # جدول صحة مزودي النماذج اللغوية (آخر المحاولات وحالة القاطع)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS provider_health (
+        provider TEXT PRIMARY KEY,
+        state TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _add_request_metrics(cursor: sqlite3.Cursor):
+    # أعمدة المقاييس للجداول المنشأة قبل إضافتها
+    existing = {row[1] for row in cursor.execute('PRAGMA table_info(requests)').fetchall()}
+    for column, column_type in REQUEST_METRIC_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE requests ADD COLUMN {column} {column_type}')
+
+def _add_analytics_indexes(cursor: sqlite3.Cursor):
+    # استعلامات الإحصاءات والتقارير بنطاقات زمنية والتجميع حسب الدولة
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_timestamp ON requests (timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_country_timestamp ON requests (country, timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_requests_user_id ON requests (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users (last_seen)')
+    cursor.execute('ANALYZE')
+
+# ترحيلات المخطط بالترتيب: (الإصدار، الوصف، الدالة). الإصدار المطبق يُحفظ في settings.
+# القواعد الأقدم من نظام الإصدارات تبدأ من 0، لذا الترحيلات 1-3 آمنة على جداول موجودة.
+# ترحيل جديد يُضاف في النهاية برقم أكبر ولا يُعدل ترحيل سابق.
+MIGRATIONS = [
+    (1, "الجداول الأساسية: المستخدمون والطلبات والسجلات", _create_base_tables),
+    (2, "جدول صحة مزودي النماذج اللغوية", _create_provider_health),
+    (3, "أعمدة مقاييس الطلبات (الأزمنة والرموز والتكلفة)", _add_request_metrics),
+    (4, "فهارس الطلبات والمستخدمين للإحصاءات", _add_analytics_indexes),
+]
+
+def _now() -> str:
+    """الوقت بتنسيق CURRENT_TIMESTAMP في SQLite (التوقيت العالمي)"""
+    return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
 class Database:
-    """فئة لإدارة قاعدة البيانات"""
+    """فئة لإدارة قاعدة البيانات
+    
+    الاتصالات تبقى مفتوحة في مجمع مشترك بين الخيوط بدلاً من فتح اتصال لكل عملية،
+    فتُعاد الاستعلامات المُعدة من ذاكرة كل اتصال. وضع WAL يسمح بالقراءة أثناء الكتابة،
+    وbusy_timeout يجعل الكاتب ينتظر القفل بدلاً من الفشل فوراً.
+    
+    تسجيل الطلبات والأحداث يُؤجل إلى خيط كتابة يجمعها في معاملات (write_behind)،
+    فتظهر في الإحصاءات بعد DB_FLUSH_INTERVAL على الأكثر، أما الحصة فتُقرأ بعد كتابة طلبات المستخدم المعلقة.
+    """
     
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, pool_size: int = None, write_behind: bool = None):
         self.db_path = db_path or Config.DATABASE_URL.replace("sqlite:///", "")
+        self.pool_size = Config.DB_POOL_SIZE if pool_size is None else pool_size
+        self._pool: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
         self.init_database()
+        
+        # طلبات كل مستخدم التي لم تُكتب بعد
+        self._pending = Counter()
+        self._pending_lock = threading.Lock()
+        self._writes: Optional[WriteBehindQueue] = None
+        # خيط الكتابة لم يُنهِ flush في المهلة: العمليات التالية تُكتب فوراً
+        self._stalled = False
+        if Config.DB_WRITE_BEHIND if write_behind is None else write_behind:
+            self._writes = WriteBehindQueue(
+                self._write_batch,
+                flush_interval=Config.DB_FLUSH_INTERVAL,
+                max_batch=Config.DB_FLUSH_ROWS,
+                max_size=Config.DB_QUEUE_SIZE,
+                policy=Config.DB_QUEUE_FULL_POLICY,
+                name="database-writer",
+                on_written=self._written
+            )
+            # ما في الطابور يُكتب قبل خروج العملية
+            atexit.register(self.close)
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=Config.DB_BUSY_TIMEOUT,
+                               check_same_thread=False,
+                               cached_statements=Config.DB_STATEMENT_CACHE)
+        conn.execute(f'PRAGMA synchronous = {Config.DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size = -{Config.DB_CACHE_KB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+    
+    def _acquire(self) -> sqlite3.Connection:
+        """اتصال من المجمع (أو اتصال جديد إذا كانت كل الاتصالات مستخدمة)"""
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop()
+        return self._connect()
+    
+    def _release(self, conn: sqlite3.Connection):
+        """إعادة الاتصال إلى المجمع؛ الزائد عن pool_size يُغلق"""
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        with self._pool_lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(conn)
+                return
+        conn.close()
+    
+    def close(self):
+        """كتابة العمليات المؤجلة ثم إغلاق الاتصالات المفتوحة في المجمع"""
+        if self._writes is not None:
+            self._writes.close()
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+        for conn in pool:
+            conn.close()
     
     def init_database(self):
-        """تهيئة قاعدة البيانات"""
-        conn = sqlite3.connect(self.db_path)
+        """تهيئة قاعدة البيانات: تطبيق الترحيلات التي لم تُطبق بعد بالترتيب"""
+        conn = self._acquire()
         cursor = conn.cursor()
         
-        # جدول المستخدمين
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT UNIQUE,
-            country TEXT,
-            first_seen TIMESTAMP,
-            last_seen TIMESTAMP,
-            total_requests INTEGER DEFAULT 0,
-            quota_used INTEGER DEFAULT 0,
-            is_banned BOOLEAN DEFAULT FALSE,
-            metadata TEXT
-        )
-        ''')
+        # وضع السجل يُحفظ في ملف القاعدة نفسها فيكفي ضبطه مرة واحدة
+        if Config.DB_WAL:
+            cursor.execute('PRAGMA journal_mode = WAL')
         
-        # جدول الطلبات
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            country TEXT,
-            issue_length INTEGER,
-            institutions TEXT,
-            analysis_model TEXT,
-            response_time REAL,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-        ''')
-        
-        # جدول السجلات
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            level TEXT,
-            message TEXT,
-            details TEXT
-        )
-        ''')
-        
-        # جدول الإعدادات
+        # جدول الإعدادات (يحفظ إصدار المخطط فيُنشأ قبل الترحيلات)
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS settings (
             key TEXT PRIMARY KEY,
@@ -69,43 +204,160 @@ class Database:
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         ''')
-        
         conn.commit()
-        conn.close()
+        
+        try:
+            for version, description, migrate in MIGRATIONS:
+                if version <= self._schema_version(cursor):
+                    continue
+                
+                # كل ترحيل في معاملة مع تسجيل إصداره؛ القفل يمنع عمليتين من تطبيقه معاً
+                cursor.execute('BEGIN IMMEDIATE')
+                if version <= self._schema_version(cursor):
+                    conn.rollback()
+                    continue
+                migrate(cursor)
+                cursor.executemany('''
+                INSERT OR REPLACE INTO settings (key, value, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ''', [("schema_version", str(version)),
+                      (f"schema_migration_{version:03d}", description)])
+                conn.commit()
+                print(f"✅ ترحيل قاعدة البيانات {version}: {description}")
+        except Exception:
+            conn.rollback()
+            raise
+        
+        self._release(conn)
     
-    def record_usage(self, user_id: str, country: str, 
-                    issue_length: int, institutions: List[str]):
-        """تسجيل استخدام جديد"""
-        conn = sqlite3.connect(self.db_path)
+    def _schema_version(self, cursor: sqlite3.Cursor) -> int:
+        cursor.execute("SELECT value FROM settings WHERE key = 'schema_version'")
+        row = cursor.fetchone()
+        return int(row[0]) if row else 0
+    
+    def schema_version(self) -> int:
+        """آخر ترحيل مطبق على القاعدة"""
+        conn = self._acquire()
+        version = self._schema_version(conn.cursor())
+        self._release(conn)
+        return version
+    
+    def _enqueue(self, kind: str, payload: Dict, droppable: bool = False):
+        """عملية كتابة: إلى الطابور إن قبلها، وإلا تُكتب فوراً"""
+        if self._writes is not None and not self._stalled:
+            if self._writes.put(kind, payload, droppable):
+                return
+            if droppable and self._writes.accepting:
+                # أُهملت لامتلاء الطابور (DB_QUEUE_FULL_POLICY=drop_logs)
+                return
+        # الطابور معطل أو مغلق أو خيطه متوقف
+        try:
+            self._write_batch([(kind, payload)])
+        finally:
+            self._written([(kind, payload)])
+    
+    def _written(self, batch: List[Tuple[str, Dict]]):
+        with self._pending_lock:
+            self._pending.subtract(payload["user_id"] for kind, payload in batch if kind == "usage")
+            self._pending += Counter()  # حذف الأصفار
+    
+    def _write_batch(self, batch: List[Tuple[str, Dict]]):
+        """كتابة دفعة في معاملة واحدة: تحديث كل مستخدم مرة واحدة، ثم الطلبات والأحداث"""
+        usage = [payload for kind, payload in batch if kind == "usage"]
+        logs = [payload for kind, payload in batch if kind == "log"]
+        
+        # طلبات نفس المستخدم في الدفعة تُجمع في تحديث واحد
+        users: Dict[str, Dict] = {}
+        for row in usage:
+            user = users.setdefault(row["user_id"], {"country": row["country"], "requests": 0})
+            user["requests"] += 1
+            user["last_seen"] = row["timestamp"]
+            user.setdefault("first_seen", row["timestamp"])
+        
+        conn = self._acquire()
         cursor = conn.cursor()
         
         # التحقق من وجود المستخدم
-        cursor.execute('''
+        cursor.executemany('''
         INSERT OR IGNORE INTO users (user_id, country, first_seen, last_seen)
-        VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-        ''', (user_id, country))
+        VALUES (?, ?, ?, ?)
+        ''', [(user_id, user["country"], user["first_seen"], user["last_seen"])
+              for user_id, user in users.items()])
         
         # تحديث آخر ظهور
-        cursor.execute('''
+        cursor.executemany('''
         UPDATE users 
-        SET last_seen = CURRENT_TIMESTAMP,
-            total_requests = total_requests + 1,
-            quota_used = quota_used + 1
+        SET last_seen = ?,
+            total_requests = total_requests + ?,
+            quota_used = quota_used + ?
         WHERE user_id = ?
-        ''', (user_id,))
-        
-        # تسجيل الطلب
-        cursor.execute('''
-        INSERT INTO requests (user_id, country, issue_length, institutions)
+        ''', [(user["last_seen"], user["requests"], user["requests"], user_id)
+              for user_id, user in users.items()])
+        
+        # تسجيل الطلبات
+        if usage:
+            cursor.executemany(f'''
+            INSERT INTO requests ({", ".join(usage[0])})
+            VALUES ({", ".join("?" * len(usage[0]))})
+            ''', [list(row.values()) for row in usage])
+        
+        cursor.executemany('''
+        INSERT INTO logs (timestamp, level, message, details)
         VALUES (?, ?, ?, ?)
-        ''', (user_id, country, issue_length, json.dumps(institutions)))
+        ''', [(row["timestamp"], row["level"], row["message"], row["details"]) for row in logs])
         
         conn.commit()
-        conn.close()
+        self._release(conn)
+    
+    def flush(self, timeout: float = None) -> bool:
+        """انتظار كتابة كل العمليات المؤجلة (للتقارير التي تحتاج آخر البيانات)"""
+        return self._writes.flush(timeout) if self._writes is not None else True
+    
+    def write_statistics(self) -> Dict:
+        """عدادات خيط الكتابة (مكتوبة، دفعات، مهملة، فاشلة، في الطابور)"""
+        return self._writes.statistics() if self._writes is not None else {}
+    
+    def record_usage(self, user_id: str, country: str, 
+                    issue_length: int, institutions: List[str],
+                    metrics: Optional[Dict] = None):
+        """تسجيل استخدام جديد (مع مقاييس الطلب من المستشار إن وجدت)"""
+        metrics = metrics or {}
+        # وقت الطلب نفسه لا وقت كتابة الدفعة
+        row = {
+            "user_id": user_id,
+            "timestamp": _now(),
+            "country": country,
+            "issue_length": issue_length,
+            "institutions": json.dumps(institutions),
+            "analysis_model": metrics.get("model"),
+            "response_time": metrics["total_ms"] / 1000.0 if metrics.get("total_ms") is not None else None,
+            "cache_tier": metrics.get("cache")
+        }
+        row.update({column: metrics.get(column) for column in REQUEST_METRIC_COLUMNS
+                    if column != "cache_tier"})
+        
+        with self._pending_lock:
+            self._pending[user_id] += 1
+        self._enqueue("usage", row)
     
     def get_user_quota(self, user_id: str) -> int:
-        """الحصول على الحصة المتبقية للمستخدم"""
-        conn = sqlite3.connect(self.db_path)
+        """الحصول على الحصة المتبقية للمستخدم (بعد كتابة طلباته المعلقة)"""
+        with self._pending_lock:
+            pending = self._pending[user_id] > 0
+        unwritten = 0
+        if pending or self._stalled:
+            if self.flush(Config.DB_FLUSH_TIMEOUT):
+                self._stalled = False
+            else:
+                # الطلبات التالية تُكتب فوراً حتى ينجح flush، وطلبات المستخدم التي
+                # ما زالت في الطابور تُحسب من حصته
+                if not self._stalled:
+                    print("⚠️ تأخر خيط كتابة قاعدة البيانات، سيتم الكتابة مباشرة")
+                self._stalled = True
+                with self._pending_lock:
+                    unwritten = self._pending[user_id]
+        
+        conn = self._acquire()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -113,54 +365,51 @@ class Database:
         ''', (user_id,))
         
         result = cursor.fetchone()
-        conn.close()
+        self._release(conn)
         
-        if result:
-            used = result[0]
-            return max(0, Config.MAX_REQUESTS_PER_USER - used)
-        
-        return Config.MAX_REQUESTS_PER_USER
+        used = (result[0] if result else 0) + unwritten
+        return max(0, Config.MAX_REQUESTS_PER_USER - used)
     
     def get_total_users(self) -> int:
         """إجمالي عدد المستخدمين"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         cursor = conn.cursor()
         
         cursor.execute('SELECT COUNT(*) FROM users')
         result = cursor.fetchone()[0]
-        conn.close()
+        self._release(conn)
         
         return result
     
     def get_total_requests(self) -> int:
         """إجمالي عدد الطلبات"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         cursor = conn.cursor()
         
         cursor.execute('SELECT COUNT(*) FROM requests')
         result = cursor.fetchone()[0]
-        conn.close()
+        self._release(conn)
         
         return result
     
     def get_today_requests(self) -> int:
         """طلبات اليوم"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         cursor = conn.cursor()
         
         cursor.execute('''
         SELECT COUNT(*) FROM requests 
-        WHERE DATE(timestamp) = DATE('now')
+        WHERE timestamp >= DATE('now') AND timestamp < DATE('now', '+1 day')
         ''')
         
         result = cursor.fetchone()[0]
-        conn.close()
+        self._release(conn)
         
         return result
     
     def get_popular_countries(self) -> List[tuple]:
         """الدول الأكثر استخداماً"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -172,13 +421,13 @@ class Database:
         ''')
         
         result = cursor.fetchall()
-        conn.close()
+        self._release(conn)
         
         return result
     
     def get_weekly_usage(self) -> List[tuple]:
         """الاستخدام الأسبوعي"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -190,13 +439,13 @@ class Database:
         ''')
         
         result = cursor.fetchall()
-        conn.close()
+        self._release(conn)
         
         return result
     
     def get_all_users(self, search: str = "") -> List[Dict]:
         """الحصول على جميع المستخدمين"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -210,13 +459,13 @@ class Database:
             cursor.execute('SELECT * FROM users ORDER BY last_seen DESC')
         
         rows = cursor.fetchall()
-        conn.close()
+        self._release(conn)
         
         return [dict(row) for row in rows]
     
     def clean_old_data(self, days: int = 30) -> int:
         """تنظيف البيانات القديمة"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._acquire()
         cursor = conn.cursor()
         
         # حذف الطلبات القديمة
@@ -228,19 +477,86 @@ class Database:
         deleted = cursor.rowcount
         
         conn.commit()
-        conn.close()
+        self._release(conn)
         
         return deleted
     
     def log_event(self, level: str, message: str, details: str = ""):
-        """تسجيل حدث في السجلات"""
-        conn = sqlite3.connect(self.db_path)
+        """تسجيل حدث في السجلات (قد يُهمل عند امتلاء الطابور مع سياسة drop_logs)"""
+        self._enqueue("log", {"timestamp": _now(), "level": level, "message": message,
+                              "details": details}, droppable=True)
+    
+    def save_provider_health(self, states: Dict[str, Dict]):
+        """حفظ حالة كل مزود"""
+        conn = self._acquire()
         cursor = conn.cursor()
         
-        cursor.execute('''
-        INSERT INTO logs (level, message, details)
-        VALUES (?, ?, ?)
-        ''', (level, message, details))
+        cursor.executemany('''
+        INSERT OR REPLACE INTO provider_health (provider, state, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', [(provider, json.dumps(state)) for provider, state in states.items()])
         
         conn.commit()
-        conn.close()
\ No newline at end of file
+        self._release(conn)
+    
+    def get_provider_health(self) -> Dict[str, Dict]:
+        """حالة المزودين المحفوظة"""
+        conn = self._acquire()
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT provider, state FROM provider_health')
+        rows = cursor.fetchall()
+        self._release(conn)
+        
+        return {provider: json.loads(state) for provider, state in rows}
+    
+    def generate_report(self, start: datetime, end: Optional[datetime] = None) -> Dict:
+        """أداء الطلبات وتكلفتها بين تاريخين: إجمالي ثم لكل مزود
+        
+        لكل مرحلة: الوسيط وp95 وp99 بالميلي ثانية (الطلبات المخدومة من الذاكرة ضمن الإجمالي فقط).
+        """
+        conn = self._acquire()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        SELECT provider, cache_tier, response_time, first_token_ms, provider_ms, retrieval_ms,
+               prompt_ms, lookup_ms, prompt_tokens, completion_tokens, tokens_estimated, cost_usd
+        FROM requests
+        WHERE timestamp >= ? AND timestamp < ? AND response_time IS NOT NULL
+        ''', (start.strftime('%Y-%m-%d %H:%M:%S'),
+              (end or datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')))
+        
+        rows = [dict(row) for row in cursor.fetchall()]
+        self._release(conn)
+        
+        for row in rows:
+            row["total_ms"] = row["response_time"] * 1000.0
+        
+        def summarize(group: List[Dict]) -> Dict:
+            summary = {
+                "requests": len(group),
+                "cache_hits": sum(1 for row in group if row["cache_tier"]),
+                "prompt_tokens": sum(row["prompt_tokens"] or 0 for row in group),
+                "completion_tokens": sum(row["completion_tokens"] or 0 for row in group),
+                "estimated_tokens": sum(1 for row in group if row["tokens_estimated"]),
+                "cost_usd": sum(row["cost_usd"] or 0.0 for row in group)
+            }
+            for stage in REPORT_STAGES:
+                values = [row[stage] for row in group if row[stage] is not None]
+                summary[stage] = {
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "p99": percentile(values, 99)
+                }
+            return summary
+        
+        providers: Dict[str, List[Dict]] = {}
+        for row in rows:
+            if row["provider"]:
+                providers.setdefault(row["provider"], []).append(row)
+        
+        return {
+            "total": summarize(rows),
+            "providers": {name: summarize(group) for name, group in sorted(providers.items())}
+        }
@@ -0,0 +1,251 @@
+"""
+embedding_cache.py - تخزين مؤقت دائم للتضمينات حسب بصمة النص (مشترك بين الفهرسة والبحث)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """توحيد النص قبل حساب البصمة (NFKC ومسافات موحدة)"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class EmbeddingCache:
+    """متجهات float32 في ملف مربوط بالذاكرة مع فهرس مفاتيح SQLite وإخلاء الأقدم استخداماً
+
+    وقت آخر استخدام للمدخلات المقروءة يبقى في الذاكرة ويُكتب على دفعات (عند الحفظ أو الإغلاق
+    أو بعد touch_batch مفتاحاً)، فلا يكتب الاستعلام المخدوم من الذاكرة في القرص.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 200000,
+                 touch_batch: int = 1000):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", model_name).strip("_")
+        self.vectors_path = os.path.join(cache_dir, f"{slug}.vectors")
+        self.db_path = os.path.join(cache_dir, f"{slug}.db")
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._vectors: Optional[np.memmap] = None
+        self._touched: Dict[str, float] = {}
+
+    def key(self, text: str) -> str:
+        """مفتاح التخزين: بصمة اسم النموذج مع النص الموحد"""
+        payload = f"{self.model_name}\0{normalize_text(text)}".encode('utf-8')
+        return hashlib.sha1(payload).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            # الكتابة لا تزامن القرص في كل معاملة، والقراءة لا تنتظر الكتابة
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute('PRAGMA synchronous = NORMAL')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER UNIQUE,
+                last_used REAL
+            )
+            ''')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS info (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def _info(self, conn: sqlite3.Connection, name: str) -> Optional[int]:
+        row = conn.execute("SELECT value FROM info WHERE name = ?", (name,)).fetchone()
+        return int(row[0]) if row else None
+
+    def _open_vectors(self, dim: Optional[int]) -> Optional[np.memmap]:
+        """ربط ملف المتجهات (يُنشأ عند أول كتابة بعد معرفة الأبعاد)
+
+        السعة المحفوظة في info مع الأبعاد؛ تغيير max_entries يكبّر الملف أو يقلصه
+        (مع حذف مدخلات الخانات الزائدة) قبل الربط.
+        """
+        if self._vectors is not None:
+            return self._vectors
+
+        conn = self._connection()
+        stored_dim = self._info(conn, 'dim')
+        if stored_dim is None and dim is None:
+            return None
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            stored_dim = self._info(conn, 'dim')
+            if stored_dim is None:
+                stored_dim = dim
+                conn.execute("INSERT INTO info (name, value) VALUES ('dim', ?)", (str(dim),))
+
+            row_bytes = stored_dim * 4
+            stored_max = self._info(conn, 'max_entries')
+            if stored_max is None and os.path.exists(self.vectors_path):
+                # ذاكرة أنشئت قبل حفظ السعة
+                stored_max = os.path.getsize(self.vectors_path) // row_bytes
+            if stored_max is not None and stored_max > self.max_entries:
+                # الخانات من max_entries فما بعد لم تعد في الملف (الخانات تُخصص متتالية من 0)
+                conn.execute('DELETE FROM entries WHERE slot >= ?', (self.max_entries,))
+
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(self.max_entries * row_bytes)
+            conn.execute("INSERT OR REPLACE INTO info (name, value) VALUES ('max_entries', ?)",
+                         (str(self.max_entries),))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        self._vectors = np.memmap(self.vectors_path, dtype='float32', mode='r+',
+                                  shape=(self.max_entries, stored_dim))
+        return self._vectors
+
+    def _flush_touched(self, conn: sqlite3.Connection):
+        """كتابة أوقات الاستخدام المؤجلة (يُستدعى والقفل مأخوذ)"""
+        if not self._touched:
+            return
+        conn.executemany('UPDATE entries SET last_used = ? WHERE key = ?',
+                         [(used, key) for key, used in self._touched.items()])
+        conn.commit()
+        self._touched.clear()
+
+    def _allocate_slots(self, conn: sqlite3.Connection, count: int) -> List[int]:
+        """خانات فارغة، أو خانات أقدم المدخلات استخداماً عند امتلاء الذاكرة"""
+        used = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        free = min(count, self.max_entries - used)
+        slots = list(range(used, used + free))
+
+        if len(slots) < count:
+            evicted = conn.execute(
+                'SELECT key, slot FROM entries ORDER BY last_used LIMIT ?',
+                (count - len(slots),)
+            ).fetchall()
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key, _ in evicted])
+            slots.extend(slot for _, slot in evicted)
+
+        return slots
+
+    def encode(self, texts: List[str], encode_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """تضمين النصوص مع إعادة استخدام المتجهات المخزنة وتضمين الناقص فقط"""
+        keys = [self.key(text) for text in texts]
+        now = time.time()
+
+        with self._lock:
+            conn = self._connection()
+            vectors = self._open_vectors(None)
+
+            found: Dict[str, int] = {}
+            if vectors is not None:
+                unique_keys = list(set(keys))
+                for start in range(0, len(unique_keys), 900):
+                    batch = unique_keys[start:start + 900]
+                    placeholders = ",".join("?" * len(batch))
+                    found.update(conn.execute(
+                        f'SELECT key, slot FROM entries WHERE key IN ({placeholders})', batch
+                    ).fetchall())
+
+            cached = {key: np.array(vectors[slot]) for key, slot in found.items()}
+            self._touched.update((key, now) for key in found)
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched(conn)
+
+        # تضمين النصوص غير المخزنة (كل نص مرة واحدة)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            computed = np.asarray(encode_fn(list(missing.values())), dtype='float32')
+            cached.update(zip(missing.keys(), computed))
+            self._store(list(missing.keys()), computed, now)
+
+        with self._lock:
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+
+        return np.stack([cached[key] for key in keys]) if keys else np.empty((0, 0), dtype='float32')
+
+    def _store(self, keys: List[str], embeddings: np.ndarray, now: float):
+        """كتابة متجهات جديدة في الخانات المتاحة"""
+        keys = keys[-self.max_entries:]
+        embeddings = embeddings[-self.max_entries:]
+
+        with self._lock:
+            conn = self._connection()
+            vectors = self._open_vectors(embeddings.shape[1])
+            if vectors.shape[1] != embeddings.shape[1]:
+                return
+
+            # الإخلاء يعتمد على أوقات الاستخدام الحديثة
+            self._flush_touched(conn)
+
+            # معاملة كتابة واحدة من اختيار الخانات حتى الحفظ: عمليتان تشتركان في الملف
+            # لا تختاران نفس الخانة، والمتجه يُكتب بعد حجز خانته وقبل أن يراه القراء
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # مفاتيح أضافها خيط أو عملية أخرى في الأثناء
+                existing = set()
+                for start in range(0, len(keys), 900):
+                    batch = keys[start:start + 900]
+                    placeholders = ",".join("?" * len(batch))
+                    existing.update(row[0] for row in conn.execute(
+                        f'SELECT key FROM entries WHERE key IN ({placeholders})', batch
+                    ))
+
+                new = [i for i, key in enumerate(keys) if key not in existing]
+                slots = self._allocate_slots(conn, len(new))
+                conn.executemany('INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)',
+                                 [(keys[i], slot, now) for slot, i in zip(slots, new)])
+
+                for slot, i in zip(slots, new):
+                    vectors[slot] = embeddings[i]
+                vectors.flush()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def statistics(self) -> Dict:
+        """عدادات الإصابة والإخفاق وحجم الذاكرة"""
+        with self._lock:
+            entries = self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': entries,
+                'max_entries': self.max_entries
+            }
+
+    def close(self):
+        """إغلاق الملفات"""
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._vectors = None
+            if self._conn is not None:
+                self._flush_touched(self._conn)
+                self._conn.close()
+                self._conn = None
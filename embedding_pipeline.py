@@ -0,0 +1,142 @@
+"""
+embedding_pipeline.py - خط تضمين متدفق على دفعات (قراءة/تقسيم ← تضمين متعدد العمليات ← كتابة)
+"""
+
+import queue
+import threading
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+# عنصر في خط المعالجة: (معرف الجزء، النص، البيانات الوصفية)
+ChunkItem = Tuple[int, str, Dict]
+
+_END = object()
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """تجميع العناصر في دفعات ثابتة الحجم"""
+    iterator = iter(items)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def _prefetch(batches: Iterator[List], depth: int) -> Iterator[List]:
+    """قراءة الدفعات التالية في خيط منفصل أثناء تضمين الدفعة الحالية
+
+    إذا توقف المستهلك (خطأ في الكتابة مثلاً) يُطلب من القارئ التوقف ويُفرغ الطابور،
+    فلا يبقى الخيط معلقاً على طابور ممتلئ.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            put(_END)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            batch = buffer.get()
+            if batch is _END:
+                break
+            yield batch
+    finally:
+        stop.set()
+        # تحرير القارئ إن كان ينتظر مكاناً في الطابور
+        while thread.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+class EmbeddingPipeline:
+    """تضمين متدفق: الذاكرة محدودة بحجم الدفعة والسرعة تتوسع مع عدد الأنوية"""
+
+    def __init__(self, model, batch_size: int = 64, workers: int = 1,
+                 write_batch_size: int = 10000, prefetch: int = 2, cache=None):
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.workers = workers
+        self.write_batch_size = write_batch_size
+        self.prefetch = prefetch
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            # مجموعة عمليات sentence-transformers على المعالج
+            self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+        return False
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """تضمين دفعة نصوص مع تخطي النصوص الموجودة في ذاكرة التضمينات"""
+        if self.cache is not None:
+            return self.cache.encode(texts, self._encode_uncached)
+        return self._encode_uncached(texts)
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        """تضمين دفعة نصوص (بالتوازي إذا كانت مجموعة العمليات مفعلة)"""
+        if self._pool is not None:
+            embeddings = self.model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+        else:
+            embeddings = self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+        return np.ascontiguousarray(embeddings, dtype='float32')
+
+    def run(self, chunks: Iterable[ChunkItem],
+            writer: Callable[[np.ndarray, List[str], List[Dict], np.ndarray], None]) -> int:
+        """تمرير الأجزاء عبر التضمين إلى دالة الكتابة دفعة بعد دفعة
+
+        writer(ids, texts, metas, embeddings) تُستدعى لكل دفعة كتابة.
+        """
+        total = 0
+        batches = batched(chunks, self.write_batch_size)
+
+        prefetched = _prefetch(batches, self.prefetch)
+        try:
+            for batch in prefetched:
+                ids = np.asarray([item[0] for item in batch], dtype='int64')
+                texts = [item[1] for item in batch]
+                metas = [item[2] for item in batch]
+
+                writer(ids, texts, metas, self.encode(texts))
+
+                total += len(batch)
+                print(f"  🔢 تم تضمين {total} جزء")
+        finally:
+            # عند خطأ في الكتابة يتوقف خيط القراءة فوراً
+            prefetched.close()
+
+        return total
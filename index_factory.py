@@ -0,0 +1,261 @@
+"""
+index_factory.py - إنشاء فهارس FAISS التقريبية (IVF / HNSW / PQ) وقياس دقتها
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+
+# أنواع الفهارس المدعومة
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq8", "fp16", "pq")
+
+# أنواع تخزن المتجهات مضغوطة (تستفيد من إعادة الحساب الدقيق على المتجهات الأصلية)
+QUANTIZED_TYPES = ("ivf_pq", "sq8", "fp16", "pq")
+
+# أقل عدد نقاط تدريب لكل مركز IVF حسب توصية FAISS
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _pq_segments(dim: int, pq_m: int) -> int:
+    """أكبر عدد مقاطع PQ لا يتجاوز pq_m ويقسم الأبعاد"""
+    for m in range(min(pq_m, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def unwrap_index(index: faiss.Index) -> faiss.Index:
+    """الفهرس الداخلي إذا كان الفهرس مغلفاً بـ IndexIDMap"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def training_size(index_type: str, nlist: int = 1024, pq_bits: int = 8,
+                  train_sample: int = 100000) -> int:
+    """عدد المتجهات الذي يكفي لتدريب الفهرس (0 للفهارس التي لا تحتاج تدريباً)"""
+    if index_type in ("flat", "hnsw"):
+        return 0
+    # مدى كل بُعد في التكميم القياسي
+    needed = 256 * MIN_POINTS_PER_CENTROID
+    if index_type in ("ivf_flat", "ivf_pq"):
+        needed = nlist * MIN_POINTS_PER_CENTROID
+    if index_type in ("ivf_pq", "pq"):
+        needed = max(needed, (1 << pq_bits) * MIN_POINTS_PER_CENTROID)
+    return min(needed, train_sample)
+
+
+def create_index(dim: int, sample: np.ndarray, index_type: str = "flat",
+                 nlist: int = 1024, hnsw_m: int = 32, pq_m: int = 48,
+                 pq_bits: int = 8, train_sample: int = 100000) -> faiss.Index:
+    """إنشاء فهرس من النوع المطلوب وتدريبه على عينة من المتجهات
+
+    يعود إلى فهرس مسطح إذا كانت العينة أصغر من أن تدرب الفهرس.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"نوع فهرس غير مدعوم: {index_type} (المتاح: {', '.join(INDEX_TYPES)})")
+
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+
+    if index_type == "hnsw":
+        return faiss.IndexHNSWFlat(dim, hnsw_m)
+
+    sample = np.ascontiguousarray(sample, dtype='float32')
+    if len(sample) > train_sample:
+        rng = np.random.default_rng(0)
+        sample = sample[rng.choice(len(sample), train_sample, replace=False)]
+
+    # تكميم قياسي: بايت واحد (sq8) أو نصف float (fp16) لكل بُعد
+    if index_type in ("sq8", "fp16"):
+        qtype = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2)
+        index.train(sample)
+        return index
+
+    # تكميم المنتج دون IVF: pq_m بايت لكل متجه مع بحث شامل على الرموز
+    if index_type == "pq":
+        if len(sample) < (1 << pq_bits):
+            print(f"⚠️ عينة التدريب صغيرة ({len(sample)} متجه)، سيتم استخدام فهرس مسطح")
+            return faiss.IndexFlatL2(dim)
+        index = faiss.IndexPQ(dim, _pq_segments(dim, pq_m), pq_bits)
+        index.train(sample)
+        return index
+
+    # تقليل عدد المراكز للمجموعات الصغيرة
+    nlist = min(nlist, len(sample) // MIN_POINTS_PER_CENTROID)
+    if index_type == "ivf_pq" and len(sample) < (1 << pq_bits):
+        nlist = 0
+
+    if nlist < 1:
+        print(f"⚠️ عينة التدريب صغيرة ({len(sample)} متجه)، سيتم استخدام فهرس مسطح")
+        return faiss.IndexFlatL2(dim)
+
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_segments(dim, pq_m), pq_bits)
+
+    index.train(sample)
+    return index
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None):
+    """ضبط معاملات البحث وقت التشغيل (nprobe لـ IVF و efSearch لـ HNSW)"""
+    inner = unwrap_index(index)
+
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(nprobe, inner.nlist)
+
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None,
+                  ef_search: Optional[int] = None) -> Optional[faiss.SearchParameters]:
+    """معاملات بحث لاستدعاء واحد (لا تغير حالة الفهرس المشتركة بين الخيوط)"""
+    inner = unwrap_index(index)
+
+    if nprobe is not None and isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=min(nprobe, inner.nlist))
+
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+
+    return None
+
+
+def describe_index(index: Optional[faiss.Index]) -> str:
+    """وصف مختصر لنوع الفهرس ومعاملاته"""
+    if index is None:
+        return 'غير محمل'
+
+    inner = unwrap_index(index)
+
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return f"FAISS IVF{inner.nlist},PQ{inner.pq.M}x{inner.pq.nbits} (nprobe={inner.nprobe})"
+    if isinstance(inner, faiss.IndexIVFFlat):
+        return f"FAISS IVF{inner.nlist},Flat (nprobe={inner.nprobe})"
+    if isinstance(inner, faiss.IndexHNSW):
+        return f"FAISS HNSW (efSearch={inner.hnsw.efSearch})"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        qtype = "SQ8" if inner.sq.qtype == faiss.ScalarQuantizer.QT_8bit else "SQfp16"
+        return f"FAISS {qtype}"
+    if isinstance(inner, faiss.IndexPQ):
+        return f"FAISS PQ{inner.pq.M}x{inner.pq.nbits}"
+    if isinstance(inner, faiss.IndexFlatL2):
+        return 'FAISS FlatL2'
+
+    return f"FAISS {type(inner).__name__}"
+
+
+def index_vectors(index: faiss.Index) -> np.ndarray:
+    """استرجاع المتجهات المخزنة في الفهرس (تقريبية في حالة PQ)"""
+    inner = unwrap_index(index)
+
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map()
+
+    return inner.reconstruct_n(0, inner.ntotal)
+
+
+def is_quantized(index: Optional[faiss.Index]) -> bool:
+    """هل يخزن الفهرس المتجهات مضغوطة (فتكون مسافاته تقريبية)"""
+    if index is None:
+        return False
+    return isinstance(unwrap_index(index), (faiss.IndexScalarQuantizer, faiss.IndexPQ, faiss.IndexIVFPQ))
+
+
+def rescore(vectors: np.ndarray, query: np.ndarray, ids: np.ndarray,
+            top_k: int) -> tuple:
+    """إعادة حساب المسافات الدقيقة للمرشحين من المتجهات الأصلية وإعادة ترتيبهم
+
+    vectors: متجهات المرشحين الأصلية بنفس ترتيب ids.
+    """
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind='stable')[:top_k]
+    return distances[order].astype('float32'), ids[order]
+
+
+def evaluate_index_modes(embeddings: np.ndarray, queries: np.ndarray,
+                         modes: List[str], top_k: int = 10,
+                         nprobe: int = 16, ef_search: int = 64,
+                         rescore_factor: int = 1, **params) -> List[Dict]:
+    """مقارنة الدقة (recall@k) وزمن الاستعلام لكل نوع فهرس مقابل الفهرس المسطح
+
+    مع rescore_factor > 1 تُقاس أيضاً الدقة بعد إعادة حساب أفضل top_k × rescore_factor
+    مرشح من المتجهات الأصلية (recall_at_k_rescored).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    dim = embeddings.shape[1]
+
+    # النتائج الدقيقة كمرجع
+    baseline = faiss.IndexFlatL2(dim)
+    baseline.add(embeddings)
+    _, truth = baseline.search(queries, top_k)
+
+    report = []
+    for mode in modes:
+        build_start = time.perf_counter()
+        index = create_index(dim, embeddings, mode, **params)
+        index.add(embeddings)
+        build_time = time.perf_counter() - build_start
+
+        set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+        search_start = time.perf_counter()
+        _, found = index.search(queries, top_k)
+        search_time = time.perf_counter() - search_start
+
+        hits = sum(len(set(found[i]) & set(truth[i])) for i in range(len(queries)))
+
+        row = {
+            'mode': mode,
+            'index_type': describe_index(index),
+            'recall_at_k': hits / float(len(queries) * top_k),
+            'latency_ms': search_time * 1000 / len(queries),
+            'build_seconds': build_time,
+            'size_mb': len(faiss.serialize_index(index)) / (1024 * 1024)
+        }
+
+        if rescore_factor > 1:
+            _, candidates = index.search(queries, top_k * rescore_factor)
+            hits = 0
+            for i in range(len(queries)):
+                valid = candidates[i][candidates[i] >= 0]
+                _, rescored = rescore(embeddings[valid], queries[i], valid, top_k)
+                hits += len(set(rescored) & set(truth[i]))
+            row['recall_at_k_rescored'] = hits / float(len(queries) * top_k)
+
+        report.append(row)
+
+    return report
+
+
+def write_quality_report(path: str, vectors: np.ndarray, modes: List[str], top_k: int = 10,
+                         num_queries: int = 200, rescore_factor: int = 1, **params) -> List[Dict]:
+    """حفظ مقارنة الحجم والدقة لكل نوع فهرس على عينة من المتجهات الأصلية
+
+    bytes_per_vector يسمح بتقدير حجم كل نوع للمجموعة كاملة.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False)]
+
+    report = evaluate_index_modes(vectors, queries, modes, top_k=top_k,
+                                  rescore_factor=rescore_factor, **params)
+    for row in report:
+        row['bytes_per_vector'] = row['size_mb'] * 1024 * 1024 / len(vectors)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'sample_size': len(vectors), 'top_k': top_k, 'modes': report}, f, indent=2)
+    os.replace(tmp_path, path)
+    return report
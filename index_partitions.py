@@ -0,0 +1,293 @@
+"""
+index_partitions.py - فهارس FAISS مقسمة حسب الدولة
+"""
+
+import json
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from index_factory import (create_index, describe_index, index_vectors, is_quantized,
+                           search_params, set_search_params, training_size, unwrap_index)
+
+# ملف يربط كل دولة بملف الفهرس الفرعي الخاص بها
+PARTITIONS_MANIFEST = "partitions.json"
+
+
+def _slugify(name: str) -> str:
+    """اسم ملف آمن من اسم الدولة"""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_").lower()
+    return slug or "unknown"
+
+
+def _write_index_atomic(index: faiss.Index, path: str):
+    """كتابة الفهرس إلى ملف مؤقت ثم استبدال الملف الأصلي دفعة واحدة"""
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _index_ids(index: faiss.Index) -> np.ndarray:
+    """معرفات المتجهات المخزنة في الفهرس"""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype('int64')
+    return np.arange(index.ntotal, dtype='int64')
+
+
+class PartitionedIndex:
+    """فهرس عام للاستعلامات غير المصفاة مع فهرس فرعي لكل دولة
+
+    الفهارس التي تحتاج تدريباً لا تُنشأ من أول دفعة تصلها: متجهات كل فهرس (العام وكل دولة)
+    تُجمع حتى تبلغ min_train ثم يُدرب عليها، والفهارس التي لم تبلغه تُدرب على كل ما جُمع
+    قبل الحفظ أو البحث.
+    """
+
+    def __init__(self, dim: int, index_type: str = "flat",
+                 index_params: Optional[Dict] = None):
+        self.dim = dim
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.global_index: Optional[faiss.Index] = None
+        self.partitions: Dict[str, faiss.Index] = {}
+        self.min_train = training_size(index_type, **{
+            name: self.index_params[name] for name in ("nlist", "pq_bits", "train_sample")
+            if name in self.index_params
+        })
+        # متجهات بانتظار تدريب فهرسها: None للفهرس العام، وإلا اسم الدولة
+        self._pending: Dict[Optional[str], List[Tuple[np.ndarray, np.ndarray]]] = {}
+
+    @property
+    def ntotal(self) -> int:
+        trained = self.global_index.ntotal if self.global_index is not None else 0
+        return trained + self._pending_count(None)
+
+    def _pending_count(self, key: Optional[str]) -> int:
+        return sum(len(ids) for _, ids in self._pending.get(key, ()))
+
+    @property
+    def supports_removal(self) -> bool:
+        """هل يمكن حذف متجهات بمعرفاتها (HNSW والفهارس القديمة بدون معرفات لا تدعم ذلك)"""
+        indexes = [self.global_index, *self.partitions.values()]
+        return all(
+            isinstance(index, faiss.IndexIDMap) and not isinstance(unwrap_index(index), faiss.IndexHNSW)
+            for index in indexes if index is not None
+        )
+
+    @property
+    def quantized(self) -> bool:
+        """هل الفهرس مضغوط (نتائجه تحتاج إعادة حساب دقيق)"""
+        return is_quantized(self.global_index)
+
+    @property
+    def description(self) -> str:
+        return describe_index(self.global_index)
+
+    def partition_sizes(self) -> Dict[str, int]:
+        """عدد المتجهات في فهرس كل دولة"""
+        sizes = {country: index.ntotal for country, index in self.partitions.items()}
+        for country in self._pending:
+            if country is not None:
+                sizes[country] = sizes.get(country, 0) + self._pending_count(country)
+        return sizes
+
+    def _new_index(self, sample: np.ndarray) -> faiss.Index:
+        """فهرس جديد من النوع المهيأ مدرب على العينة ومغلف بالمعرفات"""
+        return faiss.IndexIDMap(create_index(self.dim, sample, self.index_type, **self.index_params))
+
+    @staticmethod
+    def _add(index: faiss.Index, vectors: np.ndarray, ids: np.ndarray):
+        if isinstance(index, faiss.IndexIDMap):
+            index.add_with_ids(vectors, ids)
+        else:
+            # فهرس قديم بدون معرفات: المعرف هو الترتيب
+            index.add(vectors)
+
+    def _add_or_buffer(self, key: Optional[str], index: Optional[faiss.Index],
+                       vectors: np.ndarray, ids: np.ndarray) -> Optional[faiss.Index]:
+        """الإضافة إلى فهرس مدرب، أو الجمع حتى تكفي العينة لتدريبه"""
+        if index is not None:
+            self._add(index, vectors, ids)
+            return index
+        self._pending.setdefault(key, []).append((vectors, ids))
+        if self._pending_count(key) < self.min_train:
+            return None
+        return self._train_pending(key)
+
+    def _train_pending(self, key: Optional[str]) -> faiss.Index:
+        pending = self._pending.pop(key)
+        vectors = np.ascontiguousarray(np.concatenate([vectors for vectors, _ in pending]))
+        ids = np.concatenate([ids for _, ids in pending])
+        index = self._new_index(vectors)
+        self._add(index, vectors, ids)
+        return index
+
+    def train_pending(self):
+        """تدريب الفهارس التي لم تبلغ عينتها min_train على كل ما جُمع لها"""
+        for key in list(self._pending):
+            index = self._train_pending(key)
+            if key is None:
+                self.global_index = index
+            else:
+                self.partitions[key] = index
+
+    def add(self, embeddings: np.ndarray, countries: List[str],
+            ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """إضافة متجهات إلى الفهرس العام وإلى فهرس دولة كل متجه"""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+
+        if ids is None:
+            ids = np.arange(self.ntotal, self.ntotal + len(embeddings), dtype='int64')
+        ids = np.ascontiguousarray(ids, dtype='int64')
+
+        self.global_index = self._add_or_buffer(None, self.global_index, embeddings, ids)
+
+        countries = np.asarray([c or '' for c in countries], dtype=object)
+        for country in np.unique(countries):
+            mask = countries == country
+            vectors = np.ascontiguousarray(embeddings[mask])
+            partition = self._add_or_buffer(country, self.partitions.get(country), vectors, ids[mask])
+            if partition is not None:
+                self.partitions[country] = partition
+
+        return ids
+
+    def remove(self, ids: np.ndarray) -> int:
+        """حذف متجهات من الفهرس العام ومن فهارس الدول"""
+        ids = np.ascontiguousarray(ids, dtype='int64')
+        if len(ids) == 0:
+            return 0
+
+        # المتجهات التي لم يُدرب فهرسها بعد
+        removed = 0
+        for key in list(self._pending):
+            kept = []
+            for vectors, pending_ids in self._pending.pop(key):
+                keep = ~np.isin(pending_ids, ids)
+                if key is None:
+                    removed += int((~keep).sum())
+                if keep.any():
+                    kept.append((vectors[keep], pending_ids[keep]))
+            if kept:
+                self._pending[key] = kept
+
+        if self.global_index is None:
+            return removed
+
+        removed += self.global_index.remove_ids(ids)
+        for country in list(self.partitions):
+            self.partitions[country].remove_ids(ids)
+            if self.partitions[country].ntotal == 0:
+                del self.partitions[country]
+
+        return removed
+
+    def set_search_params(self, nprobe: Optional[int] = None,
+                          ef_search: Optional[int] = None):
+        """ضبط معاملات البحث الافتراضية لكل الفهارس"""
+        for index in [self.global_index, *self.partitions.values()]:
+            if index is not None:
+                set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+    def search(self, query: np.ndarray, top_k: int,
+               country: Optional[str] = None,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """بحث في فهرس الدولة إذا حُددت، وإلا في الفهرس العام
+
+        البحث لا يغير الفهرس (آمن بين الخيوط): المتجهات بانتظار التدريب لا تظهر فيه حتى
+        save() أو train_pending()، ومعاملات الاستعلام تُمرر إلى FAISS لهذا الاستدعاء فقط.
+        """
+        query = np.ascontiguousarray(query, dtype='float32')
+        index = self.partitions.get(country) if country else self.global_index
+        k = min(top_k, index.ntotal) if index is not None else 0
+
+        if k <= 0:
+            return (np.empty((len(query), 0), dtype='float32'),
+                    np.empty((len(query), 0), dtype='int64'))
+
+        params = search_params(index, nprobe=nprobe, ef_search=ef_search)
+        if params is None:
+            return index.search(query, k)
+        return index.search(query, k, params=params)
+
+    def rebuild_partitions(self, countries: Dict[int, str]):
+        """إعادة بناء فهارس الدول من الفهرس العام (للفهارس القديمة)"""
+        self.partitions = {}
+        if self.ntotal == 0:
+            return
+
+        vectors = index_vectors(self.global_index)
+        ids = _index_ids(self.global_index)
+        country_of = np.asarray([countries.get(int(i), '') for i in ids], dtype=object)
+
+        for country in np.unique(country_of):
+            mask = country_of == country
+            country_vectors = np.ascontiguousarray(vectors[mask])
+            partition = self._new_index(country_vectors)
+            partition.add_with_ids(country_vectors, ids[mask])
+            self.partitions[country] = partition
+
+    def save(self, index_path: str, partitions_dir: str):
+        """حفظ الفهرس العام وفهارس الدول مع ملف الربط"""
+        self.train_pending()
+        if self.global_index is None:
+            return
+
+        os.makedirs(partitions_dir, exist_ok=True)
+        manifest = {}
+        for i, country in enumerate(sorted(self.partitions)):
+            filename = f"{i:03d}_{_slugify(country)}.index"
+            _write_index_atomic(self.partitions[country], os.path.join(partitions_dir, filename))
+            manifest[country] = filename
+
+        manifest_path = os.path.join(partitions_dir, PARTITIONS_MANIFEST)
+        with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+        # الفهرس العام آخراً: وجوده يعني اكتمال فهارس الدول
+        _write_index_atomic(self.global_index, index_path)
+
+        # حذف ملفات الدول التي لم تعد في الفهرس
+        for filename in os.listdir(partitions_dir):
+            if filename.endswith(".index") and filename not in manifest.values():
+                os.remove(os.path.join(partitions_dir, filename))
+
+    @classmethod
+    def load(cls, index_path: str, partitions_dir: str,
+             countries_loader: Optional[Callable[[], Dict[int, str]]] = None,
+             index_type: str = "flat",
+             index_params: Optional[Dict] = None,
+             io_flags: int = 0) -> "PartitionedIndex":
+        """تحميل الفهرس العام وفهارس الدول، أو بناؤها إذا لم تكن محفوظة
+
+        io_flags تُمرر إلى faiss.read_index (مثل IO_FLAG_MMAP للقراءة فقط).
+        """
+        def read(path: str) -> faiss.Index:
+            try:
+                return faiss.read_index(path, io_flags)
+            except RuntimeError:
+                if not io_flags:
+                    raise
+                # بعض أنواع الفهارس لا تدعم الربط بالذاكرة
+                return faiss.read_index(path)
+
+        global_index = read(index_path)
+
+        partitioned = cls(global_index.d, index_type, index_params)
+        partitioned.global_index = global_index
+
+        manifest_path = os.path.join(partitions_dir, PARTITIONS_MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+            for country, filename in manifest.items():
+                partitioned.partitions[country] = read(os.path.join(partitions_dir, filename))
+        elif countries_loader is not None:
+            partitioned.rebuild_partitions(countries_loader())
+
+        return partitioned
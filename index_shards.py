@@ -0,0 +1,224 @@
+"""
+index_shards.py - تقسيم فهرس FAISS إلى عدة أجزاء (حسب الدولة أو المعرف) يُخدم كل منها من عملية مستقلة
+"""
+
+import json
+import os
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from index_partitions import PartitionedIndex
+from snapshots import Snapshot
+
+# وصف الأجزاء (العدد وطريقة التوزيع وعدد المتجهات لكل دولة في كل جزء)
+SHARDS_MANIFEST = "shards.json"
+SHARD_BY = ("country", "hash")
+
+
+def shard_path(shards_dir: str, shard: int) -> str:
+    """مجلد جزء واحد: faiss.index + partitions/"""
+    return os.path.join(shards_dir, f"{shard:03d}")
+
+
+def country_shard(country: str, num_shards: int) -> int:
+    """جزء الدولة (ثابت بين العمليات وبين التشغيلات بخلاف hash())"""
+    return zlib.crc32((country or '').encode('utf-8')) % num_shards
+
+
+def route(ids: np.ndarray, countries: List[str], num_shards: int, shard_by: str) -> np.ndarray:
+    """رقم الجزء لكل متجه"""
+    if shard_by == "country":
+        return np.asarray([country_shard(country, num_shards) for country in countries], dtype='int64')
+    # المعرفات متتالية فباقي القسمة يوزعها على الأجزاء بالتساوي
+    return np.asarray(ids, dtype='int64') % num_shards
+
+
+def target_shards(layout: Dict, country: Optional[str] = None) -> List[int]:
+    """الأجزاء التي يلزم البحث فيها: الأجزاء غير الفارغة، أو التي فيها الدولة المطلوبة فقط
+
+    عند التوزيع حسب الدولة يكون ذلك جزءاً واحداً.
+    """
+    return [i for i, shard in enumerate(layout["shards"])
+            if (shard["partitions"].get(country) if country else shard["ntotal"])]
+
+
+def merge_results(results: List[Tuple[np.ndarray, np.ndarray]], num_queries: int,
+                  top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """دمج نتائج الأجزاء: أفضل top_k مسافة لكل استعلام"""
+    results = [(distances, ids) for distances, ids in results if ids.shape[1]]
+    if not results:
+        return (np.empty((num_queries, 0), dtype='float32'),
+                np.empty((num_queries, 0), dtype='int64'))
+
+    distances = np.concatenate([distances for distances, _ in results], axis=1)
+    ids = np.concatenate([ids for _, ids in results], axis=1)
+    distances = np.where(ids >= 0, distances, np.inf)
+
+    k = min(top_k, ids.shape[1])
+    order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    distances = np.take_along_axis(distances, order, axis=1)
+    ids = np.take_along_axis(ids, order, axis=1)
+    ids[np.isinf(distances)] = -1
+    return distances.astype('float32'), ids
+
+
+def read_layout(shards_dir: str) -> Dict:
+    with open(os.path.join(shards_dir, SHARDS_MANIFEST), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_shard(shards_dir: str, shard: int, layout: Optional[Dict] = None,
+               index_params: Optional[Dict] = None, io_flags: int = 0) -> PartitionedIndex:
+    """تحميل جزء واحد (فارغ إذا لم تقع فيه أي متجهات)"""
+    layout = layout or read_layout(shards_dir)
+    path = shard_path(shards_dir, shard)
+    index_path = os.path.join(path, "faiss.index")
+    if not os.path.exists(index_path):
+        return PartitionedIndex(layout["dim"], layout["index_type"], index_params)
+    return PartitionedIndex.load(index_path, os.path.join(path, "partitions"),
+                                 index_type=layout["index_type"], index_params=index_params,
+                                 io_flags=io_flags)
+
+
+class ShardedIndex:
+    """عدة فهارس PartitionedIndex بنفس واجهة البحث والإضافة والحذف
+
+    عند البحث داخل العملية نفسها يُبحث في كل جزء ثم تُدمج النتائج؛ في وضع الخوادم
+    يُحمّل كل جزء في عملية مستقلة (shard_service.py) ولا تحمل عملية البحث أي متجهات.
+    """
+
+    def __init__(self, num_shards: int, shard_by: str = "country", dim: int = 0,
+                 index_type: str = "flat", index_params: Optional[Dict] = None):
+        if shard_by not in SHARD_BY:
+            raise ValueError(f"طريقة تقسيم غير معروفة: {shard_by}")
+        self.shard_by = shard_by
+        self.index_type = index_type
+        self.shards = [PartitionedIndex(dim, index_type, index_params) for _ in range(num_shards)]
+
+    @property
+    def dim(self) -> int:
+        return self.shards[0].dim
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards)
+
+    @property
+    def supports_removal(self) -> bool:
+        return all(shard.supports_removal for shard in self.shards)
+
+    @property
+    def quantized(self) -> bool:
+        """حسب الفهارس المبنية فعلاً (العينات الصغيرة تُبنى فهارس مسطحة مهما كان النوع المطلوب)"""
+        return any(shard.quantized for shard in self.shards)
+
+    @property
+    def description(self) -> str:
+        described = [shard.description for shard in self.shards if shard.global_index is not None]
+        return f"{described[0] if described else self.index_type} × {len(self.shards)} أجزاء"
+
+    def partition_sizes(self) -> Dict[str, int]:
+        sizes: Dict[str, int] = {}
+        for shard in self.shards:
+            for country, count in shard.partition_sizes().items():
+                sizes[country] = sizes.get(country, 0) + count
+        return sizes
+
+    def layout(self) -> Dict:
+        """وصف الأجزاء الذي يكفي عملية البحث لتوجيه الاستعلامات دون تحميلها"""
+        return {
+            "count": len(self.shards),
+            "by": self.shard_by,
+            "dim": self.dim,
+            "index_type": self.index_type,
+            "description": self.description,
+            "quantized": self.quantized,
+            "shards": [{"ntotal": shard.ntotal, "partitions": shard.partition_sizes()}
+                       for shard in self.shards]
+        }
+
+    def add(self, embeddings: np.ndarray, countries: List[str],
+            ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """إضافة كل متجه إلى جزئه"""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        if ids is None:
+            ids = np.arange(self.ntotal, self.ntotal + len(embeddings), dtype='int64')
+        ids = np.ascontiguousarray(ids, dtype='int64')
+
+        shard_of = route(ids, countries, len(self.shards), self.shard_by)
+        countries = np.asarray([c or '' for c in countries], dtype=object)
+        for shard in np.unique(shard_of):
+            mask = shard_of == shard
+            self.shards[shard].add(embeddings[mask], countries[mask].tolist(), ids=ids[mask])
+
+        return ids
+
+    def remove(self, ids: np.ndarray) -> int:
+        return sum(shard.remove(ids) for shard in self.shards)
+
+    def set_search_params(self, nprobe: Optional[int] = None,
+                          ef_search: Optional[int] = None):
+        for shard in self.shards:
+            shard.set_search_params(nprobe=nprobe, ef_search=ef_search)
+
+    def search(self, query: np.ndarray, top_k: int,
+               country: Optional[str] = None,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.ascontiguousarray(query, dtype='float32')
+        results = [self.shards[shard].search(query, top_k, country, nprobe=nprobe, ef_search=ef_search)
+                   for shard in target_shards(self.layout(), country)]
+        return merge_results(results, len(query), top_k)
+
+    def save(self, shards_dir: str):
+        """حفظ كل جزء في مجلده ثم ملف الوصف"""
+        os.makedirs(shards_dir, exist_ok=True)
+        for i, shard in enumerate(self.shards):
+            path = shard_path(shards_dir, i)
+            os.makedirs(path, exist_ok=True)
+            shard.save(os.path.join(path, "faiss.index"), os.path.join(path, "partitions"))
+
+        manifest_path = os.path.join(shards_dir, SHARDS_MANIFEST)
+        with open(manifest_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.layout(), f, ensure_ascii=False, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    @classmethod
+    def load(cls, shards_dir: str, index_params: Optional[Dict] = None,
+             io_flags: int = 0) -> "ShardedIndex":
+        layout = read_layout(shards_dir)
+        sharded = cls(layout["count"], layout["by"], layout["dim"], layout["index_type"], index_params)
+        sharded.shards = [load_shard(shards_dir, i, layout, index_params, io_flags)
+                          for i in range(layout["count"])]
+        return sharded
+
+
+def create_snapshot_index(dim: int, index_type: str = "flat", index_params: Optional[Dict] = None,
+                          shards: int = 1, shard_by: str = "country") -> Union[PartitionedIndex, ShardedIndex]:
+    """فهرس جديد فارغ: مقسم إذا طُلب أكثر من جزء"""
+    if shards > 1:
+        return ShardedIndex(shards, shard_by, dim, index_type, index_params)
+    return PartitionedIndex(dim, index_type, index_params)
+
+
+def load_snapshot_index(snapshot: Snapshot,
+                        countries_loader: Optional[Callable[[], Dict[int, str]]] = None,
+                        index_type: str = "flat", index_params: Optional[Dict] = None,
+                        io_flags: int = 0) -> Union[PartitionedIndex, ShardedIndex]:
+    """تحميل فهرس نسخة منشورة كاملاً في هذه العملية (للتحديث أو للبحث دون خوادم)"""
+    if snapshot.is_sharded:
+        return ShardedIndex.load(snapshot.shards_dir, index_params, io_flags)
+    return PartitionedIndex.load(snapshot.index_path, snapshot.partitions_dir,
+                                 countries_loader=countries_loader,
+                                 index_type=index_type, index_params=index_params,
+                                 io_flags=io_flags)
+
+
+def save_snapshot_index(index: Union[PartitionedIndex, ShardedIndex], snapshot: Snapshot):
+    """حفظ الفهرس في نسخة مؤقتة حسب نوعه"""
+    if isinstance(index, ShardedIndex):
+        index.save(snapshot.shards_dir)
+    else:
+        index.save(snapshot.index_path, snapshot.partitions_dir)
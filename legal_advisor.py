@@ -2,14 +2,26 @@
 legal_advisor.py - المحرك الذكي للتحليل القانوني
 """
 
+import asyncio
 import random
+import threading
 import time
 import json
-from typing import Dict, List, Optional
-import openai  # سيتم استخدامه لكل من DeepSeek وOpenAI
-import google.generativeai as genai
-import requests  # للاتصال المباشر
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+import resources
 from config import Config
+from context_packing import build_context, empty_context, estimate_tokens
+from database import Database
+from provider_health import ProviderHealth
+from response_cache import ResponseCache
+from retrieval_engine import RetrievalEngine
+from llm_providers import (ClientPool, GeminiProvider, LLMProvider, OpenAICompatibleProvider,
+                           complete, iterate_async, iterate_sync, run_async, run_sync,
+                           stream_failover)
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000.0
 
 class LegalAdvisor:
     """محامي ذكي متعدد المصادر مع نظام ترشيح ذكي"""
@@ -17,88 +29,87 @@ class LegalAdvisor:
     def __init__(self):
         self.api_keys = Config.API_KEYS
         self.fallback_order = ["deepseek", "openai", "gemini"]  # إزالة Groq مؤقتاً
+        # hedged: المزود التالي يبدأ إذا لم يجب السابق خلال hedge_delay؛ sequential: واحد بعد الآخر
+        self.mode = Config.LLM_MODE
+        self.hedge_delay = Config.LLM_HEDGE_DELAY
+        # عملاء مشتركون بين الجلسات بدلاً من إنشاء عميل واتصال TLS جديد لكل استشارة
+        self.clients = ClientPool(max_connections=Config.LLM_MAX_CONNECTIONS,
+                                  max_keepalive=Config.LLM_KEEPALIVE_CONNECTIONS)
         self.request_history = []
+        # قاعدة البيانات: حالة المزودين وسجل الطلبات مع مقاييسها
+        self.store = self._open_store()
+        # إحصاءات كل مزود وقاطع الدائرة (تُحفظ في قاعدة البيانات وتعرضها لوحة التحكم)
+        self.health = ProviderHealth(window=Config.LLM_HEALTH_WINDOW,
+                                     window_seconds=Config.LLM_HEALTH_WINDOW_SECONDS,
+                                     failure_threshold=Config.LLM_BREAKER_FAILURES,
+                                     cooldown=Config.LLM_BREAKER_COOLDOWN,
+                                     max_cooldown=Config.LLM_BREAKER_MAX_COOLDOWN,
+                                     store=self.store,
+                                     save_interval=Config.LLM_HEALTH_SAVE_INTERVAL)
+        # ردود سابقة لنفس السؤال أو سؤال مشابه في نفس الدولة والمؤسسات (None = معطلة)
+        self.cache = ResponseCache(
+            Config.RESPONSE_CACHE_PATH, self._encode,
+            threshold=Config.RESPONSE_CACHE_THRESHOLD,
+            ttl=Config.RESPONSE_CACHE_TTL,
+            max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+            semantic=Config.RESPONSE_CACHE_SEMANTIC
+        ) if Config.RESPONSE_CACHE_ENABLED else None
+        # محرك البحث في القوانين المفهرسة (يُنشأ عند أول طلب)
+        self._engine: Optional[RetrievalEngine] = None
+        self._engine_lock = threading.Lock()
+    
+    def _encode(self, texts: List[str]):
+        """تضمين الأسئلة بنموذج الفهرسة المشترك وذاكرة تضميناته"""
+        model = resources.get_embedding_model()
+        return resources.get_embedding_cache().encode(
+            texts, lambda batch: model.encode(batch, convert_to_numpy=True))
     
-    def _get_deepseek_response(self, prompt: str) -> Optional[str]:
-        """استخدام DeepSeek API"""
+    def _open_store(self) -> Optional[Database]:
         try:
-            if not self.api_keys.get("deepseek"):
-                return None
-                
-            client = openai.OpenAI(
-                api_key=self.api_keys["deepseek"],
-                base_url="https://api.deepseek.com"
-            )
-            
-            response = client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": """أنت محامٍ دولي خبير بجميع القوانين المحلية والدولية. 
-                        قدم إجابات دقيقة وعملية ومباشرة."""
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=4000
-            )
-            
-            return response.choices[0].message.content
-            
+            return Database()
         except Exception as e:
-            print(f"DeepSeek Error: {e}")
+            print(f"⚠️ لن تُحفظ إحصاءات المزودين والطلبات: {e}")
             return None
     
-    def _get_openai_response(self, prompt: str) -> Optional[str]:
-        """استخدام OpenAI API"""
-        try:
-            if not self.api_keys.get("openai"):
-                return None
-                
-            client = openai.OpenAI(api_key=self.api_keys["openai"])
-            
-            response = client.chat.completions.create(
+    def _create_provider(self, name: str) -> Optional[LLMProvider]:
+        """إنشاء مزود بمهلته وعنوانه (None إذا لم يتوفر مفتاحه)"""
+        api_key = self.api_keys.get(name)
+        if not api_key:
+            return None
+        
+        timeout = Config.LLM_TIMEOUTS.get(name, 30.0)
+        base_url = Config.LLM_BASE_URLS.get(name)
+        
+        if name == "deepseek":
+            return OpenAICompatibleProvider(
+                "deepseek", "DeepSeek", self.clients, api_key,
+                model="deepseek-chat",
+                system_prompt="""أنت محامٍ دولي خبير بجميع القوانين المحلية والدولية. 
+                        قدم إجابات دقيقة وعملية ومباشرة.""",
+                base_url=base_url,
+                max_tokens=4000,
+                timeout=timeout
+            )
+        if name == "openai":
+            return OpenAICompatibleProvider(
+                "openai", "OpenAI", self.clients, api_key,
                 model="gpt-3.5-turbo",  # استخدام إصدار أرخص وأسرع
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "أنت مستشار قانوني ذكي. قدم حلولاً عملية وقابلة للتنفيذ."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=3000
+                system_prompt="أنت مستشار قانوني ذكي. قدم حلولاً عملية وقابلة للتنفيذ.",
+                base_url=base_url,
+                max_tokens=3000,
+                timeout=timeout
             )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            print(f"OpenAI Error: {e}")
-            return None
+        if name == "gemini":
+            return GeminiProvider("gemini", "Gemini", self.clients, api_key, model="gemini-pro",
+                                  api_endpoint=base_url, max_tokens=4000, timeout=timeout)
+        return None
     
-    def _get_gemini_response(self, prompt: str) -> Optional[str]:
-        """استخدام Gemini API"""
-        try:
-            if not self.api_keys.get("gemini"):
-                return None
-                
-            genai.configure(api_key=self.api_keys["gemini"])
-            model = genai.GenerativeModel('gemini-pro')
-            
-            response = model.generate_content(
-                f"بصفة محامٍ خبير: {prompt}",
-                generation_config={
-                    "temperature": 0.7,
-                    "max_output_tokens": 4000,
-                }
-            )
-            
-            return response.text if response else None
-            
-        except Exception as e:
-            print(f"Gemini Error: {e}")
-            return None
+    def _providers(self) -> List[LLMProvider]:
+        """المزودون المتاحون: الأسرع حالياً أولاً، دون المزودين الموقوفين مؤقتاً"""
+        names = [name for name in self.fallback_order if self.api_keys.get(name)]
+        names = self.health.order(names, Config.LLM_TIMEOUTS, by_latency=Config.LLM_ADAPTIVE_ORDER)
+        providers = [self._create_provider(name) for name in names]
+        return [provider for provider in providers if provider is not None]
     
     def _get_fallback_response(self, prompt: str) -> str:
         """استجابة احتياطية بدون API"""
@@ -134,7 +145,76 @@ class LegalAdvisor:
         """
         الحصول على رد ذكي باستخدام أفضل مصدر متاح
         """
+        return run_sync(self._respond(country, issue, institutions, include_international))
+    
+    async def get_intelligent_response_async(self,
+                                             country: str,
+                                             issue: str,
+                                             institutions: List[str],
+                                             include_international: bool = True) -> Dict:
+        """نفس get_intelligent_response للاستدعاء من حلقة أحداث قائمة"""
+        return await run_async(self._respond(country, issue, institutions, include_international))
+    
+    def stream_intelligent_response(self,
+                                    country: str,
+                                    issue: str,
+                                    institutions: List[str],
+                                    include_international: bool = True) -> Iterator[Dict]:
+        """
+        بث الرد أثناء كتابته: أحداث {"type": "delta", "text": ...} ثم {"type": "done", ...}
+        
+        الحدث "reset" يعني أن المزود انقطع أثناء البث وأن الرد يبدأ من جديد من المزود التالي،
+        و"done" يحمل نفس حقول get_intelligent_response.
+        """
+        return iterate_sync(self._stream(country, issue, institutions, include_international))
+    
+    def stream_intelligent_response_async(self,
+                                          country: str,
+                                          issue: str,
+                                          institutions: List[str],
+                                          include_international: bool = True) -> AsyncIterator[Dict]:
+        """نفس stream_intelligent_response للاستهلاك بـ async for من حلقة أحداث قائمة"""
+        return iterate_async(self._stream(country, issue, institutions, include_international))
+    
+    def _retrieval_engine(self) -> RetrievalEngine:
+        with self._engine_lock:
+            if self._engine is None:
+                self._engine = RetrievalEngine()
+            return self._engine
+    
+    def _retrieve(self, country: str, issue: str, metrics: Dict) -> Dict:
+        """نصوص قوانين الدولة الأقرب إلى القضية، دون المكرر وضمن ميزانية الموجه"""
+        if not Config.RAG_ENABLED:
+            return empty_context()
+        start = time.perf_counter()
+        try:
+            passages = self._retrieval_engine().search(issue, country=country, top_k=Config.RAG_TOP_K)
+            return build_context(passages, Config.RAG_CONTEXT_TOKENS, Config.RAG_DEDUP_THRESHOLD)
+        except Exception as e:
+            print(f"⚠️ تعذر استرجاع النصوص القانونية: {e}")
+            return empty_context()
+        finally:
+            metrics["retrieval_ms"] = _elapsed_ms(start)
+    
+    async def _prepare(self, country: str, issue: str, institutions: List[str], metrics: Dict) -> tuple:
+        """(الموجه، المزودون، السياق): الاسترجاع في خيط بالتوازي مع فتح الاتصال بأول المزودين"""
+        providers = self._providers()
+        first = providers[:2] if self.mode == "hedged" else providers[:1]
+        context, *_ = await asyncio.gather(
+            asyncio.to_thread(self._retrieve, country, issue, metrics),
+            *[provider.warm_up() for provider in first],
+            return_exceptions=True
+        )
+        if isinstance(context, BaseException):
+            context = empty_context()
         
+        start = time.perf_counter()
+        prompt = self._build_prompt(country, issue, institutions, context)
+        metrics["prompt_ms"] = _elapsed_ms(start)
+        return prompt, providers, context
+    
+    def _build_prompt(self, country: str, issue: str, institutions: List[str],
+                      context: Optional[Dict] = None) -> str:
         # بناء prompt مبسط
         institutions_text = ", ".join(institutions) if institutions else "لا توجد"
         
@@ -148,33 +228,185 @@ class LegalAdvisor:
         المطلوب: تحليل قانوني مع حلول عملية.
         """
         
-        response = None
-        used_model = "none"
+        # النصوص المسترجعة بعد القضية؛ يستشهد النموذج بأرقامها
+        if context and context["text"]:
+            prompt += f"""
+        النصوص القانونية ذات الصلة من قوانين {country} (استند إليها واذكر رقم النص [n] عند الاستشهاد، ولا تنسب إليها ما ليس فيها):
+        
+{context["text"]}
+        """
+        return prompt
+    
+    def _record(self, mode: str, result: Dict) -> str:
+        """تسجيل المحاولات وإرجاع اسم المزود الناجح"""
+        used_model = result["provider"].label if result["provider"] else "none"
+        
+        self.request_history.append({
+            "time": time.time(),
+            "mode": mode,
+            "used_model": used_model,
+            "attempts": result["attempts"]
+        })
+        del self.request_history[:-100]
+        self.health.record_attempts(result["attempts"])
+        return used_model
+    
+    def _measure(self, metrics: Dict, started: float, used_model: str, result: Optional[Dict] = None,
+                 prompt: str = "", response: Optional[str] = None) -> Dict:
+        """إكمال مقاييس الطلب: الزمن الكلي والرموز والتكلفة التقديرية للمزود الناجح
+        
+        عدد الرموز من رد المزود، أو تقديري إن لم يبلغ عنه (tokens_estimated).
+        """
+        metrics.update(model=used_model, total_ms=_elapsed_ms(started), provider=None,
+                       attempts=len(result["attempts"]) if result else 0,
+                       prompt_tokens=0, completion_tokens=0, tokens_estimated=False, cost_usd=0.0)
+        
+        provider = result["provider"] if result else None
+        if provider is not None and response:
+            usage = next((attempt.get("usage") or {} for attempt in result["attempts"]
+                          if attempt["status"] == "ok"), {})
+            prompt_tokens = usage.get("prompt_tokens")
+            completion_tokens = usage.get("completion_tokens")
+            input_price, output_price = Config.LLM_PRICES.get(provider.name, (0.0, 0.0))
+            metrics.update(
+                provider=provider.name,
+                prompt_tokens=prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+                completion_tokens=(completion_tokens if completion_tokens is not None
+                                   else estimate_tokens(response)),
+                tokens_estimated=prompt_tokens is None or completion_tokens is None
+            )
+            metrics["cost_usd"] = (metrics["prompt_tokens"] * input_price
+                                   + metrics["completion_tokens"] * output_price) / 1_000_000
+        return metrics
+    
+    def record_usage(self, user_id: str, country: str, issue: str, institutions: List[str],
+                     result: Dict):
+        """تسجيل الاستشارة ومقاييسها في جدول الطلبات (تُكتب في الخلفية مع الدفعة التالية)"""
+        if self.store is None:
+            return
+        try:
+            self.store.record_usage(user_id, country, len(issue), institutions, result.get("metrics"))
+        except Exception as e:
+            print(f"⚠️ تعذر تسجيل الطلب: {e}")
+    
+    async def _lookup(self, country: str, issue: str, institutions: List[str]) -> Dict:
+        """البحث في ذاكرة الردود (التضمين وSQLite في خيط منفصل عن حلقة الطلبات)"""
+        if self.cache is not None:
+            try:
+                cached = await asyncio.to_thread(self.cache.lookup, country, institutions, issue)
+                if cached["response"]:
+                    self.request_history.append({
+                        "time": time.time(),
+                        "mode": "cache",
+                        "used_model": cached["response"]["used_model"],
+                        "cache_tier": cached["tier"],
+                        "similarity": cached["similarity"]
+                    })
+                    del self.request_history[:-100]
+                    cached["response"].update(cached=cached["tier"], similarity=cached["similarity"])
+                return cached
+            except Exception as e:
+                print(f"⚠️ ذاكرة الردود غير متاحة: {e}")
+        return {"response": None, "embedding": None}
+    
+    def _remember(self, country: str, issue: str, institutions: List[str],
+                  response: Dict, embedding=None):
+        """حفظ رد المزود في الذاكرة في الخلفية دون تأخير المستخدم"""
+        if self.cache is None:
+            return
         
-        # محاولة المصادر بالترتيب
-        for model_name in self.fallback_order:
-            if response:
-                break
-                
+        def store():
             try:
-                if model_name == "deepseek":
-                    response = self._get_deepseek_response(prompt)
-                    used_model = "DeepSeek"
-                elif model_name == "openai":
-                    response = self._get_openai_response(prompt)
-                    used_model = "OpenAI"
-                elif model_name == "gemini":
-                    response = self._get_gemini_response(prompt)
-                    used_model = "Gemini"
-                    
-            except Exception:
-                continue
+                self.cache.put(country, institutions, issue, response, embedding)
+            except Exception as e:
+                print(f"⚠️ تعذر حفظ الرد في الذاكرة: {e}")
+        
+        asyncio.get_running_loop().run_in_executor(None, store)
+    
+    async def _respond(self, country: str, issue: str, institutions: List[str],
+                       include_international: bool) -> Dict:
+        """بناء الطلب وسؤال المزودين (يعمل في حلقة الأحداث المشتركة مع العملاء)"""
+        started = time.perf_counter()
+        metrics = {"mode": self.mode, "cache": None}
+        cached = await self._lookup(country, issue, institutions)
+        metrics["lookup_ms"] = _elapsed_ms(started)
+        if cached["response"]:
+            metrics["cache"] = cached["tier"]
+            return dict(cached["response"], metrics=self._measure(
+                metrics, started, cached["response"]["used_model"]))
+        
+        prompt, providers, context = await self._prepare(country, issue, institutions, metrics)
+        
+        # محاولة المصادر بالترتيب (أو بالتوازي المتحوط)
+        call_start = time.perf_counter()
+        result = await complete(providers, prompt, mode=self.mode,
+                                hedge_delay=self.hedge_delay)
+        metrics["provider_ms"] = _elapsed_ms(call_start)
+        response = result["text"]
+        used_model = self._record(self.mode, result)
         
         # إذا فشلت جميع المصادر
         if not response:
-            response = self._get_fallback_response(prompt)
-            used_model = "النظام المحلي"
+            return dict(self._format_response(self._get_fallback_response(prompt), "النظام المحلي",
+                                              context["sources"]),
+                        metrics=self._measure(metrics, started, "النظام المحلي", result))
         
+        formatted = self._format_response(response, used_model, context["sources"])
+        self._remember(country, issue, institutions, formatted, cached["embedding"])
+        return dict(formatted, metrics=self._measure(metrics, started, used_model, result,
+                                                     prompt, response))
+    
+    async def _stream(self, country: str, issue: str, institutions: List[str],
+                      include_international: bool) -> AsyncIterator[Dict]:
+        """مثل _respond لكن يمرر أجزاء الرد فور وصولها من المزود"""
+        started = time.perf_counter()
+        metrics = {"mode": f"{self.mode}-stream", "cache": None, "first_token_ms": None}
+        cached = await self._lookup(country, issue, institutions)
+        metrics["lookup_ms"] = _elapsed_ms(started)
+        if cached["response"]:
+            metrics.update(cache=cached["tier"], first_token_ms=metrics["lookup_ms"])
+            yield {"type": "delta", "text": cached["response"]["analysis"], "provider": None}
+            yield {"type": "done", **cached["response"],
+                   "metrics": self._measure(metrics, started, cached["response"]["used_model"])}
+            return
+        
+        prompt, providers, context = await self._prepare(country, issue, institutions, metrics)
+        streamed = False
+        call_start = time.perf_counter()
+        
+        async for event in stream_failover(providers, prompt, mode=self.mode,
+                                           hedge_delay=self.hedge_delay,
+                                           idle_timeout=Config.LLM_STREAM_IDLE_TIMEOUT):
+            if event["type"] != "done":
+                if not streamed:
+                    # أول جزء يراه المستخدم منذ بدء الطلب
+                    metrics["first_token_ms"] = _elapsed_ms(started)
+                streamed = True
+                yield event
+                continue
+            
+            metrics["provider_ms"] = _elapsed_ms(call_start)
+            response = event["text"]
+            used_model = self._record(f"{self.mode}-stream", event)
+            
+            # إذا فشلت جميع المصادر (ربما بعد بث جزء من رد منقطع)
+            if not response:
+                response = self._get_fallback_response(prompt)
+                if streamed:
+                    yield {"type": "reset", "provider": None}
+                yield {"type": "delta", "text": response, "provider": None}
+                yield {"type": "done", **self._format_response(response, "النظام المحلي",
+                                                               context["sources"]),
+                       "metrics": self._measure(metrics, started, "النظام المحلي", event)}
+                return
+            
+            formatted = self._format_response(response, used_model, context["sources"])
+            self._remember(country, issue, institutions, formatted, cached["embedding"])
+            yield {"type": "done", **formatted,
+                   "metrics": self._measure(metrics, started, used_model, event, prompt, response)}
+    
+    def _format_response(self, response: str, used_model: str,
+                         sources: Optional[List[Dict]] = None) -> Dict:
         # تنظيم الاستجابة
         return {
             "analysis": response,
@@ -193,6 +425,7 @@ class LegalAdvisor:
                 "هذا تحليل أولي ولا يغني عن محامٍ مرخص",
                 "تختلف الإجراءات حسب الدولة ونوع القضية"
             ],
+            "sources": sources or [],
             "used_model": used_model,
             "confidence": random.uniform(0.7, 0.9)
         }
@@ -0,0 +1,299 @@
+"""
+lexical_index.py - فهرس BM25 مقلوب مع تطبيع وتجذيع خفيف للنص العربي
+"""
+
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# التشكيل وعلامة المد
+_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+
+_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    # الأرقام العربية الهندية (أرقام المواد مهمة في البحث)
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+})
+
+_TOKEN = re.compile(r"\w+")
+
+# السوابق واللواحق الشائعة (تجذيع خفيف على طريقة Light10)
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال", "و")
+_SUFFIXES = ("ها", "ان", "ات", "ون", "ين", "يه", "ه", "ي")
+
+_STOPWORDS = {
+    "في", "من", "علي", "الي", "عن", "ان", "او", "ما", "لا", "هذا", "هذه", "ذلك",
+    "التي", "الذي", "الذين", "مع", "كان", "قد", "كل", "اي", "هو", "هي", "ثم", "بين",
+}
+
+# ملفات الفهرس داخل مجلده
+_FILES = ("term_offsets", "postings_docs", "postings_tf", "doc_ids", "doc_lengths", "doc_countries")
+
+
+def normalize_arabic(text: str) -> str:
+    """إزالة التشكيل وتوحيد الألف والياء والتاء المربوطة والأرقام"""
+    return _DIACRITICS.sub("", text).translate(_CHAR_MAP).lower()
+
+
+def light_stem(token: str) -> str:
+    """حذف سابقة ولاحقة واحدة على الأكثر مع إبقاء جذع من حرفين على الأقل"""
+    if token.isdigit():
+        return token
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            token = token[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            token = token[:-len(suffix)]
+            break
+    return token
+
+
+def _write_index(index_dir: str, vocab: List[str], countries: List[str], arrays: Dict[str, np.ndarray]):
+    """كتابة المصفوفات ثم القاموس (وجوده يعني اكتمال المصفوفات)"""
+    os.makedirs(index_dir, exist_ok=True)
+    for name, array in arrays.items():
+        path = os.path.join(index_dir, f"{name}.npy")
+        with open(path + ".tmp", 'wb') as f:
+            np.save(f, array)
+        os.replace(path + ".tmp", path)
+
+    vocab_path = os.path.join(index_dir, "vocab.json")
+    with open(vocab_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"terms": vocab, "countries": countries}, f, ensure_ascii=False)
+    os.replace(vocab_path + ".tmp", vocab_path)
+
+
+def tokenize(text: str) -> List[str]:
+    """تقطيع النص إلى مصطلحات مطبعة ومجذعة"""
+    tokens = []
+    for token in _TOKEN.findall(normalize_arabic(text)):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(light_stem(token))
+    return tokens
+
+
+class LexicalIndexBuilder:
+    """تجميع قوائم الظهور أثناء الفهرسة ثم كتابتها بصيغة مضغوطة
+
+    عند التحديث يجمع الأجزاء الجديدة فقط، وتُدمج قوائمها مع فهرس النسخة السابقة عند الحفظ
+    بدلاً من إعادة تقطيع كل النصوص.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._doc_ids: List[int] = []
+        self._doc_lengths: List[int] = []
+        self._doc_countries: List[int] = []
+        self._countries: Dict[str, int] = {}
+
+    def add(self, ids: Iterable[int], texts: Iterable[str], countries: Iterable[str]):
+        """إضافة دفعة أجزاء"""
+        for chunk_id, text, country in zip(ids, texts, countries):
+            position = len(self._doc_ids)
+            terms = Counter(tokenize(text))
+
+            for term, tf in terms.items():
+                self._postings[term].append((position, min(tf, 65535)))
+
+            self._doc_ids.append(int(chunk_id))
+            self._doc_lengths.append(sum(terms.values()))
+            self._doc_countries.append(self._countries.setdefault(country or '', len(self._countries)))
+
+    def save(self, index_dir: str, previous: Optional["LexicalIndex"] = None,
+             exclude: Optional[Iterable[int]] = None):
+        """كتابة الفهرس: قاموس المصطلحات JSON وقوائم الظهور مصفوفات NumPy متجاورة
+
+        previous: فهرس النسخة السابقة تُضاف إليه هذه الأجزاء، بعد حذف أجزاء exclude منه.
+        """
+        if previous is not None:
+            self._save_merged(index_dir, previous, exclude)
+            return
+
+        vocab = sorted(self._postings)
+        offsets = np.zeros(len(vocab) + 1, dtype='int64')
+        for i, term in enumerate(vocab):
+            offsets[i + 1] = offsets[i] + len(self._postings[term])
+
+        docs = np.empty(offsets[-1], dtype='int32')
+        tfs = np.empty(offsets[-1], dtype='uint16')
+        for i, term in enumerate(vocab):
+            postings = np.asarray(self._postings[term], dtype='int64').reshape(-1, 2)
+            docs[offsets[i]:offsets[i + 1]] = postings[:, 0]
+            tfs[offsets[i]:offsets[i + 1]] = postings[:, 1]
+
+        _write_index(index_dir, vocab, list(self._countries), {
+            "term_offsets": offsets,
+            "postings_docs": docs,
+            "postings_tf": tfs,
+            "doc_ids": np.asarray(self._doc_ids, dtype='int64'),
+            "doc_lengths": np.asarray(self._doc_lengths, dtype='int32'),
+            "doc_countries": np.asarray(self._doc_countries, dtype='int32'),
+        })
+
+    def _save_merged(self, index_dir: str, previous: "LexicalIndex",
+                     exclude: Optional[Iterable[int]]):
+        """دمج قوائم الظهور الجديدة مع فهرس سابق بعمليات مصفوفات (بدون تقطيع نصوصه مجدداً)"""
+        # مستندات الفهرس السابق الباقية ومواضعها الجديدة
+        excluded = np.fromiter((int(i) for i in exclude), dtype='int64') if exclude is not None \
+            else np.empty(0, dtype='int64')
+        keep = ~np.isin(previous.doc_ids, excluded)
+        position = np.cumsum(keep) - 1
+        kept = int(keep.sum())
+
+        # الدول: دول الفهرس السابق بترتيبها ثم الدول الجديدة
+        countries = list(previous.countries) + [country for country in self._countries
+                                                if country not in previous.countries]
+        country_ids = {country: i for i, country in enumerate(countries)}
+        new_countries = np.asarray([country_ids[country] for country in self._countries],
+                                   dtype='int32')[np.asarray(self._doc_countries, dtype='int64')] \
+            if self._doc_countries else np.empty(0, dtype='int32')
+
+        vocab = sorted(set(previous.terms) | set(self._postings))
+        term_ids = {term: i for i, term in enumerate(vocab)}
+
+        # قوائم الفهرس السابق بدون المستندات المحذوفة
+        previous_vocab = sorted(previous.terms, key=previous.terms.get)
+        old_offsets = np.asarray(previous.term_offsets, dtype='int64')
+        old_terms = np.repeat(np.asarray([term_ids[term] for term in previous_vocab], dtype='int64'),
+                              np.diff(old_offsets))
+        old_docs = np.asarray(previous.postings_docs, dtype='int64')
+        old_tfs = np.asarray(previous.postings_tf)
+        valid = keep[old_docs]
+        old_terms, old_docs, old_tfs = old_terms[valid], position[old_docs[valid]], old_tfs[valid]
+
+        # قوائم الأجزاء الجديدة بعد مستندات الفهرس السابق
+        new_terms, new_docs, new_tfs = [], [], []
+        for term, postings in self._postings.items():
+            postings = np.asarray(postings, dtype='int64').reshape(-1, 2)
+            new_terms.append(np.full(len(postings), term_ids[term], dtype='int64'))
+            new_docs.append(postings[:, 0] + kept)
+            new_tfs.append(postings[:, 1])
+
+        terms = np.concatenate([old_terms, *new_terms])
+        docs = np.concatenate([old_docs, *new_docs])
+        tfs = np.concatenate([old_tfs.astype('int64'), *new_tfs])
+
+        # ترتيب حسب المصطلح؛ الترتيب المستقر يبقي المستندات تصاعدية داخل كل قائمة
+        order = np.argsort(terms, kind='stable')
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+
+        # المصطلحات التي لم يبق لها ظهور تُحذف من القاموس
+        counts = np.bincount(terms, minlength=len(vocab))
+        present = counts > 0
+        vocab = [term for term, found in zip(vocab, present) if found]
+        offsets = np.zeros(len(vocab) + 1, dtype='int64')
+        offsets[1:] = np.cumsum(counts[present])
+
+        _write_index(index_dir, vocab, countries, {
+            "term_offsets": offsets,
+            "postings_docs": docs.astype('int32'),
+            "postings_tf": tfs.astype('uint16'),
+            "doc_ids": np.concatenate([np.asarray(previous.doc_ids, dtype='int64')[keep],
+                                       np.asarray(self._doc_ids, dtype='int64')]),
+            "doc_lengths": np.concatenate([np.asarray(previous.doc_lengths, dtype='int32')[keep],
+                                           np.asarray(self._doc_lengths, dtype='int32')]),
+            "doc_countries": np.concatenate([np.asarray(previous.doc_countries, dtype='int32')[keep],
+                                             new_countries]),
+        })
+
+
+class LexicalIndex:
+    """بحث BM25 على قوائم ظهور مربوطة بالذاكرة"""
+
+    def __init__(self, index_dir: str, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        with open(os.path.join(index_dir, "vocab.json"), 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+        self.terms = {term: i for i, term in enumerate(vocab["terms"])}
+        self.countries = {country: i for i, country in enumerate(vocab["countries"])}
+
+        arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r')
+                  for name in _FILES}
+        self.term_offsets = arrays["term_offsets"]
+        self.postings_docs = arrays["postings_docs"]
+        self.postings_tf = arrays["postings_tf"]
+        self.doc_ids = arrays["doc_ids"]
+        self.doc_lengths = np.asarray(arrays["doc_lengths"], dtype='float32')
+        self.doc_countries = arrays["doc_countries"]
+
+        self.num_docs = len(self.doc_ids)
+        self.avg_length = float(self.doc_lengths.mean()) if self.num_docs else 0.0
+
+    @classmethod
+    def exists(cls, index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, "vocab.json"))
+
+    def search(self, query: str, top_k: int = 10,
+               country: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """أفضل الأجزاء حسب BM25 (معرفات FAISS والدرجات)"""
+        empty = (np.empty(0, dtype='int64'), np.empty(0, dtype='float32'))
+        if self.num_docs == 0:
+            return empty
+
+        scores = np.zeros(self.num_docs, dtype='float32')
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9))
+
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end].astype('float32')
+
+            df = end - start
+            idf = np.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        if country:
+            country_id = self.countries.get(country)
+            if country_id is None:
+                return empty
+            scores[self.doc_countries != country_id] = 0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return empty
+
+        top = candidates[np.argsort(-scores[candidates], kind='stable')[:top_k]]
+        return np.asarray(self.doc_ids[top], dtype='int64'), scores[top]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """دمج قوائم ترتيب متعددة: درجة كل جزء مجموع 1 / (k + ترتيبه)"""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            fused[chunk_id] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def build_from_stores(metadata_store, chunk_store, index_dir: str, batch_size: int = 10000,
+                      exclude: Optional[Iterable[int]] = None) -> int:
+    """إعادة بناء فهرس BM25 من مخزني البيانات الوصفية والنصوص (بعد تحديث تزايدي)
+
+    exclude: أجزاء أُزيلت من الفهرس ولم تُحذف بياناتها الوصفية بعد.
+    """
+    countries = metadata_store.countries_by_id()
+    excluded = {int(i) for i in exclude} if exclude is not None else set()
+    ids = sorted(i for i in countries if i not in excluded)
+
+    builder = LexicalIndexBuilder()
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        builder.add(batch, chunk_store.get_many(batch), [countries[i] for i in batch])
+
+    builder.save(index_dir)
+    return len(ids)
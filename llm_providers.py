@@ -0,0 +1,585 @@
+"""
+llm_providers.py - مزودو النماذج اللغوية غير المتزامنين: سباق متحوط أو محاولة متسلسلة، مع بث الرد
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+from queue import SimpleQueue
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+import openai  # لكل من DeepSeek وOpenAI
+
+
+class ProviderError(Exception):
+    """فشل مزود واحد (استجابة فارغة أو غير صالحة)"""
+
+
+def _record_error(attempt: Dict, error: Exception):
+    """تصنيف الخطأ: rate_limited (رد 429 أو نفاد الحصة) أو error، مع مهلة Retry-After إن وجدت"""
+    status_code = getattr(error, "status_code", None) or getattr(error, "code", None)
+    rate_limited = status_code == 429 or type(error).__name__ in ("RateLimitError", "ResourceExhausted")
+    attempt["status"], attempt["error"] = ("rate_limited" if rate_limited else "error"), str(error)
+
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if isinstance(response, httpx.Response) else None
+    if rate_limited and retry_after:
+        try:
+            attempt["retry_after"] = float(retry_after)
+        except ValueError:
+            pass
+
+
+def _read_usage(usage, target: Optional[Dict]):
+    """نسخ عدد رموز الطلب والرد كما أبلغ عنه المزود (كائن أو قاموس حسب إصدار المكتبة)"""
+    if usage is None or target is None:
+        return
+    for key, names in (("prompt_tokens", ("prompt_tokens", "prompt_token_count")),
+                       ("completion_tokens", ("completion_tokens", "candidates_token_count"))):
+        for name in names:
+            value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+            if value is not None:
+                target[key] = int(value)
+                break
+
+
+def _fingerprint(*parts) -> str:
+    """بصمة الإعدادات (المفتاح لا يُحفظ كما هو)"""
+    return hashlib.sha256("\x00".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class ClientPool:
+    """عملاء المزودين مشتركون بين كل الجلسات والطلبات
+
+    كل عميل يحتفظ باتصالات HTTP مفتوحة (keep-alive)، فلا تتكرر مصافحة TLS في كل استشارة.
+    يعاد إنشاء العميل فقط عند تغير المفتاح أو العنوان أو المهلة.
+    عملاء OpenAI غير المتزامنين مرتبطون بحلقة الأحداث، لذا تعمل كل الطلبات في حلقة
+    background_loop() الواحدة.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10,
+                 keepalive_expiry: float = 60.0):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.keepalive_expiry = keepalive_expiry
+        self._lock = threading.Lock()
+        self._clients: Dict[str, tuple] = {}
+        self._http: Dict[str, httpx.AsyncClient] = {}
+        self._last_used: Dict[str, float] = {}
+        self.created = 0
+        self.reused = 0
+        self.warmed = 0
+
+    def _get(self, name: str, fingerprint: str, factory, close=None):
+        with self._lock:
+            self._last_used[name] = time.monotonic()
+            entry = self._clients.get(name)
+            if entry is not None and entry[0] == fingerprint:
+                self.reused += 1
+                return entry[1]
+
+            client = factory()
+            self._clients[name] = (fingerprint, client)
+            self.created += 1
+
+        if entry is not None and close is not None:
+            close(entry[1])
+        return client
+
+    def openai_client(self, name: str, api_key: str, base_url: Optional[str],
+                      timeout: float) -> openai.AsyncOpenAI:
+        """عميل متوافق مع OpenAI لمزود واحد (يُستدعى من داخل حلقة الأحداث المشتركة)"""
+        def create():
+            http_client = self._http[name] = httpx.AsyncClient(limits=self.limits, timeout=timeout)
+            return openai.AsyncOpenAI(
+                api_key=api_key, base_url=base_url, timeout=timeout,
+                # إعادة المحاولة داخل المكتبة تؤخر الانتقال إلى المزود التالي
+                max_retries=0,
+                http_client=http_client
+            )
+
+        def close(client):
+            # الطلبات الجارية على العميل القديم تكتمل قبل إغلاقه
+            asyncio.get_running_loop().call_later(
+                timeout, lambda: asyncio.ensure_future(client.close()))
+
+        return self._get(name, _fingerprint(api_key, base_url, timeout), create, close)
+
+    def gemini_model(self, name: str, api_key: str, model: str, api_endpoint: Optional[str]):
+        """نموذج Gemini (genai.configure إعداد عام، فيُستدعى فقط عند تغير المفتاح)"""
+        def create():
+            import google.generativeai as genai
+
+            options = {"transport": "rest", "client_options": {"api_endpoint": api_endpoint}} \
+                if api_endpoint else {}
+            genai.configure(api_key=api_key, **options)
+            return genai.GenerativeModel(model)
+
+        return self._get(name, _fingerprint(api_key, model, api_endpoint), create)
+
+    def idle(self, name: str) -> bool:
+        """لم يُستخدم المزود خلال مدة بقاء الاتصالات المفتوحة (فلا اتصال جاهزاً على الأرجح)"""
+        last_used = self._last_used.get(name)
+        return last_used is None or time.monotonic() - last_used >= self.keepalive_expiry
+
+    async def warm(self, name: str, url: str, timeout: float):
+        """فتح اتصال (TCP وTLS) بطلب HEAD خفيف يبقى مفتوحاً للطلب الفعلي؛ نتيجته لا تهم"""
+        http_client = self._http.get(name)
+        if http_client is None:
+            return
+        try:
+            await http_client.head(url, timeout=timeout)
+            self.warmed += 1
+        except Exception:
+            pass
+
+    def statistics(self) -> Dict:
+        with self._lock:
+            return {'clients': len(self._clients), 'created': self.created, 'reused': self.reused,
+                    'warmed': self.warmed}
+
+
+class LLMProvider:
+    """مزود واحد باسم ومهلة خاصة به"""
+
+    def __init__(self, name: str, label: str, timeout: float = 30.0):
+        self.name = name
+        self.label = label
+        self.timeout = timeout
+
+    async def complete(self, prompt: str, usage: Optional[Dict] = None) -> str:
+        """الرد كاملاً؛ usage يُملأ بعدد الرموز (prompt_tokens وcompletion_tokens) إن أبلغ عنه المزود"""
+        raise NotImplementedError
+
+    def stream(self, prompt: str, usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """أجزاء الرد النصية فور وصولها"""
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """تجهيز الاتصال بالمزود أثناء تجهيز الطلب (لا شيء افتراضياً)"""
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """واجهة chat/completions (OpenAI وDeepSeek وأي خادم متوافق)"""
+
+    def __init__(self, name: str, label: str, pool: ClientPool, api_key: str, model: str,
+                 system_prompt: str, base_url: Optional[str] = None, max_tokens: int = 3000,
+                 temperature: float = 0.7, timeout: float = 30.0):
+        super().__init__(name, label, timeout)
+        self.pool = pool
+        self.api_key = api_key
+        self.model = model
+        self.system_prompt = system_prompt
+        self.base_url = base_url
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    async def _create(self, prompt: str, stream: bool = False):
+        client = self.pool.openai_client(self.name, self.api_key, self.base_url, self.timeout)
+        return await client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=stream,
+            # عدد الرموز في آخر جزء من البث (المكتبة المثبتة لا تعرف هذا الخيار بعد)
+            extra_body={"stream_options": {"include_usage": True}} if stream else None
+        )
+
+    async def warm_up(self):
+        if not self.pool.idle(self.name):
+            return
+        client = self.pool.openai_client(self.name, self.api_key, self.base_url, self.timeout)
+        await self.pool.warm(self.name, str(client.base_url), min(self.timeout, 5.0))
+
+    async def complete(self, prompt: str, usage: Optional[Dict] = None) -> str:
+        response = await self._create(prompt)
+        text = response.choices[0].message.content if response.choices else None
+        if not text:
+            raise ProviderError("استجابة فارغة")
+        _read_usage(response.usage, usage)
+        return text
+
+    async def stream(self, prompt: str, usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        response = await self._create(prompt, stream=True)
+        try:
+            async for chunk in response:
+                _read_usage(getattr(chunk, "usage", None), usage)
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    yield text
+        finally:
+            # إغلاق البث المتروك يعيد الاتصال إلى المجمع أو يغلقه
+            await response.close()
+
+
+class GeminiProvider(LLMProvider):
+    """Gemini عبر مكتبته المتزامنة في خيط منفصل
+
+    الإلغاء يتخلى عن النتيجة فوراً، لكن الطلب نفسه يكتمل في خيطه.
+    """
+
+    def __init__(self, name: str, label: str, pool: ClientPool, api_key: str,
+                 model: str = "gemini-pro", api_endpoint: Optional[str] = None,
+                 max_tokens: int = 4000, temperature: float = 0.7, timeout: float = 30.0):
+        super().__init__(name, label, timeout)
+        self.pool = pool
+        self.api_key = api_key
+        self.model = model
+        self.api_endpoint = api_endpoint
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def _generate(self, prompt: str, stream: bool = False):
+        model = self.pool.gemini_model(self.name, self.api_key, self.model, self.api_endpoint)
+        return model.generate_content(
+            f"بصفة محامٍ خبير: {prompt}",
+            generation_config={
+                "temperature": self.temperature,
+                "max_output_tokens": self.max_tokens,
+            },
+            stream=stream
+        )
+
+    def _complete(self, prompt: str, usage: Optional[Dict] = None) -> str:
+        response = self._generate(prompt)
+        if not response or not response.text:
+            raise ProviderError("استجابة فارغة")
+        _read_usage(getattr(response, "usage_metadata", None), usage)
+        return response.text
+
+    async def complete(self, prompt: str, usage: Optional[Dict] = None) -> str:
+        return await asyncio.to_thread(self._complete, prompt, usage)
+
+    async def stream(self, prompt: str, usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """الأجزاء تُقرأ في خيط وتُنقل إلى الحلقة عبر طابور"""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        end = object()
+
+        def produce():
+            try:
+                for chunk in self._generate(prompt, stream=True):
+                    _read_usage(getattr(chunk, "usage_metadata", None), usage)
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk.text)
+                loop.call_soon_threadsafe(chunks.put_nowait, end)
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+
+        loop.run_in_executor(None, produce)
+        while True:
+            item = await chunks.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            if item:
+                yield item
+
+
+async def _attempt(provider: LLMProvider, prompt: str, attempts: List[Dict]) -> Optional[str]:
+    """محاولة مزود واحد ضمن مهلته وتسجيل نتيجتها (None عند الفشل)"""
+    attempt = {"provider": provider.name, "status": "cancelled", "error": None, "usage": {}}
+    attempts.append(attempt)
+    start = time.perf_counter()
+    try:
+        text = await asyncio.wait_for(provider.complete(prompt, attempt["usage"]), provider.timeout)
+        attempt["status"] = "ok"
+        return text
+    except asyncio.TimeoutError:
+        attempt["status"] = "timeout"
+        print(f"{provider.label} Error: تجاوز المهلة ({provider.timeout} ثانية)")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        _record_error(attempt, e)
+        print(f"{provider.label} Error: {e}")
+    finally:
+        attempt["latency_ms"] = (time.perf_counter() - start) * 1000.0
+    return None
+
+
+async def complete_sequential(providers: List[LLMProvider], prompt: str) -> Dict:
+    """مزود بعد آخر: لا يُرسل أكثر من طلب في نفس الوقت (الأقل تكلفة)"""
+    attempts: List[Dict] = []
+    for provider in providers:
+        text = await _attempt(provider, prompt, attempts)
+        if text:
+            return {"provider": provider, "text": text, "attempts": attempts}
+    return {"provider": None, "text": None, "attempts": attempts}
+
+
+async def complete_hedged(providers: List[LLMProvider], prompt: str,
+                          hedge_delay: float = 3.0) -> Dict:
+    """سباق متحوط: المزود التالي يبدأ إذا لم يُجب السابق خلال hedge_delay (أو فور فشله)
+
+    أول استجابة ناجحة تُعاد وتُلغى الطلبات الباقية.
+    """
+    attempts: List[Dict] = []
+    queue = list(providers)
+    pending: Dict[asyncio.Task, LLMProvider] = {}
+
+    def start_next():
+        provider = queue.pop(0)
+        pending[asyncio.ensure_future(_attempt(provider, prompt, attempts))] = provider
+
+    if queue:
+        start_next()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay if queue else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                start_next()
+                continue
+
+            for task in done:
+                provider = pending.pop(task)
+                text = task.result()
+                if text:
+                    return {"provider": provider, "text": text, "attempts": attempts}
+                if queue:
+                    start_next()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    return {"provider": None, "text": None, "attempts": attempts}
+
+
+async def complete(providers: List[LLMProvider], prompt: str, mode: str = "hedged",
+                   hedge_delay: float = 3.0) -> Dict:
+    """{"provider": المزود الناجح أو None، "text": النص، "attempts": [...]}"""
+    if mode == "sequential":
+        return await complete_sequential(providers, prompt)
+    return await complete_hedged(providers, prompt, hedge_delay)
+
+
+async def _first_delta(stream: AsyncIterator[str]) -> str:
+    """انتظار أول جزء غير فارغ (البث نفسه يبقى مفتوحاً لقراءة الباقي)"""
+    async for text in stream:
+        return text
+    raise ProviderError("استجابة فارغة")
+
+
+async def _open_stream(queue: List[LLMProvider], prompt: str, attempts: List[Dict],
+                       hedge_delay: Optional[float]) -> Optional[tuple]:
+    """بدء البث من المزودين بالترتيب حتى يصل أول جزء من أحدهم
+
+    مع hedge_delay يبدأ المزود التالي إذا لم يصل أول جزء خلال المهلة (أو فور الفشل)،
+    ويُعاد المزودون الذين خسروا السباق إلى بداية الطابور احتياطاً لانقطاع البث لاحقاً.
+    يُعاد (المزود، البث، أول جزء، سجل المحاولة) أو None إذا فشل الجميع.
+    """
+    pending: Dict[asyncio.Task, tuple] = {}
+    losers: List[LLMProvider] = []
+
+    def start_next():
+        provider = queue.pop(0)
+        attempt = {"provider": provider.name, "status": "cancelled", "error": None,
+                   "usage": {}, "start": time.perf_counter()}
+        stream = provider.stream(prompt, attempt["usage"])
+        attempts.append(attempt)
+        task = asyncio.ensure_future(asyncio.wait_for(_first_delta(stream), provider.timeout))
+        pending[task] = (provider, stream, attempt)
+
+    def finish(attempt: Dict):
+        attempt["latency_ms"] = (time.perf_counter() - attempt.pop("start")) * 1000.0
+
+    winner = None
+    if queue:
+        start_next()
+    try:
+        while pending and winner is None:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay if queue else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                start_next()
+                continue
+
+            for task in done:
+                provider, stream, attempt = pending.pop(task)
+                try:
+                    text = task.result()
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        attempt["status"] = "timeout"
+                        print(f"{provider.label} Error: تجاوز مهلة أول جزء ({provider.timeout} ثانية)")
+                    else:
+                        _record_error(attempt, e)
+                        print(f"{provider.label} Error: {e}")
+                    finish(attempt)
+                    await stream.aclose()
+                    if queue and winner is None:
+                        start_next()
+                    continue
+
+                if winner is None:
+                    attempt["first_token_ms"] = (time.perf_counter() - attempt["start"]) * 1000.0
+                    winner = (provider, stream, text, attempt)
+                else:
+                    # وصل أول جزء من مزودين في نفس اللحظة
+                    finish(attempt)
+                    await stream.aclose()
+                    losers.append(provider)
+    finally:
+        for task, (provider, stream, attempt) in pending.items():
+            task.cancel()
+            losers.append(provider)
+        await asyncio.gather(*pending, return_exceptions=True)
+        for provider, stream, attempt in pending.values():
+            finish(attempt)
+            await stream.aclose()
+        queue[:0] = losers
+
+    return winner
+
+
+async def stream_failover(providers: List[LLMProvider], prompt: str, mode: str = "hedged",
+                          hedge_delay: float = 3.0, idle_timeout: float = 30.0) -> AsyncIterator[Dict]:
+    """بث الرد مع الانتقال إلى المزود التالي إذا انقطع البث
+
+    الأحداث:
+      {"type": "delta", "text": ..., "provider": الاسم}   جزء جديد من النص
+      {"type": "reset", "provider": الاسم}              انقطع البث؛ النص السابق يُهمل ويبدأ الرد من جديد
+      {"type": "done", "provider": المزود أو None، "text": النص الكامل، "attempts": [...]}
+    مهلة المزود تنطبق على أول جزء، وidle_timeout على الفاصل بين الأجزاء.
+    """
+    attempts: List[Dict] = []
+    queue = list(providers)
+    started = False
+    while queue:
+        opened = await _open_stream(queue, prompt, attempts,
+                                    hedge_delay if mode == "hedged" else None)
+        if opened is None:
+            break
+
+        provider, stream, text, attempt = opened
+        parts = [text]
+        try:
+            if started:
+                yield {"type": "reset", "provider": provider.name}
+            started = True
+            yield {"type": "delta", "text": text, "provider": provider.name}
+            while True:
+                text = await asyncio.wait_for(stream.__anext__(), idle_timeout)
+                parts.append(text)
+                yield {"type": "delta", "text": text, "provider": provider.name}
+        except StopAsyncIteration:
+            attempt["status"] = "ok"
+        except asyncio.TimeoutError:
+            attempt["status"] = "timeout"
+            print(f"{provider.label} Error: توقف البث ({idle_timeout} ثانية دون أجزاء جديدة)")
+            continue
+        except Exception as e:
+            _record_error(attempt, e)
+            print(f"{provider.label} Error: انقطع البث: {e}")
+            continue
+        finally:
+            attempt["latency_ms"] = (time.perf_counter() - attempt.pop("start")) * 1000.0
+            await stream.aclose()
+
+        yield {"type": "done", "provider": provider, "text": "".join(parts), "attempts": attempts}
+        return
+
+    yield {"type": "done", "provider": None, "text": None, "attempts": attempts}
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """حلقة أحداث واحدة للعملية في خيط خلفي تعمل فيها كل طلبات المزودين"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-providers", daemon=True).start()
+        return _loop
+
+
+def submit(coroutine) -> Future:
+    return asyncio.run_coroutine_threadsafe(coroutine, background_loop())
+
+
+def run_sync(coroutine):
+    """تشغيل coroutine في الحلقة المشتركة وانتظار نتيجتها من كود متزامن (جلسات Streamlit)"""
+    return submit(coroutine).result()
+
+
+async def run_async(coroutine):
+    """انتظار coroutine تعمل في الحلقة المشتركة من حلقة أحداث أخرى"""
+    if asyncio.get_running_loop() is background_loop():
+        return await coroutine
+    return await asyncio.wrap_future(submit(coroutine))
+
+
+def iterate_sync(events: AsyncIterator) -> Iterator:
+    """قراءة async iterator يعمل في الحلقة المشتركة من كود متزامن (جلسات Streamlit)
+
+    إغلاق المولد قبل نهايته يلغي البث في الحلقة.
+    """
+    items: SimpleQueue = SimpleQueue()
+    end = object()
+
+    async def pump():
+        try:
+            async for item in events:
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(end)
+
+    future = submit(pump())
+    try:
+        while True:
+            item = items.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+
+async def iterate_async(events: AsyncIterator) -> AsyncIterator:
+    """قراءة async iterator يعمل في الحلقة المشتركة من حلقة أحداث أخرى"""
+    loop = asyncio.get_running_loop()
+    if loop is background_loop():
+        async for item in events:
+            yield item
+        return
+
+    items: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def pump():
+        try:
+            async for item in events:
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(items.put_nowait, end)
+
+    future = submit(pump())
+    try:
+        while True:
+            item = await items.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        future.cancel()
@@ -1,8 +1,10 @@
 # main_fixed.py
+import itertools
+import uuid
 import streamlit as st
 import pycountry
-import random
 from datetime import datetime
+from legal_advisor import legal_advisor
 
 # إعدادات الصفحة
 st.set_page_config(
@@ -95,6 +97,8 @@ with st.sidebar:
     st.markdown("---")
     if 'usage_count' not in st.session_state:
         st.session_state.usage_count = 0
+    if 'user_id' not in st.session_state:
+        st.session_state.user_id = str(uuid.uuid4())
     
     remaining = 5 - st.session_state.usage_count
     st.progress(remaining / 5)
@@ -117,86 +121,98 @@ if st.button("🚀 بدأ التحليل القانوني", type="primary"):
     else:
         st.session_state.usage_count += 1
         
+        # الرد يظهر أثناء كتابته؛ المؤشر يبقى فقط حتى وصول أول جزء منه
+        answer = st.empty()
+        events = legal_advisor.stream_intelligent_response(selected_country, user_issue, selected_insts)
         with st.spinner("جاري التحليل باستخدام الذكاء الاصطناعي..."):
-            # محاكاة تحليل ذكي
-            time.sleep(2)  # محاكاة وقت الانتظار
-            
-            # تحليل ذكي مبني على الدولة
-            legal_systems = {
-                "Yemen": "قانون إسلامي ومدني",
-                "Saudi Arabia": "الشريعة الإسلامية",
-                "Egypt": "القانون المدني",
-                "United Arab Emirates": "قانون مدني وإسلامي",
-                "Qatar": "قانون مدني وإسلامي"
-            }
-            
-            legal_system = legal_systems.get(selected_country, "قانون دولي")
-            
-            # إنشاء تحليل قانوني
-            analysis = f"""
-            <div class="legal-card">
-                <h2>📋 تحليل قانوني - {selected_country}</h2>
-                <p><strong>النظام القانوني:</strong> {legal_system}</p>
-                <p><strong>المؤسسات المختارة:</strong> {', '.join(selected_insts) if selected_insts else 'لا توجد'}</p>
-                
-                <h3>🔍 التحليل:</h3>
-                <p>بناءً على وصفك، يبدو أن القضية تتعلق بـ <strong>{random.choice(['عقد عمل', 'منازعة تجارية', 'قضية مدنية', 'نزاع عقاري'])}</strong>.</p>
-                
-                <h3>💡 الحلول المقترحة:</h3>
-                <ol>
-                    <li>توثيق جميع الأدلة والمستندات المتعلقة بالقضية</li>
-                    <li>التواصل مع محامٍ متخصص في {selected_country}</li>
-                    <li>تقديم شكوى للجهة المختصة في {selected_country}</li>
-                    <li>الاستعانة بخبير قانوني دولي إذا تطلب الأمر</li>
-                </ol>
-                
-                <h3>📋 الخطوات العملية:</h3>
-                <ul>
-                    <li>الخطوة 1: جمع الوثائق خلال الأسبوع القادم</li>
-                    <li>الخطوة 2: التواصل مع نقابة المحامين في {selected_country}</li>
-                    <li>الخطوة 3: إعداد الملف القانوني كاملاً</li>
-                    <li>الخطوة 4: التقديم الرسمي للجهات المختصة</li>
-                </ul>
-                
-                <h3>⚠️ تحذيرات هامة:</h3>
-                <ul>
-                    <li>مهلة التقادم: {random.randint(1,5)} سنوات</li>
-                    <li>التكاليف التقريبية: ${random.randint(1000, 5000)}</li>
-                    <li>المدة المتوقعة: {random.randint(3, 12)} شهر</li>
-                </ul>
-                
-                <div style="background: #f3f4f6; padding: 15px; border-radius: 10px; margin-top: 20px;">
-                    <p><strong>🕒 وقت التحليل:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>
-                    <p><strong>⚖️ ملاحظة:</strong> هذا تحليل أولي ولا يغني عن استشارة محامٍ مرخص</p>
-                </div>
-            </div>
-            """
-            
-            st.markdown(analysis, unsafe_allow_html=True)
-            
-            # خيار تحميل النتائج
-            result_text = f"""
-            تحليل قانوني - {selected_country}
-            التاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}
+            first_event = next(events)
+        
+        streamed_text = ""
+        result = None
+        for event in itertools.chain([first_event], events):
+            if event["type"] == "reset":
+                # انقطع المزود أثناء الكتابة فيبدأ الرد من جديد من المزود التالي
+                streamed_text = ""
+            elif event["type"] == "delta":
+                streamed_text += event["text"]
+                answer.markdown(streamed_text + " ▌")
+            elif event["type"] == "done":
+                result = event
+        answer.markdown(result["analysis"])
+        
+        # تسجيل الطلب مع أزمنته ورموزه وتكلفته (تعرضها تقارير لوحة التحكم)
+        legal_advisor.record_usage(st.session_state.user_id, selected_country, user_issue,
+                                   selected_insts, result)
+        
+        # تحليل ذكي مبني على الدولة
+        legal_systems = {
+            "Yemen": "قانون إسلامي ومدني",
+            "Saudi Arabia": "الشريعة الإسلامية",
+            "Egypt": "القانون المدني",
+            "United Arab Emirates": "قانون مدني وإسلامي",
+            "Qatar": "قانون مدني وإسلامي"
+        }
+        
+        legal_system = legal_systems.get(selected_country, "قانون دولي")
+        
+        solutions = "".join(f"<li>{item}</li>" for item in result["suggested_solutions"])
+        steps = "".join(f"<li>{item}</li>" for item in result["steps"])
+        warnings = "".join(f"<li>{item}</li>" for item in result["warnings"])
+        sources = "".join(
+            f"<li>[{i}] {source['title']}{' • المادة ' + str(source['article']) if source['article'] else ''}</li>"
+            for i, source in enumerate(result.get("sources", []), 1)
+        )
+        
+        # ملخص الحلول والخطوات بعد اكتمال الرد
+        summary = f"""
+        <div class="legal-card">
+            <h2>📋 تحليل قانوني - {selected_country}</h2>
+            <p><strong>النظام القانوني:</strong> {legal_system}</p>
+            <p><strong>المؤسسات المختارة:</strong> {', '.join(selected_insts) if selected_insts else 'لا توجد'}</p>
             
-            {user_issue}
+            <h3>💡 الحلول المقترحة:</h3>
+            <ol>{solutions}</ol>
             
-            التحليل:
-            بناءً على وصفك، يبدو أن القضية تتعلق بعقد عمل أو منازعة تجارية.
+            <h3>📋 الخطوات العملية:</h3>
+            <ul>{steps}</ul>
             
-            الخطوات الموصى بها:
-            1. جمع وتوثيق جميع الأدلة
-            2. التواصل مع محامٍ متخصص
-            3. التقديم للجهات المختصة
+            <h3>⚠️ تحذيرات هامة:</h3>
+            <ul>{warnings}</ul>
             
-            تحذير: هذا تحليل أولي ولا يغني عن محامٍ مرخص.
-            """
+            {f"<h3>📚 النصوص القانونية المستند إليها:</h3><ul>{sources}</ul>" if sources else ""}
             
-            st.download_button(
-                label="📥 تحميل التحليل",
-                data=result_text,
-                file_name=f"تحليل_قانوني_{datetime.now().strftime('%Y%m%d')}.txt"
-            )
+            <div style="background: #f3f4f6; padding: 15px; border-radius: 10px; margin-top: 20px;">
+                <p><strong>🕒 وقت التحليل:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M')}</p>
+                <p><strong>🤖 المصدر:</strong> {result['used_model']}</p>
+                <p><strong>⏱️ زمن الاستجابة:</strong> {result['metrics']['total_ms'] / 1000:.1f} ثانية</p>
+                <p><strong>⚖️ ملاحظة:</strong> هذا تحليل أولي ولا يغني عن استشارة محامٍ مرخص</p>
+            </div>
+        </div>
+        """
+        
+        st.markdown(summary, unsafe_allow_html=True)
+        
+        # خيار تحميل النتائج
+        result_text = f"""
+        تحليل قانوني - {selected_country}
+        التاريخ: {datetime.now().strftime('%Y-%m-%d %H:%M')}
+        
+        {user_issue}
+        
+        التحليل:
+        {result['analysis']}
+        
+        الخطوات الموصى بها:
+        {chr(10).join(result['steps'])}
+        
+        تحذير: هذا تحليل أولي ولا يغني عن محامٍ مرخص.
+        """
+        
+        st.download_button(
+            label="📥 تحميل التحليل",
+            data=result_text,
+            file_name=f"تحليل_قانوني_{datetime.now().strftime('%Y%m%d')}.txt"
+        )
 
 # الفوتر
 st.markdown("---")
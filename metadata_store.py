@@ -0,0 +1,204 @@
+"""
+metadata_store.py - مخزن البيانات الوصفية لأجزاء الفهرس في SQLite
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+# الحقول النصية المتكررة تُخزن مرة واحدة في جدول النصوص
+INTERNED_FIELDS = ('source', 'country', 'title', 'type', 'section')
+
+# أقصى عدد معاملات في استعلام SQLite واحد
+_MAX_SQL_PARAMS = 900
+
+
+class MetadataStore:
+    """بيانات وصفية لكل جزء مفهرس، يتم البحث فيها بمعرف FAISS عند الطلب"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._string_ids: Dict[str, int] = {}
+        self._strings: Dict[int, str] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        """فتح قاعدة البيانات عند أول استخدام"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            cursor = self._conn.cursor()
+
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS strings (
+                id INTEGER PRIMARY KEY,
+                value TEXT UNIQUE
+            )
+            ''')
+
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                source_id INTEGER,
+                country_id INTEGER,
+                title_id INTEGER,
+                type_id INTEGER,
+                chunk INTEGER,
+                preview TEXT,
+                section_id INTEGER,
+                article TEXT
+            )
+            ''')
+
+            # قواعد أُنشئت قبل التقسيم حسب المواد
+            cursor.execute('PRAGMA table_info(chunks)')
+            columns = {row[1] for row in cursor.fetchall()}
+            for column, column_type in (('section_id', 'INTEGER'), ('article', 'TEXT')):
+                if column not in columns:
+                    cursor.execute(f'ALTER TABLE chunks ADD COLUMN {column} {column_type}')
+
+            self._conn.commit()
+        return self._conn
+
+    def _intern(self, cursor: sqlite3.Cursor, value: str) -> int:
+        """معرف النص في جدول النصوص (مع إضافته إذا لم يكن موجوداً)"""
+        value = value or ''
+        if value not in self._string_ids:
+            cursor.execute('INSERT OR IGNORE INTO strings (value) VALUES (?)', (value,))
+            cursor.execute('SELECT id FROM strings WHERE value = ?', (value,))
+            string_id = cursor.fetchone()[0]
+            self._string_ids[value] = string_id
+            self._strings[string_id] = value
+        return self._string_ids[value]
+
+    def _string(self, cursor: sqlite3.Cursor, string_id: int) -> str:
+        if string_id not in self._strings:
+            cursor.execute('SELECT value FROM strings WHERE id = ?', (string_id,))
+            row = cursor.fetchone()
+            value = row[0] if row else ''
+            self._strings[string_id] = value
+            self._string_ids[value] = string_id
+        return self._strings[string_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            cursor = self._connection().cursor()
+            cursor.execute('SELECT COUNT(*) FROM chunks')
+            return cursor.fetchone()[0]
+
+    def next_id(self) -> int:
+        """أول معرف متاح لأجزاء جديدة"""
+        with self._lock:
+            cursor = self._connection().cursor()
+            cursor.execute('SELECT COALESCE(MAX(id) + 1, 0) FROM chunks')
+            return cursor.fetchone()[0]
+
+    def append(self, metas: List[Dict], ids: Iterable[int]):
+        """إضافة بيانات وصفية لأجزاء جديدة بمعرفات FAISS الخاصة بها"""
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.cursor()
+
+            rows = []
+            for chunk_id, meta in zip(ids, metas):
+                rows.append((
+                    int(chunk_id),
+                    *[self._intern(cursor, meta.get(field, '')) for field in INTERNED_FIELDS],
+                    meta.get('chunk', 0),
+                    meta.get('preview', ''),
+                    str(meta.get('article', ''))
+                ))
+
+            cursor.executemany('''
+            INSERT OR REPLACE INTO chunks
+                (id, source_id, country_id, title_id, type_id, section_id, chunk, preview, article)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+            conn.commit()
+
+    def delete(self, ids: Iterable[int]) -> int:
+        """حذف البيانات الوصفية لأجزاء أُزيلت من الفهرس"""
+        ids = [(int(i),) for i in ids]
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.cursor()
+            cursor.executemany('DELETE FROM chunks WHERE id = ?', ids)
+            conn.commit()
+            return len(ids)
+
+    def delete_ranges(self, ranges: Iterable[Iterable[int]]) -> int:
+        """حذف البيانات الوصفية لنطاقات معرفات [بداية، نهاية)"""
+        ranges = [tuple(int(i) for i in bounds) for bounds in ranges]
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.cursor()
+            cursor.executemany('DELETE FROM chunks WHERE id >= ? AND id < ?', ranges)
+            conn.commit()
+            return cursor.rowcount
+
+    def _row_to_meta(self, cursor: sqlite3.Cursor, row: tuple) -> Dict:
+        fields = len(INTERNED_FIELDS)
+        meta = {field: self._string(cursor, string_id) if string_id is not None else ''
+                for field, string_id in zip(INTERNED_FIELDS, row[1:1 + fields])}
+        meta['chunk'] = row[1 + fields]
+        meta['preview'] = row[2 + fields]
+        meta['article'] = row[3 + fields] or ''
+        return meta
+
+    def get(self, chunk_id: int) -> Optional[Dict]:
+        """البيانات الوصفية لجزء واحد"""
+        return self.get_many([chunk_id]).get(int(chunk_id))
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        """البيانات الوصفية لعدة أجزاء في استعلام واحد"""
+        ids = [int(i) for i in ids if i >= 0]
+        results = {}
+
+        with self._lock:
+            cursor = self._connection().cursor()
+
+            for start in range(0, len(ids), _MAX_SQL_PARAMS):
+                batch = ids[start:start + _MAX_SQL_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f'''
+                SELECT id, source_id, country_id, title_id, type_id, section_id, chunk, preview, article
+                FROM chunks WHERE id IN ({placeholders})
+                ''', batch)
+
+                for row in cursor.fetchall():
+                    results[row[0]] = self._row_to_meta(cursor, row)
+
+        return results
+
+    def countries_by_id(self) -> Dict[int, str]:
+        """دولة كل جزء (لإعادة بناء فهارس الدول)"""
+        with self._lock:
+            cursor = self._connection().cursor()
+            cursor.execute('''
+            SELECT chunks.id, strings.value
+            FROM chunks JOIN strings ON strings.id = chunks.country_id
+            ''')
+            return dict(cursor.fetchall())
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """ترحيل ملف metadata.json القديم (المعرف هو ترتيب الجزء في الملف)"""
+        if not os.path.exists(json_path) or len(self) > 0:
+            return 0
+
+        with open(json_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+
+        self.append(metadata, range(len(metadata)))
+        print(f"✅ تم ترحيل {len(metadata)} سجل من {json_path}")
+
+        return len(metadata)
+
+    def close(self):
+        """إغلاق الاتصال"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
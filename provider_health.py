@@ -0,0 +1,196 @@
+"""
+provider_health.py - صحة مزودي النماذج اللغوية: إحصاءات حية وقاطع دائرة وترتيب تكيفي
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+# حالات القاطع
+CLOSED = "closed"        # المزود يعمل
+OPEN = "open"            # يُتخطى حتى انتهاء فترة التهدئة
+HALF_OPEN = "half_open"  # انتهت التهدئة: المحاولة التالية تحدد إغلاقه أو فتحه من جديد
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+class ProviderHealth:
+    """إحصاءات آخر المحاولات لكل مزود (زمن الاستجابة ونسبة الأخطاء وحدود المعدل) مع قاطع دائرة
+
+    - إخفاقات متتالية بعدد failure_threshold (أو رد 429) تفتح القاطع فيُتخطى المزود
+      لفترة تهدئة تتضاعف مع كل فتح متتالٍ حتى max_cooldown.
+    - المزودون المتاحون يُرتبون حسب الزمن المتوقع: الوسيط + نسبة الأخطاء × المهلة،
+      والمزود بلا عينات يُجرب أولاً حتى تُقاس سرعته.
+    - الحالة تُحفظ في قاعدة البيانات (store) لتبقى بعد إعادة التشغيل ولتعرضها لوحة التحكم.
+    """
+
+    def __init__(self, window: int = 100, window_seconds: float = 900.0,
+                 failure_threshold: int = 3, cooldown: float = 60.0, max_cooldown: float = 600.0,
+                 store=None, save_interval: float = 30.0):
+        self.window = window
+        self.window_seconds = window_seconds
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.store = store
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._providers: Dict[str, Dict] = {}
+        self._last_saved = 0.0
+
+        if store is not None:
+            try:
+                self.load(store.get_provider_health())
+            except Exception as e:
+                print(f"⚠️ تعذر تحميل حالة المزودين: {e}")
+
+    def _state(self, name: str) -> Dict:
+        state = self._providers.get(name)
+        if state is None:
+            state = self._providers[name] = {
+                "samples": [],  # [الوقت، الحالة، زمن الاستجابة، زمن أول جزء]
+                "breaker": CLOSED,
+                "open_until": 0.0,
+                "trips": 0,  # مرات الفتح المتتالية (تحدد فترة التهدئة)
+                "consecutive_failures": 0
+            }
+        return state
+
+    def _recent(self, state: Dict, now: float) -> List[list]:
+        cutoff = now - self.window_seconds
+        return [sample for sample in state["samples"] if sample[0] >= cutoff]
+
+    def _trip(self, name: str, state: Dict, now: float, retry_after: Optional[float] = None):
+        cooldown = min(self.max_cooldown, self.cooldown * (2 ** state["trips"]))
+        state["breaker"] = OPEN
+        state["open_until"] = now + max(cooldown, retry_after or 0.0)
+        state["trips"] += 1
+        print(f"⚠️ تم إيقاف المزود {name} مؤقتاً لمدة {state['open_until'] - now:.0f} ثانية")
+
+    def record(self, attempt: Dict) -> bool:
+        """تسجيل محاولة واحدة من سجل المحاولات؛ يعيد True إذا تغيرت حالة القاطع"""
+        status = attempt.get("status")
+        if status == "cancelled":
+            # المحاولة ألغيت لأن مزوداً آخر سبقها: لا تدل على صحة المزود
+            return False
+
+        now = time.time()
+        with self._lock:
+            state = self._state(attempt["provider"])
+            breaker = state["breaker"]
+            state["samples"].append([now, status, attempt.get("latency_ms"),
+                                     attempt.get("first_token_ms")])
+            del state["samples"][:-self.window]
+
+            if status == "ok":
+                state["consecutive_failures"] = 0
+                state["breaker"], state["trips"] = CLOSED, 0
+            else:
+                state["consecutive_failures"] += 1
+                if status == "rate_limited":
+                    self._trip(attempt["provider"], state, now, attempt.get("retry_after"))
+                elif breaker == HALF_OPEN or state["consecutive_failures"] >= self.failure_threshold:
+                    self._trip(attempt["provider"], state, now)
+            return state["breaker"] != breaker
+
+    def record_attempts(self, attempts: List[Dict]):
+        changed = False
+        for attempt in attempts:
+            changed = self.record(attempt) or changed
+        if self.store is not None and (changed or time.time() - self._last_saved >= self.save_interval):
+            self.save()
+
+    def _available(self, state: Dict, now: float) -> bool:
+        if state["breaker"] == OPEN and now >= state["open_until"]:
+            state["breaker"] = HALF_OPEN
+        return state["breaker"] != OPEN
+
+    def _expected_latency(self, state: Dict, now: float, timeout: float) -> float:
+        recent = self._recent(state, now)
+        latencies = [sample[2] for sample in recent if sample[1] == "ok" and sample[2] is not None]
+        if not latencies:
+            return 0.0
+        errors = sum(1 for sample in recent if sample[1] != "ok") / len(recent)
+        return percentile(latencies, 50) + errors * timeout * 1000.0
+
+    def order(self, names: List[str], timeouts: Optional[Dict[str, float]] = None,
+              by_latency: bool = True) -> List[str]:
+        """المزودون المتاحون من الأسرع إلى الأبطأ (الترتيب الأصلي عند التساوي أو دون by_latency)
+
+        إذا كانت كل القواطع مفتوحة يُجرب المزود الذي تنتهي تهدئته أولاً بدلاً من رفض الطلب.
+        """
+        timeouts = timeouts or {}
+        now = time.time()
+        with self._lock:
+            states = {name: self._state(name) for name in names}
+            available = [name for name in names if self._available(states[name], now)]
+            if not available:
+                return sorted(names, key=lambda name: states[name]["open_until"])[:1]
+            if not by_latency:
+                return available
+            return sorted(available, key=lambda name: self._expected_latency(
+                states[name], now, timeouts.get(name, 30.0)))
+
+    def summary(self) -> Dict[str, Dict]:
+        """ملخص كل مزود للعرض (لوحة التحكم والإحصائيات)"""
+        now = time.time()
+        result = {}
+        with self._lock:
+            for name, state in self._providers.items():
+                recent = self._recent(state, now)
+                latencies = [s[2] for s in recent if s[1] == "ok" and s[2] is not None]
+                first_tokens = [s[3] for s in recent if s[1] == "ok" and s[3] is not None]
+                errors = sum(1 for s in recent if s[1] != "ok")
+                breaker = state["breaker"]
+                if breaker == OPEN and now >= state["open_until"]:
+                    breaker = HALF_OPEN
+                result[name] = {
+                    "breaker": breaker,
+                    "open_for_s": max(0.0, state["open_until"] - now) if breaker == OPEN else 0.0,
+                    "requests": len(recent),
+                    "error_rate": errors / len(recent) if recent else 0.0,
+                    "timeouts": sum(1 for s in recent if s[1] == "timeout"),
+                    "rate_limited": sum(1 for s in recent if s[1] == "rate_limited"),
+                    "p50_ms": percentile(latencies, 50),
+                    "p95_ms": percentile(latencies, 95),
+                    "first_token_p50_ms": percentile(first_tokens, 50),
+                    "consecutive_failures": state["consecutive_failures"]
+                }
+        return result
+
+    def states(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: dict(state, samples=list(state["samples"]))
+                    for name, state in self._providers.items()}
+
+    def load(self, states: Dict[str, Dict]):
+        with self._lock:
+            for name, state in states.items():
+                self._state(name).update(state)
+
+    def save(self):
+        """حفظ الحالة في قاعدة البيانات في خيط منفصل (لا يعطل حلقة الطلبات)"""
+        self._last_saved = time.time()
+        states = self.states()
+
+        def write():
+            with self._save_lock:
+                try:
+                    self.store.save_provider_health(states)
+                except Exception as e:
+                    print(f"⚠️ تعذر حفظ حالة المزودين: {e}")
+
+        threading.Thread(target=write, name="provider-health", daemon=True).start()
+
+    @classmethod
+    def from_store(cls, store, **options) -> "ProviderHealth":
+        """قراءة الحالة المحفوظة فقط (لوحة التحكم تعمل في عملية مستقلة عن المنصة)"""
+        health = cls(**options)
+        health.load(store.get_provider_health())
+        return health
@@ -0,0 +1,137 @@
+"""
+reranker.py - إعادة ترتيب المرشحين بنموذج cross-encoder ضمن ميزانية زمنية لكل طلب
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+
+class Reranker:
+    """درجات cross-encoder للمرشحين الأوائل دفعة بعد دفعة حتى نفاد الميزانية
+
+    المرشحون مرتبون مسبقاً حسب البحث الأول، فإذا نفدت الميزانية أُعيد ترتيب
+    الأوائل فقط وبقي الباقي بترتيبه الأصلي بعدهم.
+    """
+
+    def __init__(self, model_loader: Callable[[], object], batch_size: int = 16,
+                 budget_ms: float = 150.0, cache_size: int = 10000):
+        self._model_loader = model_loader
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        # (بصمة الاستعلام، معرف الجزء) ← الدرجة؛ المعرفات لا يعاد استخدامها فالدرجة لا تتقادم
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+
+        # متوسط زمن الزوج الواحد لتقدير زمن الدفعة التالية قبل تشغيلها
+        self._pair_ms: Optional[float] = None
+
+        self.requests = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.truncated = 0
+        self.warmed = False
+        self._latencies = deque(maxlen=1000)
+
+    @property
+    def model(self):
+        return self._model_loader()
+
+    def warm_up(self):
+        """تحميل النموذج وتشغيل دفعة صغيرة قبل أول طلب (خارج ميزانية أي طلب)"""
+        self.model.predict([("warm up", "warm up")], batch_size=1, convert_to_numpy=True)
+        self.warmed = True
+
+    @staticmethod
+    def query_key(query: str) -> str:
+        return hashlib.sha1(normalize_text(query).encode('utf-8')).hexdigest()
+
+    def rerank(self, query: str, candidates: List[Dict], deadline: Optional[float] = None) -> List[Dict]:
+        """إعادة ترتيب النتائج (كل نتيجة فيها 'id' و'text') وإضافة 'rerank_score'
+
+        deadline: وقت انتهاء الميزانية (time.perf_counter)؛ يمكن مشاركته بين استعلامات طلب واحد.
+        """
+        start = time.perf_counter()
+        if deadline is None:
+            deadline = start + self.budget_ms / 1000.0
+
+        key = self.query_key(query)
+        scores: Dict[int, float] = {}
+
+        with self._lock:
+            for result in candidates:
+                cached = self._cache.get((key, result['id']))
+                if cached is not None:
+                    self._cache.move_to_end((key, result['id']))
+                    scores[result['id']] = cached
+            self.cache_hits += len(scores)
+
+        pending = [result for result in candidates if result['id'] not in scores]
+        truncated = False
+
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+
+            # التوقف قبل دفعة يُتوقع أن تتجاوز الميزانية
+            expected = (self._pair_ms or 0.0) * len(batch) / 1000.0
+            if time.perf_counter() + expected > deadline:
+                truncated = True
+                break
+
+            model = self.model
+            batch_start = time.perf_counter()
+            batch_scores = np.asarray(
+                model.predict([(query, result['text']) for result in batch],
+                              batch_size=self.batch_size, convert_to_numpy=True),
+                dtype='float32'
+            ).reshape(-1)
+            pair_ms = (time.perf_counter() - batch_start) * 1000.0 / len(batch)
+
+            with self._lock:
+                self._pair_ms = pair_ms if self._pair_ms is None else 0.8 * self._pair_ms + 0.2 * pair_ms
+                self.pairs_scored += len(batch)
+                for result, score in zip(batch, batch_scores.tolist()):
+                    scores[result['id']] = score
+                    self._cache[(key, result['id'])] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        # المرشحون المقيمون حسب الدرجة، ثم الباقون بترتيب البحث الأول
+        scored = sorted((result for result in candidates if result['id'] in scores),
+                        key=lambda result: scores[result['id']], reverse=True)
+        unscored = [result for result in candidates if result['id'] not in scores]
+        for result in scored:
+            result['rerank_score'] = scores[result['id']]
+
+        with self._lock:
+            self.requests += 1
+            self.truncated += truncated
+            self._latencies.append((time.perf_counter() - start) * 1000.0)
+
+        return scored + unscored
+
+    def statistics(self) -> Dict:
+        """تكلفة إعادة الترتيب: الزمن لكل طلب ونسبة الإصابة والطلبات المقطوعة"""
+        with self._lock:
+            latencies = np.asarray(self._latencies) if self._latencies else np.zeros(1)
+            lookups = self.cache_hits + self.pairs_scored
+            return {
+                'warmed': self.warmed,
+                'requests': self.requests,
+                'pairs_scored': self.pairs_scored,
+                'cache_hits': self.cache_hits,
+                'cache_hit_rate': self.cache_hits / lookups if lookups else 0.0,
+                'truncated': self.truncated,
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p95': float(np.percentile(latencies, 95)),
+                'pair_ms': self._pair_ms or 0.0,
+                'cache_entries': len(self._cache)
+            }
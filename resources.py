@@ -0,0 +1,235 @@
+"""
+resources.py - موارد مشتركة على مستوى العملية (نموذج التضمين، الفهارس، المخازن) تُحمّل عند أول استخدام
+"""
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+
+from config import Config
+from chunk_store import ChunkStore
+from embedding_cache import EmbeddingCache
+from index_partitions import PartitionedIndex
+from index_shards import ShardedIndex
+from lexical_index import LexicalIndex
+from snapshots import Snapshot, store_path
+from vector_store import VectorStore
+from metadata_store import MetadataStore
+from reranker import Reranker
+from shard_service import RemoteShardedIndex, ShardCoordinator
+
+_lock = threading.RLock()
+_resources: Dict[tuple, object] = {}
+# قفل لكل مورد: تحميل فهرس كبير لا يوقف الحصول على الموارد الأخرى
+_loading: Dict[tuple, threading.Lock] = {}
+
+
+def _shared(key: tuple, factory: Callable[[], object]):
+    """إنشاء المورد مرة واحدة لكل عملية ثم إعادة استخدامه في كل الجلسات"""
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            key_lock = _loading.setdefault(key, threading.Lock())
+        with key_lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = factory()
+                with _lock:
+                    _resources[key] = resource
+                    _loading.pop(key, None)
+    return resource
+
+
+def _evict_stale(kind: str, path: str, current: tuple):
+    """إزالة النسخ القديمة من نفس الفهرس بعد تحميل نسخة أحدث"""
+    with _lock:
+        for key in [key for key in _resources if key[:2] == (kind, path) and key != current]:
+            del _resources[key]
+
+
+def index_io_flags(mmap: Optional[bool] = None) -> int:
+    """أعلام قراءة FAISS: الربط بالذاكرة يشارك صفحات الفهرس بين العمليات ويسرع الإقلاع"""
+    if mmap is None:
+        mmap = Config.FAISS_MMAP
+    return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+
+
+def get_embedding_model(model_name: Optional[str] = None):
+    """نموذج التضمين المشترك (يُستورد ويُحمّل عند أول استعلام فقط)"""
+    model_name = model_name or Config.EMBEDDING_MODEL
+
+    def load():
+        from sentence_transformers import SentenceTransformer
+        print(f"✅ تحميل نموذج التضمين: {model_name}")
+        return SentenceTransformer(model_name)
+
+    return _shared(("model", model_name), load)
+
+
+def get_cross_encoder(model_name: Optional[str] = None):
+    """نموذج إعادة الترتيب المشترك (يُستورد ويُحمّل عند أول استخدام فقط)"""
+    model_name = model_name or Config.RERANK_MODEL
+
+    def load():
+        from sentence_transformers import CrossEncoder
+        print(f"✅ تحميل نموذج إعادة الترتيب: {model_name}")
+        return CrossEncoder(model_name, device="cpu")
+
+    return _shared(("cross_encoder", model_name), load)
+
+
+def get_reranker(model_name: Optional[str] = None) -> Reranker:
+    """إعادة الترتيب المشتركة (ذاكرة الدرجات والمقاييس على مستوى العملية)
+
+    النموذج يُحمّل ويُسخّن عند إنشائها، فلا يدخل زمن التحميل في ميزانية أول طلب.
+    """
+    model_name = model_name or Config.RERANK_MODEL
+
+    def load():
+        reranker = Reranker(lambda: get_cross_encoder(model_name),
+                            batch_size=Config.RERANK_BATCH_SIZE,
+                            budget_ms=Config.RERANK_BUDGET_MS,
+                            cache_size=Config.RERANK_CACHE_SIZE)
+        reranker.warm_up()
+        return reranker
+
+    return _shared(("reranker", model_name), load)
+
+
+def loaded_reranker(model_name: Optional[str] = None) -> Optional[Reranker]:
+    """إعادة الترتيب إن كانت منشأة مسبقاً، بدون تحميل النموذج"""
+    return _resources.get(("reranker", model_name or Config.RERANK_MODEL))
+
+
+class LoadedSnapshot:
+    """فهارس نسخة منشورة واحدة محملة في الذاكرة مع مخازن جيلها"""
+
+    def __init__(self, generation: Optional[str], index=None,
+                 lexical: Optional[LexicalIndex] = None, snapshot=None,
+                 stores: Optional[str] = None):
+        self.generation = generation
+        self.index = index
+        self.lexical = lexical
+        self.snapshot = snapshot
+        self.stores = stores
+        self.metadata_store, self.chunk_store, self.vector_store = get_stores(stores)
+
+
+def get_snapshot(root: str, generation: str,
+                 countries_loader: Optional[Callable[[], Dict[int, str]]] = None,
+                 index_type: str = "flat", index_params: Optional[Dict] = None,
+                 mmap: Optional[bool] = None) -> LoadedSnapshot:
+    """الفهرس العام وفهارس الدول وفهرس BM25 لنسخة منشورة (مرة واحدة لكل عملية)
+
+    النسخة المقسمة لا تُحمّل متجهاتها هنا: يبحث فيها المنسق عبر خوادم الأجزاء
+    (أو تُحمّل كل الأجزاء في هذه العملية إذا عُطلت الخوادم).
+    """
+    flags = index_io_flags(mmap)
+    snapshot = Snapshot(os.path.join(root, generation))
+
+    def load():
+        # معرفات النسخة تشير إلى صفوف جيل مخازنها
+        stores = snapshot.stores
+        loader = countries_loader or get_stores(stores)[0].countries_by_id
+        if snapshot.is_sharded and Config.FAISS_SHARD_SERVERS:
+            # الخوادم تضبط معاملات البحث لأجزائها
+            partitioned = RemoteShardedIndex(get_shard_coordinator(root), generation, snapshot.shards_dir)
+        else:
+            if snapshot.is_sharded:
+                partitioned = ShardedIndex.load(snapshot.shards_dir, index_params, flags)
+            else:
+                partitioned = PartitionedIndex.load(snapshot.index_path, snapshot.partitions_dir,
+                                                    countries_loader=loader,
+                                                    index_type=index_type,
+                                                    index_params=index_params,
+                                                    io_flags=flags)
+            partitioned.set_search_params(nprobe=Config.FAISS_NPROBE, ef_search=Config.FAISS_EF_SEARCH)
+        lexical = LexicalIndex(snapshot.lexical_dir) if LexicalIndex.exists(snapshot.lexical_dir) else None
+        return LoadedSnapshot(generation, partitioned, lexical, snapshot, stores)
+
+    key = ("snapshot", root, generation, flags)
+    loaded = _shared(key, load)
+    _evict_stale("snapshot", root, key)
+    return loaded
+
+
+def get_shard_coordinator(root: Optional[str] = None) -> ShardCoordinator:
+    """منسق خوادم الأجزاء المشترك (اتصالات مفتوحة لكل جزء)"""
+    root = root or Config.FAISS_SNAPSHOTS_DIR
+    return _shared(
+        ("shard_coordinator", root),
+        lambda: ShardCoordinator(root, Config.FAISS_SHARD_SOCKET_DIR,
+                                 authkey=Config.FAISS_SHARD_AUTHKEY,
+                                 timeout=Config.FAISS_SHARD_TIMEOUT,
+                                 autostart=Config.FAISS_SHARD_AUTOSTART)
+    )
+
+
+def get_metadata_store(db_path: Optional[str] = None) -> MetadataStore:
+    """مخزن البيانات الوصفية المشترك"""
+    db_path = db_path or Config.FAISS_METADATA_DB_PATH
+    return _shared(("metadata", db_path), lambda: MetadataStore(db_path))
+
+
+def get_chunk_store(base_path: Optional[str] = None) -> ChunkStore:
+    """مخزن نصوص الأجزاء المشترك"""
+    base_path = base_path or Config.FAISS_CHUNKS_PATH
+    return _shared(("chunks", base_path), lambda: ChunkStore(base_path))
+
+
+def get_vector_store(path: Optional[str] = None) -> VectorStore:
+    """مخزن المتجهات الأصلية المشترك"""
+    path = path or Config.FAISS_VECTORS_PATH
+    return _shared(("vectors", path), lambda: VectorStore(path))
+
+
+def get_stores(stores: Optional[str] = None, db_path: Optional[str] = None,
+               chunks_path: Optional[str] = None,
+               vectors_path: Optional[str] = None) -> Tuple[MetadataStore, ChunkStore, VectorStore]:
+    """مخازن جيل واحد (البيانات الوصفية والنصوص والمتجهات)، كل منها مشترك على مستوى العملية"""
+    return (get_metadata_store(store_path(db_path or Config.FAISS_METADATA_DB_PATH, stores)),
+            get_chunk_store(store_path(chunks_path or Config.FAISS_CHUNKS_PATH, stores)),
+            get_vector_store(store_path(vectors_path or Config.FAISS_VECTORS_PATH, stores)))
+
+
+def release_ids(stores: Optional[str], ranges: List[List[int]], db_path: Optional[str] = None):
+    """حذف البيانات الوصفية لنطاقات معرفات لم تعد أي نسخة محفوظة تستخدمها"""
+    get_metadata_store(store_path(db_path or Config.FAISS_METADATA_DB_PATH, stores)).delete_ranges(ranges)
+
+
+def retire_stores(stores: Optional[str], db_path: Optional[str] = None,
+                  chunks_path: Optional[str] = None, vectors_path: Optional[str] = None):
+    """حذف ملفات جيل مخازن لم تعد أي نسخة محفوظة تستخدمه
+
+    النسخ المشتركة تُزال من الذاكرة ولا تُغلق: القراء الذين ما زالوا يستخدمونها يقرؤون
+    الملفات المفتوحة حتى ينتهوا.
+    """
+    db_path = store_path(db_path or Config.FAISS_METADATA_DB_PATH, stores)
+    chunks_path = store_path(chunks_path or Config.FAISS_CHUNKS_PATH, stores)
+    vectors_path = store_path(vectors_path or Config.FAISS_VECTORS_PATH, stores)
+    with _lock:
+        for key in (("metadata", db_path), ("chunks", chunks_path), ("vectors", vectors_path)):
+            _resources.pop(key, None)
+
+    chunk_store = ChunkStore(chunks_path)
+    for path in (db_path, chunk_store.data_path, chunk_store.offsets_path, vectors_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def get_embedding_cache(model_name: Optional[str] = None) -> EmbeddingCache:
+    """ذاكرة التضمينات المشتركة"""
+    model_name = model_name or Config.EMBEDDING_MODEL
+    return _shared(
+        ("embedding_cache", model_name),
+        lambda: EmbeddingCache(Config.EMBEDDING_CACHE_DIR, model_name,
+                               Config.EMBEDDING_CACHE_MAX_ENTRIES)
+    )
+
+
+def clear():
+    """تفريغ الموارد المحملة (للاختبارات أو بعد إعادة بناء كاملة)"""
+    with _lock:
+        _resources.clear()
@@ -0,0 +1,284 @@
+"""
+response_cache.py - ذاكرة دائمة لردود المستشار: تطابق تام للسؤال الموحد ثم تطابق دلالي بالتضمينات
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from embedding_cache import normalize_text
+
+# التشكيل والتطويل وعلامات الترقيم لا تغير معنى السؤال
+_DIACRITICS = re.compile(r"[\u064B-\u0652\u0670\u0640]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي"})
+
+
+def normalize_issue(issue: str) -> str:
+    """توحيد نص القضية قبل حساب المفتاح"""
+    text = _DIACRITICS.sub("", normalize_text(issue).casefold()).translate(_LETTERS)
+    return re.sub(r"\s+", " ", _PUNCTUATION.sub(" ", text)).strip()
+
+
+def cache_scope(country: str, institutions: List[str]) -> str:
+    """نطاق البحث: الدولة والمؤسسات المختارة (بترتيب ثابت)"""
+    return "\0".join([country or ""] + sorted(institutions or []))
+
+
+class ResponseCache:
+    """ردود سابقة في SQLite مع فهرس FAISS صغير لكل نطاق (دولة + مؤسسات)
+
+    - التطابق التام: بصمة النطاق مع السؤال الموحد.
+    - التطابق الدلالي: أقرب سؤال سابق في نفس النطاق بتشابه جيب التمام ≥ threshold
+      (التضمينات من نموذج الفهرسة نفسه عبر encode_fn).
+    - الإخلاء: المدخلات الأقدم من ttl، ثم الأقدم استخداماً عند تجاوز max_entries.
+
+    الفهرس الدلالي يُبنى من SQLite المشترك، ويُحدّث قبل كل بحث إذا تغير عدد الصفوف أو آخر
+    معرف (ردود حفظتها أو أخلتها عمليات أخرى).
+    """
+
+    def __init__(self, db_path: str, encode_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 threshold: float = 0.92, ttl: float = 7 * 24 * 3600.0, max_entries: int = 5000,
+                 semantic: bool = True):
+        self.db_path = db_path
+        self.encode_fn = encode_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic and encode_fn is not None
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._indexes: Optional[Dict[str, faiss.IndexIDMap2]] = None
+        # (عدد الصفوف، آخر معرف) كما يعكسها الفهرس الدلالي
+        self._indexed: Optional[tuple] = None
+
+    def key(self, scope: str, issue: str) -> str:
+        return hashlib.sha1(f"{scope}\0{normalize_issue(issue)}".encode('utf-8')).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY,
+                key TEXT UNIQUE,
+                scope TEXT,
+                issue TEXT,
+                response TEXT,
+                embedding BLOB,
+                created REAL,
+                last_used REAL,
+                hits INTEGER DEFAULT 0
+            )
+            ''')
+            self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER
+            )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def _table_version(self, conn: sqlite3.Connection) -> tuple:
+        count, last_id = conn.execute('SELECT COUNT(*), MAX(id) FROM responses').fetchone()
+        return count, last_id or 0
+
+    def _semantic_indexes(self, conn: sqlite3.Connection) -> Dict[str, faiss.IndexIDMap2]:
+        """فهرس لكل نطاق من التضمينات المخزنة، متزامن مع ما كتبته كل العمليات"""
+        version = self._table_version(conn)
+        if self._indexes is not None and version == self._indexed:
+            return self._indexes
+
+        if self._indexes is not None:
+            # ردود أضافتها عمليات أخرى فقط: تُضاف الصفوف الجديدة إلى الفهرس الحالي
+            rows = conn.execute('SELECT id, scope, embedding FROM responses WHERE id > ?',
+                                (self._indexed[1],)).fetchall()
+            if self._indexed[0] + len(rows) != version[0]:
+                # صفوف حُذفت أيضاً: إعادة البناء
+                self._indexes = None
+
+        if self._indexes is None:
+            self._indexes = {}
+            rows = conn.execute('SELECT id, scope, embedding FROM responses').fetchall()
+
+        for row_id, scope, blob in rows:
+            if blob is not None:
+                self._add_vector(scope, row_id, np.frombuffer(blob, dtype='float32'))
+        self._indexed = version
+        return self._indexes
+
+    def _add_vector(self, scope: str, row_id: int, vector: np.ndarray):
+        index = self._indexes.get(scope)
+        if index is None:
+            index = self._indexes[scope] = faiss.IndexIDMap2(faiss.IndexFlatIP(len(vector)))
+        if index.d == len(vector):
+            index.add_with_ids(vector.reshape(1, -1), np.asarray([row_id], dtype='int64'))
+
+    def _embed(self, issue: str) -> np.ndarray:
+        vector = np.asarray(self.encode_fn([normalize_issue(issue)]), dtype='float32').reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector[0]
+
+    def _count(self, conn: sqlite3.Connection, name: str):
+        conn.execute('''
+        INSERT INTO stats (name, value) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET value = value + 1
+        ''', (name,))
+
+    def lookup(self, country: str, institutions: List[str], issue: str) -> Dict:
+        """{"response": الرد أو None، "tier": exact|semantic|None، "similarity"، "embedding"}
+
+        التضمين المحسوب يُعاد لتمريره إلى put() عند الإخفاق فلا يُحسب مرتين.
+        """
+        scope = cache_scope(country, institutions)
+        key = self.key(scope, issue)
+        now = time.time()
+        result = {"response": None, "tier": None, "similarity": None, "embedding": None}
+
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute('SELECT id, response FROM responses WHERE key = ? AND created >= ?',
+                               (key, now - self.ttl)).fetchone()
+            if row is not None:
+                result.update(response=json.loads(row[1]), tier="exact", similarity=1.0)
+                return self._hit(conn, row[0], "exact", now, result)
+
+        if self.semantic:
+            # النموذج يعمل خارج القفل
+            embedding = self._embed(issue)
+            result["embedding"] = embedding
+
+            with self._lock:
+                conn = self._connection()
+                index = self._semantic_indexes(conn).get(scope)
+                if index is not None and index.ntotal and index.d == len(embedding):
+                    similarities, ids = index.search(embedding.reshape(1, -1), min(5, index.ntotal))
+                    for similarity, row_id in zip(similarities[0], ids[0]):
+                        if row_id < 0 or similarity < self.threshold:
+                            break
+                        row = conn.execute(
+                            'SELECT response FROM responses WHERE id = ? AND created >= ?',
+                            (int(row_id), now - self.ttl)).fetchone()
+                        if row is not None:
+                            result.update(response=json.loads(row[0]), tier="semantic",
+                                          similarity=float(similarity))
+                            return self._hit(conn, int(row_id), "semantic", now, result)
+
+        with self._lock:
+            conn = self._connection()
+            self._count(conn, "misses")
+            conn.commit()
+        return result
+
+    def _hit(self, conn: sqlite3.Connection, row_id: int, tier: str, now: float, result: Dict) -> Dict:
+        conn.execute('UPDATE responses SET last_used = ?, hits = hits + 1 WHERE id = ?', (now, row_id))
+        self._count(conn, f"{tier}_hits")
+        conn.commit()
+        return result
+
+    def put(self, country: str, institutions: List[str], issue: str, response: Dict,
+            embedding: Optional[np.ndarray] = None):
+        """حفظ رد جديد ثم إخلاء المنتهي والزائد"""
+        scope = cache_scope(country, institutions)
+        if self.semantic and embedding is None:
+            embedding = self._embed(issue)
+        now = time.time()
+
+        with self._lock:
+            conn = self._connection()
+            # معاملة الكتابة تبدأ قبل مزامنة الفهرس: لا تدخل كتابات العمليات الأخرى بين
+            # قراءة صفوفها وتسجيل النسخة التي يعكسها الفهرس
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self._indexes is not None:
+                    # ردود العمليات الأخرى أولاً، ثم يُحدث الفهرس بكتابة هذه العملية
+                    self._semantic_indexes(conn)
+                old = conn.execute('SELECT id FROM responses WHERE key = ?',
+                                   (self.key(scope, issue),)).fetchone()
+                if old is not None:
+                    self._remove(conn, [old[0]])
+
+                cursor = conn.execute('''
+                INSERT INTO responses (key, scope, issue, response, embedding, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (self.key(scope, issue), scope, issue, json.dumps(response, ensure_ascii=False),
+                      embedding.astype('float32').tobytes() if embedding is not None else None, now, now))
+                if self._indexes is not None and embedding is not None:
+                    self._add_vector(scope, cursor.lastrowid, np.asarray(embedding, dtype='float32'))
+
+                self._evict(conn, now)
+                if self._indexes is not None:
+                    self._indexed = self._table_version(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                # الفهرس قد يحوي صفوفاً لم تُحفظ
+                self._indexes = None
+                self._indexed = None
+                raise
+
+    def _remove(self, conn: sqlite3.Connection, row_ids: List[int]):
+        if not row_ids:
+            return
+        conn.executemany('DELETE FROM responses WHERE id = ?', [(row_id,) for row_id in row_ids])
+        if self._indexes is not None:
+            ids = np.asarray(row_ids, dtype='int64')
+            for index in self._indexes.values():
+                index.remove_ids(ids)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        expired = [row[0] for row in conn.execute('SELECT id FROM responses WHERE created < ?',
+                                                  (now - self.ttl,))]
+        self._remove(conn, expired)
+
+        excess = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._remove(conn, [row[0] for row in conn.execute(
+                'SELECT id FROM responses ORDER BY last_used LIMIT ?', (excess,))])
+
+    def statistics(self) -> Dict:
+        """عدادات الإصابة لكل مستوى (محفوظة، فتشمل كل العمليات) وعدد المدخلات"""
+        with self._lock:
+            conn = self._connection()
+            counts = dict(conn.execute('SELECT name, value FROM stats').fetchall())
+            entries = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+        exact = counts.get("exact_hits", 0)
+        semantic = counts.get("semantic_hits", 0)
+        total = exact + semantic + counts.get("misses", 0)
+        return {
+            'exact_hits': exact,
+            'semantic_hits': semantic,
+            'misses': counts.get("misses", 0),
+            'hit_rate': (exact + semantic) / total if total else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries
+        }
+
+    def clear(self):
+        """حذف كل الردود المخزنة (بعد تغيير المزودين أو الموجه مثلاً)"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute('DELETE FROM responses')
+            conn.commit()
+            self._indexes = None
+            self._indexed = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._indexes = None
+            self._indexed = None
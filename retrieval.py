@@ -2,27 +2,65 @@
 
 Usage:
     from retrieval import Retriever
-    r = Retriever('faiss.index', 'metadata.json')
+    r = Retriever()  # or Retriever('path/to/snapshots')
     r.query('نص السؤال', top_k=3)
+
+The index is read from the currently published snapshot, and metadata and passage
+``text`` from that snapshot's store generation (see ``snapshots`` and ``resources``).
+A legacy ``metadata.json`` and an index saved outside the snapshots directory are
+migrated once, as ``RetrievalEngine`` does.
+The model and index are shared per process and loaded on first query; a newer
+published snapshot is picked up by the next query.
 """
-import json
-from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
+import resources
+from config import Config
+from snapshots import SnapshotStore
 
 
 class Retriever:
-    def __init__(self, index_path='faiss.index', meta_path='metadata.json', model_name='all-MiniLM-L6-v2'):
-        self.model = SentenceTransformer(model_name)
-        self.index = faiss.read_index(index_path)
-        with open(meta_path, 'r', encoding='utf-8') as f:
-            self.meta = json.load(f)
+    def __init__(self, snapshots_dir=None, model_name='all-MiniLM-L6-v2'):
+        self.model_name = model_name
+        self.snapshots = SnapshotStore(snapshots_dir or Config.FAISS_SNAPSHOTS_DIR)
+        resources.get_metadata_store(Config.FAISS_METADATA_DB_PATH).migrate_from_json(
+            Config.FAISS_METADATA_PATH)
+        self.snapshots.import_legacy(Config.FAISS_INDEX_PATH, Config.FAISS_PARTITIONS_DIR,
+                                     Config.LEXICAL_INDEX_DIR, Config.FAISS_MANIFEST_PATH)
+
+    @property
+    def model(self):
+        return resources.get_embedding_model(self.model_name)
+
+    def _state(self) -> resources.LoadedSnapshot:
+        """The published snapshot with the stores its ids point into."""
+        generation = self.snapshots.current_generation()
+        if generation is None:
+            raise FileNotFoundError(f"no published index snapshot in {self.snapshots.root}")
+        return resources.get_snapshot(self.snapshots.root, generation,
+                                      index_type=Config.FAISS_INDEX_TYPE,
+                                      index_params=Config.FAISS_INDEX_PARAMS)
+
+    @property
+    def index(self):
+        return self._state().index
 
     def query(self, text, top_k=3):
-        emb = self.model.encode([text], convert_to_numpy=True)
-        D, I = self.index.search(emb, top_k)
-        results = []
-        for score, idx in zip(D[0], I[0]):
-            m = self.meta[idx]
-            results.append({'score': float(score), 'source': m['source'], 'chunk': m['chunk']})
-        return results
+        return self.query_many([text], top_k=top_k)[0]
+
+    def query_many(self, texts, top_k=3):
+        """Encode all texts in one batch and run a single FAISS search."""
+        state = self._state()
+        emb = self.model.encode(list(texts), convert_to_numpy=True)
+        D, I = state.index.search(emb, top_k)
+        metas = state.metadata_store.get_many(np.unique(I[I >= 0]))
+        all_results = []
+        for scores, ids in zip(D.tolist(), I.tolist()):
+            results = []
+            for score, idx in zip(scores, ids):
+                m = metas.get(idx)
+                if m is None:
+                    continue
+                results.append({'score': score, 'source': m['source'], 'chunk': m['chunk'],
+                                'text': state.chunk_store.get(idx)})
+            all_results.append(results)
+        return all_results
@@ -4,140 +4,482 @@ retrieval_engine.py - محرك البحث والفهرسة
 
 import json
 import os
-from typing import List, Dict
-from sentence_transformers import SentenceTransformer
-import faiss
+import shutil
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
 import numpy as np
+import resources
+from chunker import chunk_text
 from config import Config
+from embedding_pipeline import EmbeddingPipeline
+from index_factory import rescore
+from index_shards import ShardedIndex, create_snapshot_index, load_snapshot_index, save_snapshot_index
+from lexical_index import LexicalIndex, LexicalIndexBuilder, build_from_stores, reciprocal_rank_fusion
+from shard_service import RemoteShardedIndex
+from snapshots import INDEX_FILE, PARTITIONS_DIR, SnapshotStore, new_stores
 
 class RetrievalEngine:
     """محرك البحث الذكي باستخدام FAISS"""
     
     def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.index = None
-        self.metadata = []
-        self.load_index()
+        # الفهارس تُقرأ من آخر نسخة منشورة، وتُستبدل بين الاستعلامات عند نشر نسخة أحدث
+        # البيانات الوصفية للأجزاء المحذوفة تبقى حتى حذف آخر نسخة تستخدمها،
+        # وملفات جيل المخازن السابق تُحذف مع آخر نسخة منه
+        self.snapshots = SnapshotStore(Config.FAISS_SNAPSHOTS_DIR, Config.FAISS_SNAPSHOTS_KEEP,
+                                       release=resources.release_ids, retire=resources.retire_stores)
+        self._state: Optional[resources.LoadedSnapshot] = None
+        self._reload_lock = threading.Lock()
+        self._failed_generation = None
+        # تضمينات النصوص والاستعلامات المتكررة تُقرأ من القرص بدلاً من إعادة حسابها
+        self.embedding_cache = resources.get_embedding_cache(Config.EMBEDDING_MODEL)
+        # نموذج إعادة الترتيب يُحمّل عند الإقلاع لا داخل ميزانية أول طلب
+        if Config.RERANK_ENABLED:
+            resources.get_reranker(Config.RERANK_MODEL)
+    
+    @property
+    def model(self):
+        """نموذج التضمين المشترك"""
+        return resources.get_embedding_model(Config.EMBEDDING_MODEL)
+    
+    @property
+    def index(self):
+        """فهرس النسخة الحالية (يُحمّل عند أول استخدام)"""
+        return self._current_state().index
+    
+    def _current_state(self) -> resources.LoadedSnapshot:
+        """فهارس النسخة المنشورة؛ النسخة الأحدث تُحمّل في الخلفية دون إيقاف البحث"""
+        state = self._state
+        if state is None:
+            self.load_index()
+            return self._state
+        
+        generation = self.snapshots.current_generation()
+        if generation != state.generation and generation != self._failed_generation:
+            if self._reload_lock.acquire(blocking=False):
+                threading.Thread(target=self._reload, args=(generation,), daemon=True).start()
+        
+        # الاستعلامات الجارية والجديدة تستخدم النسخة القديمة حتى يكتمل التحميل
+        return state
+    
+    @property
+    def metadata_store(self):
+        """البيانات الوصفية (SQLite) لجيل مخازن النسخة الحالية، تُقرأ حسب معرف FAISS عند الحاجة"""
+        return self._current_state().metadata_store
+    
+    @property
+    def chunk_store(self):
+        """النص الكامل لكل جزء من ملف مربوط بالذاكرة (جيل مخازن النسخة الحالية)"""
+        return self._current_state().chunk_store
+    
+    @property
+    def vector_store(self):
+        """المتجهات الأصلية على القرص لإعادة الحساب الدقيق فوق الفهارس المضغوطة"""
+        return self._current_state().vector_store
+    
+    def _load_snapshot(self, generation: str) -> resources.LoadedSnapshot:
+        return resources.get_snapshot(
+            Config.FAISS_SNAPSHOTS_DIR,
+            generation,
+            index_type=Config.FAISS_INDEX_TYPE,
+            index_params=Config.FAISS_INDEX_PARAMS
+        )
+    
+    def _reload(self, generation: str):
+        """تحميل نسخة جديدة ثم استبدال الحالة بتعيين واحد"""
+        try:
+            self._state = self._load_snapshot(generation)
+            print(f"🔄 تم تحميل نسخة الفهرس الجديدة: {generation} ({self._state.index.ntotal} مستند)")
+        except Exception as e:
+            self._failed_generation = generation
+            print(f"❌ خطأ في تحميل نسخة الفهرس {generation}: {e}")
+        finally:
+            self._reload_lock.release()
     
     def load_index(self):
         """تحميل الفهرس إذا كان موجوداً"""
+        generation = None
         try:
-            if os.path.exists(Config.FAISS_INDEX_PATH):
-                self.index = faiss.read_index(Config.FAISS_INDEX_PATH)
-                
-                with open(Config.FAISS_METADATA_PATH, 'r', encoding='utf-8') as f:
-                    self.metadata = json.load(f)
-                    
-                print(f"✅ تم تحميل الفهرس: {len(self.metadata)} مستند")
+            # ترحيل metadata.json والفهرس القديم خارج مجلد النسخ مرة واحدة
+            resources.get_metadata_store(Config.FAISS_METADATA_DB_PATH).migrate_from_json(
+                Config.FAISS_METADATA_PATH)
+            self.snapshots.import_legacy(Config.FAISS_INDEX_PATH, Config.FAISS_PARTITIONS_DIR,
+                                         Config.LEXICAL_INDEX_DIR, Config.FAISS_MANIFEST_PATH)
+            
+            generation = self.snapshots.current_generation()
+            if generation is not None:
+                # تحميل الفهرس العام وفهارس الدول (تُبنى من الفهرس العام إذا لم تكن محفوظة)
+                self._state = self._load_snapshot(generation)
+                print(f"✅ تم تحميل الفهرس: {self._state.index.ntotal} مستند "
+                      f"في {len(self._state.index.partition_sizes())} دولة")
             else:
+                self._state = resources.LoadedSnapshot(None)
                 print("⚠️ الفهرس غير موجود، سيتم إنشاء فهرس جديد عند الحاجة")
         except Exception as e:
+            self._failed_generation = generation
+            self._state = resources.LoadedSnapshot(generation)
             print(f"❌ خطأ في تحميل الفهرس: {e}")
     
-    def search(self, query: str, country: str = None, top_k: int = 5) -> List[Dict]:
-        """بحث عن قوانين ذات صلة"""
+    def search(self, query: str, country: str = None, top_k: int = 5,
+               nprobe: int = None, ef_search: int = None, mode: str = None,
+               rerank: bool = None) -> List[Dict]:
+        """بحث عن قوانين ذات صلة
+
+        nprobe و ef_search يضبطان دقة/سرعة الفهارس التقريبية لهذا الاستعلام فقط.
+        mode: vector | lexical | hybrid (الافتراضي Config.SEARCH_MODE).
+        rerank: إعادة ترتيب المرشحين بنموذج cross-encoder (الافتراضي Config.RERANK_ENABLED).
+        """
+        return self.search_many([query], country=country, top_k=top_k,
+                                nprobe=nprobe, ef_search=ef_search, mode=mode,
+                                rerank=rerank)[0]
+    
+    def search_many(self, queries: List[str], country: str = None, top_k: int = 5,
+                    nprobe: int = None, ef_search: int = None, mode: str = None,
+                    rerank: bool = None) -> List[List[Dict]]:
+        """بحث لعدة استعلامات دفعة واحدة: تضمين واحد وبحث FAISS واحد لكل الاستعلامات
+
+        في الوضع الهجين يُدمج ترتيب FAISS مع ترتيب BM25 بـ Reciprocal Rank Fusion،
+        فتظهر المواد التي تطابق أرقامها أو مصطلحاتها حرفياً حتى لو ضعف تشابهها الدلالي.
+        الترتيب حسب درجة الدمج ('rrf_score')، و'score' يبقى التشابه الدلالي كما في الوضع vector.
+        """
         
-        if not self.index or len(self.metadata) == 0:
+        if not queries:
             return []
         
-        # تضمين الاستعلام
-        query_embedding = self.model.encode([query], convert_to_numpy=True)
-        
-        # البحث في الفهرس
-        distances, indices = self.index.search(query_embedding, top_k)
-        
-        # تجميع النتائج
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx < len(self.metadata):
-                meta = self.metadata[idx]
-                
-                # تصفية حسب الدولة إذا تم تحديدها
-                if country and 'country' in meta and meta['country'] != country:
-                    continue
-                
-                results.append({
-                    'score': float(1 / (1 + dist)),  # تحويل المسافة إلى درجة تشابه
-                    'source': meta.get('source', ''),
-                    'chunk': meta.get('chunk', ''),
-                    'title': meta.get('title', ''),
-                    'preview': meta.get('preview', '')[:200]
-                })
-        
-        # ترتيب حسب الدرجة
-        results.sort(key=lambda x: x['score'], reverse=True)
-        
-        return results
+        if rerank is None:
+            rerank = Config.RERANK_ENABLED
+        
+        # إعادة الترتيب تحتاج مرشحين أكثر من عدد النتائج المطلوبة
+        final_k = top_k
+        if rerank:
+            top_k = max(top_k, Config.RERANK_CANDIDATES)
+        
+        # نسخة واحدة لكل الدفعة حتى لو نُشرت نسخة أحدث أثناء البحث
+        state = self._current_state()
+        
+        mode = mode or Config.SEARCH_MODE
+        lexical = state.lexical if mode != "vector" else None
+        if lexical is None:
+            # فهرس BM25 غير مبني بعد
+            mode = "vector"
+        
+        candidates = top_k * Config.HYBRID_CANDIDATES if mode == "hybrid" else top_k
+        
+        vector_rankings = self._vector_rankings(state, queries, country, candidates,
+                                                nprobe, ef_search) \
+            if mode != "lexical" else None
+        lexical_rankings = [self._lexical_ranking(lexical, query, country, candidates)
+                            for query in queries] if mode != "vector" else None
+        
+        fused_scores = None
+        if mode == "vector":
+            rankings = vector_rankings
+        elif mode == "lexical":
+            rankings = lexical_rankings
+        else:
+            rankings, fused_scores = [], []
+            for query, vector, lexical_hits in zip(queries, vector_rankings, lexical_rankings):
+                fused = reciprocal_rank_fusion(
+                    [[idx for idx, _ in vector], [idx for idx, _ in lexical_hits]], Config.RRF_K)[:top_k]
+                similarities = dict(vector)
+                missing = [idx for idx, _ in fused if idx not in similarities]
+                if missing:
+                    # نتائج BM25 فقط: تشابهها الدلالي من المتجهات الأصلية
+                    similarities.update(self._similarities(state, query, missing))
+                rankings.append([(idx, similarities.get(idx, 0.0)) for idx, _ in fused])
+                fused_scores.append(dict(fused))
+        
+        results = self._materialize(state, rankings)
+        if fused_scores is not None:
+            for query_results, fused in zip(results, fused_scores):
+                for result in query_results:
+                    result['rrf_score'] = fused[result['id']]
+        
+        if rerank:
+            # ميزانية زمنية واحدة للطلب كله مهما كان عدد الاستعلامات
+            reranker = resources.get_reranker(Config.RERANK_MODEL)
+            deadline = time.perf_counter() + reranker.budget_ms / 1000.0
+            results = [reranker.rerank(query, candidates, deadline)
+                       for query, candidates in zip(queries, results)]
+        
+        return [candidates[:final_k] for candidates in results]
+    
+    def _vector_rankings(self, state, queries: List[str], country: str, top_k: int,
+                         nprobe: int = None, ef_search: int = None) -> List[List[Tuple[int, float]]]:
+        """ترتيب FAISS لكل استعلام: [(معرف الجزء، درجة التشابه)]
+
+        state.index: PartitionedIndex، أو فهرس مقسم يوزع البحث على خوادم الأجزاء ويدمج نتائجها.
+        """
+        
+        index = state.index
+        if not index or index.ntotal == 0:
+            return [[] for _ in queries]
+        
+        # تضمين الاستعلامات دفعة واحدة
+        query_embeddings = self.embedding_cache.encode(
+            queries, lambda texts: self.model.encode(texts, convert_to_numpy=True)
+        )
+        
+        # الفهارس المضغوطة: مرشحون أكثر ثم مسافات دقيقة من المتجهات الأصلية على القرص
+        rescore_factor = Config.FAISS_RESCORE_FACTOR \
+            if index.quantized and len(state.vector_store) else 1
+        
+        # البحث في فهرس الدولة مباشرة بدلاً من تصفية نتائج الفهرس العام
+        distances, indices = index.search(query_embeddings, top_k * max(rescore_factor, 1), country,
+                                          nprobe=nprobe, ef_search=ef_search)
+        
+        rankings = []
+        for row in range(len(queries)):
+            valid = indices[row] >= 0
+            row_ids, row_distances = indices[row][valid], distances[row][valid]
+            
+            if rescore_factor > 1:
+                vectors = state.vector_store.get_many(row_ids)
+                # أجزاء فُهرست قبل حفظ المتجهات الأصلية ليس لها صفوف؛ يبقى ترتيب FAISS لها
+                if vectors.any(axis=1).all():
+                    row_distances, row_ids = rescore(vectors, query_embeddings[row], row_ids, top_k)
+            
+            row_ids, row_distances = row_ids[:top_k], row_distances[:top_k]
+            
+            # تحويل المسافات إلى درجات تشابه
+            scores = 1.0 / (1.0 + np.maximum(row_distances, 0))
+            rankings.append(list(zip(row_ids.tolist(), scores.tolist())))
+        
+        return rankings
+    
+    def _similarities(self, state, query: str, ids: List[int]) -> Dict[int, float]:
+        """درجة التشابه (نفس تحويل FAISS) لأجزاء لم ترد في ترتيب المتجهات"""
+        vectors = state.vector_store.get_many(ids)
+        if vectors.shape[1] == 0:
+            return {}
+        embedding = self.embedding_cache.encode(
+            [query], lambda texts: self.model.encode(texts, convert_to_numpy=True)
+        )[0]
+        distances = ((vectors - embedding) ** 2).sum(axis=1)
+        return {idx: float(1.0 / (1.0 + distance))
+                for idx, distance, found in zip(ids, distances, vectors.any(axis=1)) if found}
+    
+    def _lexical_ranking(self, lexical, query: str, country: str,
+                         top_k: int) -> List[Tuple[int, float]]:
+        """ترتيب BM25 لاستعلام واحد: [(معرف الجزء، درجة BM25)]"""
+        ids, scores = lexical.search(query, top_k, country)
+        return list(zip(ids.tolist(), scores.tolist()))
+    
+    def _materialize(self, state, rankings: List[List[Tuple[int, float]]]) -> List[List[Dict]]:
+        """تحويل المعرفات المرتبة إلى نتائج مع قراءة البيانات الوصفية لكل النتائج في استعلام واحد"""
+        
+        metadata = state.metadata_store.get_many(
+            sorted({idx for ranking in rankings for idx, _ in ranking})
+        )
+        
+        all_results = []
+        for ranking in rankings:
+            results = []
+            for idx, score in ranking:
+                meta = metadata.get(idx)
+                if meta:
+                    results.append({
+                        'id': idx,
+                        'score': score,
+                        'source': meta.get('source', ''),
+                        'chunk': meta.get('chunk', ''),
+                        'title': meta.get('title', ''),
+                        'article': meta.get('article', ''),
+                        'section': meta.get('section', ''),
+                        'preview': meta.get('preview', '')[:200],
+                        'text': state.chunk_store.get(idx)
+                    })
+            all_results.append(results)
+        
+        return all_results
     
     def index_documents(self, documents: List[Dict]):
         """فهرسة مستندات جديدة"""
         
-        texts = []
-        metas = []
+        # الأجزاء تُضاف إلى جيل مخازن النسخة المنشورة، أو إلى جيل جديد للفهرس الأول
+        current = self.snapshots.current()
+        stores = current.stores if current is not None else new_stores()
+        metadata_store, chunk_store, vector_store = resources.get_stores(stores)
+        
+        # المعرفات لا يعاد استخدامها بعد حذف أجزاء من الفهرس
+        start_id = max(metadata_store.next_id(), len(chunk_store))
+        
+        def iter_chunks():
+            """تقسيم المستندات إلى مواد عند الحاجة بدلاً من تجميعها كلها في الذاكرة"""
+            chunk_id = start_id
+            for doc in documents:
+                for i, (chunk, info) in enumerate(chunk_text(doc['content'], Config.CHUNK_MAX_WORDS)):
+                    yield chunk_id, chunk, {
+                        'source': doc.get('source', 'unknown'),
+                        'country': doc.get('country', ''),
+                        'title': doc.get('title', ''),
+                        'chunk': i,
+                        'article': info['article'],
+                        'section': info['section'],
+                        'preview': chunk[:100]
+                    }
+                    chunk_id += 1
         
-        for doc in documents:
-            # تقسيم النص إلى أجزاء
-            chunks = self._chunk_text(doc['content'])
+        # نسخة خاصة قابلة للكتابة؛ الفهرس المشترك قد يكون مربوطاً بالذاكرة للقراءة فقط
+        index = None
+        if current is not None:
+            index = load_snapshot_index(
+                current,
+                countries_loader=metadata_store.countries_by_id,
+                index_type=Config.FAISS_INDEX_TYPE,
+                index_params=Config.FAISS_INDEX_PARAMS
+            )
+        
+        # قوائم BM25 للأجزاء الجديدة فقط، تُدمج مع فهرس النسخة الحالية عند النشر
+        lexical = LexicalIndexBuilder()
+        
+        def write_batch(ids, texts, metas, embeddings):
+            nonlocal index
+            # إنشاء أو تحديث الفهرس (العام وفهارس الدول، أو الأجزاء)
+            if index is None:
+                index = create_snapshot_index(embeddings.shape[1], Config.FAISS_INDEX_TYPE,
+                                              Config.FAISS_INDEX_PARAMS,
+                                              Config.FAISS_SHARDS, Config.FAISS_SHARD_BY)
             
-            for i, chunk in enumerate(chunks):
-                texts.append(chunk)
-                metas.append({
-                    'source': doc.get('source', 'unknown'),
-                    'country': doc.get('country', ''),
-                    'title': doc.get('title', ''),
-                    'chunk': i,
-                    'preview': chunk[:100]
-                })
-        
-        # تضمين النصوص
-        embeddings = self.model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
-        
-        # إنشاء أو تحديث الفهرس
-        if self.index is None:
-            dim = embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dim)
-        
-        self.index.add(embeddings)
-        self.metadata.extend(metas)
-        
-        # حفظ الفهرس
-        self._save_index()
-        
-        return len(texts)
-    
-    def _chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """تقسيم النص إلى أجزاء متداخلة"""
-        words = text.split()
-        chunks = []
-        
-        i = 0
-        while i < len(words):
-            chunk = " ".join(words[i:i + chunk_size])
-            chunks.append(chunk)
-            i += chunk_size - overlap
-        
-        return chunks
-    
-    def _save_index(self):
-        """حفظ الفهرس والبيانات الوصفية"""
-        try:
-            # حفظ الفهرس
-            faiss.write_index(self.index, Config.FAISS_INDEX_PATH)
+            countries = [meta['country'] for meta in metas]
+            index.add(embeddings, countries, ids=ids)
+            lexical.add(ids, texts, countries)
             
-            # حفظ البيانات الوصفية
-            with open(Config.FAISS_METADATA_PATH, 'w', encoding='utf-8') as f:
-                json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+            # إضافة البيانات الوصفية والنصوص الجديدة فقط بدلاً من إعادة كتابة الملفات كاملة
+            # (تُكتب قبل نشر النسخة، فكل معرف في النسخة المنشورة له بياناته)
+            chunk_store.append(texts, ids)
+            vector_store.append(ids, embeddings)
+            metadata_store.append(metas, ids)
+        
+        with EmbeddingPipeline(self.model, batch_size=Config.EMBED_BATCH_SIZE,
+                               workers=Config.EMBED_WORKERS,
+                               write_batch_size=Config.INDEX_WRITE_BATCH,
+                               cache=self.embedding_cache) as pipeline:
+            total = pipeline.run(iter_chunks(), write_batch)
+        
+        if total:
+            index.set_search_params(nprobe=Config.FAISS_NPROBE, ef_search=Config.FAISS_EF_SEARCH)
+            
+            # نشر نسخة جديدة تضم الفهرس وفهرس BM25 بعد دمج الأجزاء الجديدة فيه
+            self._publish_snapshot(index, lexical, current, stores)
+        
+        return total
+    
+    def _publish_snapshot(self, index, lexical: LexicalIndexBuilder, previous=None,
+                          stores: Optional[str] = None):
+        """كتابة نسخة كاملة في مجلد مؤقت ثم نشرها بتبديل المؤشر (البيانات الوصفية محفوظة عند إضافتها)"""
+        snapshot = self.snapshots.begin()
+        try:
+            save_snapshot_index(index, snapshot)
+            if previous is None:
+                lexical.save(snapshot.lexical_dir)
+            elif LexicalIndex.exists(previous.lexical_dir):
+                lexical.save(snapshot.lexical_dir, previous=LexicalIndex(previous.lexical_dir))
+            else:
+                # نسخة أنشئت قبل إضافة BM25: بناء كامل مرة واحدة
+                metadata_store, chunk_store, _ = resources.get_stores(stores)
+                build_from_stores(metadata_store, chunk_store, snapshot.lexical_dir)
+            # سجل أداة الفهرسة (ومعه جيل المخازن) وتقرير أنواع الفهارس ينتقلان مع النسخة
+            # (بدون نطاقات المعرفات التي أخرجتها النسخة السابقة، فهذه النسخة لم تحذف شيئاً)
+            manifest = {"stores": stores} if stores else None
+            if previous is not None and os.path.exists(previous.manifest_path):
+                with open(previous.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                manifest.pop("retired", None)
+            if manifest is not None:
+                with open(snapshot.manifest_path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+            if previous is not None and os.path.exists(previous.quality_path):
+                shutil.copy2(previous.quality_path, snapshot.quality_path)
             
-            print(f"✅ تم حفظ الفهرس: {len(self.metadata)} مستند")
+            snapshot = self.snapshots.publish(snapshot)
         except Exception as e:
+            self.snapshots.abort(snapshot)
             print(f"❌ خطأ في حفظ الفهرس: {e}")
+            return
+        
+        # هذا المحرك يستخدم النسخة الجديدة فوراً؛ المحركات الأخرى تحمّلها عند استعلامها التالي
+        if isinstance(index, ShardedIndex) and Config.FAISS_SHARD_SERVERS:
+            # الأجزاء تُخدم من خوادمها؛ هذه العملية لا تبقي المتجهات في ذاكرتها
+            self._state = self._load_snapshot(snapshot.generation)
+        else:
+            lexical = LexicalIndex(snapshot.lexical_dir) if LexicalIndex.exists(snapshot.lexical_dir) else None
+            self._state = resources.LoadedSnapshot(snapshot.generation, index, lexical, snapshot, stores)
+        print(f"✅ تم حفظ الفهرس: {index.ntotal} مستند (النسخة {snapshot.generation})")
+    
+    def _memory_footprint(self, state) -> Dict:
+        """حجم الفهارس المحملة مقابل المتجهات الأصلية على القرص (MB)
+
+        حجم ملف الفهرس المحفوظ يساوي تقريباً حجمه في الذاكرة.
+        """
+        if state.index is None or state.snapshot is None:
+            return {}
+        
+        def files_mb(*paths) -> float:
+            return sum(os.path.getsize(path) for path in paths if os.path.exists(path)) / (1024 * 1024)
+        
+        def dir_mb(directory: str) -> float:
+            return files_mb(*[os.path.join(directory, name) for name in os.listdir(directory)]) \
+                if os.path.isdir(directory) else 0.0
+        
+        snapshot = state.snapshot
+        if snapshot.is_sharded:
+            # فهرس عام وفهارس دول لكل جزء، كل منها في ذاكرة خادمه
+            shard_dirs = sorted(os.path.join(snapshot.shards_dir, name)
+                                for name in os.listdir(snapshot.shards_dir)
+                                if os.path.isdir(os.path.join(snapshot.shards_dir, name)))
+            shards_mb = [files_mb(os.path.join(path, INDEX_FILE)) for path in shard_dirs]
+            global_mb = sum(shards_mb)
+            partitions_mb = sum(dir_mb(os.path.join(path, PARTITIONS_DIR)) for path in shard_dirs)
+        else:
+            shards_mb = []
+            global_mb = files_mb(snapshot.index_path)
+            partitions_mb = dir_mb(snapshot.partitions_dir)
+        
+        footprint = {
+            'global_index_mb': global_mb,
+            'partitions_mb': partitions_mb,
+            'bytes_per_vector': global_mb * 1024 * 1024 / state.index.ntotal if state.index.ntotal else 0.0,
+            'vectors_on_disk_mb': state.vector_store.size_mb()
+        }
+        if shards_mb:
+            footprint['shards_mb'] = shards_mb
+        return footprint
+    
+    def _quality_report(self, state) -> Dict:
+        """recall@k والحجم لكل نوع فهرس كما قيسا عند نشر النسخة"""
+        if state.snapshot is None or not os.path.exists(state.snapshot.quality_path):
+            return {}
+        with open(state.snapshot.quality_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _reranker_statistics(self) -> Dict:
+        """حالة إعادة الترتيب بدون إنشائها (الإحصائيات لا تحمّل النموذج)"""
+        reranker = resources.loaded_reranker(Config.RERANK_MODEL)
+        if reranker is None:
+            return {'enabled': Config.RERANK_ENABLED, 'loaded': False}
+        return {'enabled': Config.RERANK_ENABLED, 'loaded': True, **reranker.statistics()}
     
     def get_statistics(self) -> Dict:
         """الحصول على إحصائيات الفهرس"""
-        return {
-            'total_documents': len(self.metadata),
-            'index_type': 'FAISS FlatL2' if self.index else 'غير محمل',
-            'dimensions': self.index.d if self.index else 0,
-            'size_mb': os.path.getsize(Config.FAISS_INDEX_PATH) / (1024 * 1024) 
-                        if os.path.exists(Config.FAISS_INDEX_PATH) else 0
-        }
\ No newline at end of file
+        state = self._current_state()
+        statistics = {
+            'total_documents': state.index.ntotal if state.index else 0,
+            'index_type': state.index.description if state.index else 'غير محمل',
+            'dimensions': state.index.dim if state.index else 0,
+            'partitions': state.index.partition_sizes() if state.index else {},
+            'embedding_cache': self.embedding_cache.statistics(),
+            'reranker': self._reranker_statistics(),
+            'generation': state.generation,
+            'size_mb': state.snapshot.index_size_mb() if state.snapshot else 0,
+            'memory': self._memory_footprint(state),
+            'quantization_report': self._quality_report(state)
+        }
+        if isinstance(state.index, RemoteShardedIndex):
+            statistics['shards'] = {
+                'count': state.index.layout['count'],
+                'by': state.index.layout['by'],
+                'sizes': [shard['ntotal'] for shard in state.index.layout['shards']],
+                **state.index.coordinator.statistics()
+            }
+        return statistics
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+scripts/benchmark_database.py - إنتاجية تسجيل الطلبات مع كتّاب متزامنين: اتصال لكل عملية، المجمع مع WAL، والكتابة المؤجلة
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import argparse
+import threading
+
+# إضافة المسار للأدوات
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database import Database
+
+METRICS = {
+    "model": "DeepSeek", "mode": "hedged", "cache": None, "provider": "deepseek", "attempts": 1,
+    "prompt_tokens": 900, "completion_tokens": 700, "tokens_estimated": False, "cost_usd": 0.001,
+    "lookup_ms": 2.0, "retrieval_ms": 40.0, "prompt_ms": 0.1, "provider_ms": 3500.0,
+    "first_token_ms": 800.0, "total_ms": 3600.0
+}
+
+def record_per_connection(db_path: str, user_id: str, country: str, issue_length: int):
+    """التسجيل كما كان: اتصال جديد بالسجل الافتراضي لكل طلب"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+    INSERT OR IGNORE INTO users (user_id, country, first_seen, last_seen)
+    VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+    ''', (user_id, country))
+    cursor.execute('''
+    UPDATE users SET last_seen = CURRENT_TIMESTAMP, total_requests = total_requests + 1,
+        quota_used = quota_used + 1
+    WHERE user_id = ?
+    ''', (user_id,))
+    cursor.execute('''
+    INSERT INTO requests (user_id, country, issue_length, institutions)
+    VALUES (?, ?, ?, ?)
+    ''', (user_id, country, issue_length, "[]"))
+    conn.commit()
+    conn.close()
+
+def run_writers(record, threads: int, requests: int, finish=None) -> dict:
+    """threads خيطاً يسجل كل منها requests طلباً؛ يعيد الإنتاجية وزمن التسجيل
+
+    finish (اختياري) يُستدعى قبل إيقاف المؤقت: انتظار كتابة الطابور حتى تُقارن الإنتاجية الفعلية.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def writer(n: int):
+        local = []
+        for i in range(requests):
+            start = time.perf_counter()
+            try:
+                record(f"user-{n}-{i % 20}", "Yemen", 300)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if finish is not None:
+        finish()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'writes_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2],
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'errors': len(errors)
+    }
+
+def run_benchmark(threads: int = 8, requests: int = 200, directory: str = None) -> dict:
+    """مقارنة الطرق الثلاث، كل منها على قاعدة جديدة بنفس المخطط"""
+    directory = directory or tempfile.mkdtemp(prefix="adx_db_bench_")
+
+    legacy_path = os.path.join(directory, "legacy.db")
+    wal = Config.DB_WAL
+    Config.DB_WAL = False
+    Database(legacy_path, pool_size=0, write_behind=False)
+    Config.DB_WAL = wal
+
+    pooled = Database(os.path.join(directory, "pooled.db"), write_behind=False)
+    queued = Database(os.path.join(directory, "write_behind.db"), write_behind=True)
+
+    print(f"📊 {threads} كاتب × {requests} طلب، المجلد: {directory}")
+    report = {
+        'per_connection': run_writers(
+            lambda user_id, country, length: record_per_connection(legacy_path, user_id, country, length),
+            threads, requests),
+        'pooled_wal': run_writers(
+            lambda user_id, country, length: pooled.record_usage(user_id, country, length, [], METRICS),
+            threads, requests),
+        'write_behind': run_writers(
+            lambda user_id, country, length: queued.record_usage(user_id, country, length, [], METRICS),
+            threads, requests, finish=queued.flush)
+    }
+    report['write_behind'].update(queued.write_statistics())
+    pooled.close()
+    queued.close()
+
+    for name, row in report.items():
+        print(f"   - {name:<15} {row['writes_per_second']:>8.0f} طلب/ث   "
+              f"p50 {row['p50_ms']:.2f} ms   p99 {row['p99_ms']:.2f} ms   أخطاء القفل: {row['errors']}")
+    print(f"   - دفعات الكتابة المؤجلة: {report['write_behind']['batches']} "
+          f"(متوسط {report['write_behind']['written'] / max(1, report['write_behind']['batches']):.0f} طلب)")
+    report['speedup'] = (report['pooled_wal']['writes_per_second']
+                         / report['per_connection']['writes_per_second'])
+    print(f"   - التسريع (المجمع مقابل اتصال لكل عملية): {report['speedup']:.1f}x")
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="قياس إنتاجية تسجيل الطلبات")
+    parser.add_argument("--threads", type=int, default=8, help="عدد الكتّاب المتزامنين")
+    parser.add_argument("--requests", type=int, default=200, help="طلبات لكل كاتب")
+    parser.add_argument("--dir", default=None, help="مجلد قواعد الاختبار (الافتراضي: مجلد مؤقت)")
+
+    args = parser.parse_args()
+
+    run_benchmark(threads=args.threads, requests=args.requests, directory=args.dir)
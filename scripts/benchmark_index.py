@@ -0,0 +1,81 @@
+"""
+scripts/benchmark_index.py - مقارنة أنواع فهارس FAISS (الدقة مقابل زمن الاستعلام)
+"""
+
+import os
+import sys
+import argparse
+
+# إضافة المسار للأدوات
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+from config import Config
+from index_factory import INDEX_TYPES, evaluate_index_modes, index_vectors
+from index_shards import load_snapshot_index
+from snapshots import SnapshotStore
+
+def load_vectors(index_file: str = None) -> np.ndarray:
+    """متجهات ملف فهرس، أو فهرس النسخة المنشورة (الفهرس العام أو كل الأجزاء في النسخة المقسمة)"""
+    if index_file is None:
+        current = SnapshotStore(Config.FAISS_SNAPSHOTS_DIR).current()
+        if current is None:
+            index_file = Config.FAISS_INDEX_PATH
+        else:
+            print(f"📖 تحميل المتجهات من النسخة: {current.path}")
+            index = load_snapshot_index(current, index_type=Config.FAISS_INDEX_TYPE,
+                                        index_params=Config.FAISS_INDEX_PARAMS)
+            shards = index.shards if current.is_sharded else [index]
+            return np.vstack([index_vectors(shard.global_index) for shard in shards
+                              if shard.global_index is not None])
+
+    print(f"📖 تحميل المتجهات من: {index_file}")
+    return index_vectors(faiss.read_index(index_file))
+
+def run_benchmark(index_file: str, modes: list, top_k: int = 10,
+                  num_queries: int = 200, nprobe: int = Config.FAISS_NPROBE,
+                  ef_search: int = Config.FAISS_EF_SEARCH) -> list:
+    """تقرير الدقة والزمن لكل نوع فهرس على متجهات الفهرس الحالي (index_file=None: النسخة المنشورة)"""
+
+    embeddings = load_vectors(index_file)
+
+    # الاستعلامات عينة من متجهات المستندات نفسها
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False)
+    queries = embeddings[sample]
+
+    print(f"🔢 {len(embeddings)} متجه، {len(queries)} استعلام، top_k={top_k}")
+
+    report = evaluate_index_modes(embeddings, queries, modes, top_k=top_k,
+                                  nprobe=nprobe, ef_search=ef_search,
+                                  **Config.FAISS_INDEX_PARAMS)
+
+    print(f"{'النوع':<10} {'recall@k':>9} {'زمن (ms)':>9} {'البناء (s)':>10} {'الحجم (MB)':>10}  الوصف")
+    for row in report:
+        print(f"{row['mode']:<10} {row['recall_at_k']:>9.3f} {row['latency_ms']:>9.3f} "
+              f"{row['build_seconds']:>10.2f} {row['size_mb']:>10.2f}  {row['index_type']}")
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="مقارنة أنواع فهارس FAISS")
+    parser.add_argument("--index-file", default=None,
+                        help="مسار الفهرس (الافتراضي: فهرس النسخة المنشورة)")
+    parser.add_argument("--modes", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES,
+                        help="أنواع الفهارس للمقارنة")
+    parser.add_argument("--top-k", type=int, default=10, help="عدد النتائج")
+    parser.add_argument("--queries", type=int, default=200, help="عدد الاستعلامات")
+    parser.add_argument("--nprobe", type=int, default=Config.FAISS_NPROBE, help="nprobe لفهارس IVF")
+    parser.add_argument("--ef-search", type=int, default=Config.FAISS_EF_SEARCH, help="efSearch لـ HNSW")
+
+    args = parser.parse_args()
+
+    run_benchmark(
+        index_file=args.index_file,
+        modes=args.modes,
+        top_k=args.top_k,
+        num_queries=args.queries,
+        nprobe=args.nprobe,
+        ef_search=args.ef_search
+    )
@@ -0,0 +1,88 @@
+"""
+scripts/benchmark_search.py - قياس إنتاجية البحث: استعلام واحد في كل مرة مقابل search_many
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# إضافة المسار للأدوات
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval_engine import RetrievalEngine
+
+DEFAULT_QUERIES = [
+    "فصل العامل تعسفياً دون إنذار",
+    "التعويض عن الضرر في المسؤولية التقصيرية",
+    "الأجور المتأخرة وساعات العمل الإضافية",
+    "فسخ عقد الإيجار قبل انتهاء المدة",
+    "التقادم في الالتزامات المدنية",
+]
+
+def load_queries(queries_file: str, count: int) -> list:
+    """استعلامات من ملف (سطر لكل استعلام) أو قائمة افتراضية مكررة"""
+    if queries_file:
+        with open(queries_file, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+
+    # إضافة رقم لكل استعلام حتى لا تخدم ذاكرة التضمينات التكرار
+    return [f"{queries[i % len(queries)]} ({i})" for i in range(count)]
+
+def run_benchmark(queries: list, country: str = None, top_k: int = 5,
+                  batch_size: int = 64) -> dict:
+    """مقارنة زمن البحث المتسلسل مع البحث على دفعات"""
+
+    engine = RetrievalEngine()
+
+    # تسخين: تحميل النموذج والفهرس قبل القياس
+    engine.search("تسخين", country=country, top_k=top_k)
+
+    half = len(queries) // 2
+    sequential_queries, batched_queries = queries[:half], queries[half:]
+
+    start = time.perf_counter()
+    for query in sequential_queries:
+        engine.search(query, country=country, top_k=top_k)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, len(batched_queries), batch_size):
+        engine.search_many(batched_queries[i:i + batch_size], country=country, top_k=top_k)
+    batched_time = time.perf_counter() - start
+
+    report = {
+        'sequential_qps': len(sequential_queries) / sequential_time,
+        'batched_qps': len(batched_queries) / batched_time,
+        'sequential_ms_per_query': sequential_time * 1000 / len(sequential_queries),
+        'batched_ms_per_query': batched_time * 1000 / len(batched_queries),
+    }
+    report['speedup'] = report['batched_qps'] / report['sequential_qps']
+
+    print(f"📊 {len(queries)} استعلام، top_k={top_k}، الدولة: {country or 'الكل'}")
+    print(f"   - متسلسل: {report['sequential_qps']:.1f} استعلام/ث "
+          f"({report['sequential_ms_per_query']:.2f} ms لكل استعلام)")
+    print(f"   - دفعات ({batch_size}): {report['batched_qps']:.1f} استعلام/ث "
+          f"({report['batched_ms_per_query']:.2f} ms لكل استعلام)")
+    print(f"   - التسريع: {report['speedup']:.1f}x")
+
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="قياس إنتاجية البحث")
+    parser.add_argument("--queries-file", default=None, help="ملف استعلامات (سطر لكل استعلام)")
+    parser.add_argument("--count", type=int, default=512, help="عدد الاستعلامات")
+    parser.add_argument("--country", default=None, help="تصفية حسب الدولة")
+    parser.add_argument("--top-k", type=int, default=5, help="عدد النتائج")
+    parser.add_argument("--batch-size", type=int, default=64, help="حجم دفعة search_many")
+
+    args = parser.parse_args()
+
+    run_benchmark(
+        queries=load_queries(args.queries_file, args.count),
+        country=args.country,
+        top_k=args.top_k,
+        batch_size=args.batch_size
+    )
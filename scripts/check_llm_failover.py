@@ -0,0 +1,293 @@
+"""
+scripts/check_llm_failover.py - فحص السباق المتحوط والانتقال أثناء البث مقابل خوادم chat/completions وهمية محلية
+"""
+
+import os
+import sys
+import json
+import time
+import select
+import socket
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# إضافة المسار للأدوات
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_providers import (ClientPool, OpenAICompatibleProvider, complete_hedged, iterate_sync,
+                           run_sync, stream_failover)
+
+
+class StubServer:
+    """خادم متوافق مع OpenAI على منفذ محلي بسلوك ثابت، يسجل لكل طلب وقت وصوله وهل قطعه العميل
+
+    delay: انتظار قبل الرد (أو قبل أول جزء في البث)
+    status: رمز الرد (غير 200 يعني خطأ فوري بعد delay)
+    die_after: قطع الاتصال في منتصف البث بعد هذا العدد من الأجزاء
+    stall_after: التوقف عن الإرسال بعد هذا العدد من الأجزاء دون إغلاق الاتصال
+    """
+
+    def __init__(self, chunks: Tuple[str, ...] = ("رد",), delay: float = 0.0, status: int = 200,
+                 die_after: Optional[int] = None, stall_after: Optional[int] = None,
+                 gap: float = 0.02):
+        self.chunks = chunks
+        self.delay = delay
+        self.status = status
+        self.die_after = die_after
+        self.stall_after = stall_after
+        self.gap = gap
+        self.requests: List[Dict] = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_disconnected(self, timeout: float = 2.0) -> bool:
+        """انتظار أن يلاحظ الخادم إغلاق العميل لاتصال الطلب الأول"""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if self.requests and self.requests[0]["disconnected"]:
+                return True
+            time.sleep(0.02)
+        return False
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _wait(self, seconds: float, record: Dict) -> bool:
+                """انتظار مع مراقبة الاتصال؛ False إذا أغلقه العميل (أُلغي الطلب)"""
+                deadline = time.perf_counter() + seconds
+                while time.perf_counter() < deadline:
+                    readable, _, _ = select.select([self.connection], [], [], 0.02)
+                    if readable and not self.connection.recv(1, socket.MSG_PEEK):
+                        record["disconnected"] = True
+                        return False
+                return True
+
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, data: bytes):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                record = {"start": time.perf_counter(), "disconnected": False}
+                stub.requests.append(record)
+                if not self._wait(stub.delay, record):
+                    return
+
+                if stub.status != 200:
+                    self._send_json(stub.status, {"error": {"message": "stub error", "type": "stub"}})
+                    return
+
+                if not request.get("stream"):
+                    self._send_json(200, {
+                        "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "".join(stub.chunks)}}]
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i, text in enumerate(stub.chunks):
+                        if i == stub.die_after:
+                            # جزء ناقص ثم إغلاق: انقطاع الاتصال في منتصف البث
+                            self.wfile.write(b"40\r\ndata: ")
+                            self.wfile.flush()
+                            self.close_connection = True
+                            self.connection.shutdown(socket.SHUT_RDWR)
+                            return
+                        if i == stub.stall_after and not self._wait(60.0, record):
+                            return
+                        event = {"id": "stub", "object": "chat.completion.chunk", "created": 0,
+                                 "model": "stub",
+                                 "choices": [{"index": 0, "delta": {"content": text},
+                                              "finish_reason": None}]}
+                        self._send_chunk(b"data: " + json.dumps(event).encode() + b"\n\n")
+                        time.sleep(stub.gap)
+                    self._send_chunk(b"data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except OSError:
+                    record["disconnected"] = True
+
+        return Handler
+
+
+def provider(pool: ClientPool, name: str, server: StubServer,
+             timeout: float = 10.0) -> OpenAICompatibleProvider:
+    return OpenAICompatibleProvider(name, name, pool, api_key="stub", model="stub",
+                                    system_prompt="", base_url=server.url, timeout=timeout)
+
+
+def events(providers: List[OpenAICompatibleProvider], mode: str, hedge_delay: float,
+           idle_timeout: float = 30.0) -> List[Tuple[str, Optional[str]]]:
+    """تسلسل أحداث البث مختصراً إلى (النوع، اسم المزود) ثم النص النهائي"""
+    sequence = []
+    text = None
+    for event in iterate_sync(stream_failover(providers, "سؤال", mode=mode, hedge_delay=hedge_delay,
+                                              idle_timeout=idle_timeout)):
+        name = event["provider"]
+        if event["type"] == "done":
+            name = name.name if name else None
+            text = event["text"]
+        sequence.append((event["type"], name))
+    return sequence + [("text", text)]
+
+
+def check_hedge_delay(pool: ClientPool, hedge_delay: float) -> List[str]:
+    """المزود البطيء لا يرد خلال hedge_delay: يبدأ التالي بعد المهلة، يفوز، ويُلغى طلب البطيء"""
+    slow, fast = StubServer(delay=hedge_delay * 10), StubServer(chunks=("سريع",))
+    try:
+        start = time.perf_counter()
+        result = run_sync(complete_hedged([provider(pool, "slow", slow), provider(pool, "fast", fast)],
+                                          "سؤال", hedge_delay=hedge_delay))
+        elapsed = time.perf_counter() - start
+        statuses = {attempt["provider"]: attempt["status"] for attempt in result["attempts"]}
+        started_after = fast.requests[0]["start"] - slow.requests[0]["start"] if fast.requests else None
+
+        failures = []
+        if result["provider"] is None or result["provider"].name != "fast" or result["text"] != "سريع":
+            failures.append(f"الفائز {result['provider'] and result['provider'].name}: {result['text']!r}")
+        if started_after is None or started_after < hedge_delay * 0.9:
+            failures.append(f"بدأ المزود التالي بعد {started_after} ثانية (المهلة {hedge_delay})")
+        if elapsed >= slow.delay:
+            failures.append(f"انتظر المزود البطيء ({elapsed:.2f} ثانية)")
+        if statuses.get("slow") != "cancelled":
+            failures.append(f"حالة المزود البطيء: {statuses.get('slow')}")
+        if not slow.wait_disconnected():
+            failures.append("طلب المزود البطيء لم يُقطع بعد فوز التالي")
+        return failures
+    finally:
+        slow.close()
+        fast.close()
+
+
+def check_hedge_on_error(pool: ClientPool, hedge_delay: float) -> List[str]:
+    """فشل المزود الأول يبدأ التالي فوراً دون انتظار hedge_delay"""
+    broken, backup = StubServer(status=400), StubServer(chunks=("احتياطي",))
+    try:
+        result = run_sync(complete_hedged([provider(pool, "broken", broken),
+                                           provider(pool, "backup", backup)],
+                                          "سؤال", hedge_delay=hedge_delay * 10))
+        statuses = {attempt["provider"]: attempt["status"] for attempt in result["attempts"]}
+        started_after = backup.requests[0]["start"] - broken.requests[0]["start"] if backup.requests else None
+
+        failures = []
+        if result["provider"] is None or result["provider"].name != "backup":
+            failures.append(f"الفائز {result['provider'] and result['provider'].name}")
+        if statuses.get("broken") != "error":
+            failures.append(f"حالة المزود الفاشل: {statuses.get('broken')}")
+        if started_after is None or started_after >= hedge_delay * 10:
+            failures.append(f"انتظر المزود التالي مهلة التحوط ({started_after} ثانية)")
+        return failures
+    finally:
+        broken.close()
+        backup.close()
+
+
+def check_stream_reset(pool: ClientPool, hedge_delay: float, mode: str) -> List[str]:
+    """انقطاع البث بعد جزأين: reset ثم الرد كاملاً من المزود التالي"""
+    primary = StubServer(chunks=("أ", "ب", "ج", "د"), die_after=2)
+    backup = StubServer(chunks=("١", "٢", "٣"))
+    try:
+        sequence = events([provider(pool, "primary", primary), provider(pool, "backup", backup)],
+                          mode, hedge_delay)
+        expected = [("delta", "primary"), ("delta", "primary"), ("reset", "backup"),
+                    ("delta", "backup"), ("delta", "backup"), ("delta", "backup"),
+                    ("done", "backup"), ("text", "١٢٣")]
+        return [] if sequence == expected else [f"الأحداث {sequence}"]
+    finally:
+        primary.close()
+        backup.close()
+
+
+def check_stream_stall(pool: ClientPool, hedge_delay: float) -> List[str]:
+    """توقف البث أطول من idle_timeout: reset ثم المزود التالي، ويُغلق اتصال البث المتوقف"""
+    primary = StubServer(chunks=("أ", "ب", "ج"), stall_after=1)
+    backup = StubServer(chunks=("١", "٢"))
+    try:
+        sequence = events([provider(pool, "primary", primary), provider(pool, "backup", backup)],
+                          "hedged", hedge_delay, idle_timeout=hedge_delay * 2)
+        expected = [("delta", "primary"), ("reset", "backup"), ("delta", "backup"),
+                    ("delta", "backup"), ("done", "backup"), ("text", "١٢")]
+        failures = [] if sequence == expected else [f"الأحداث {sequence}"]
+        if not primary.wait_disconnected():
+            failures.append("اتصال البث المتوقف لم يُغلق")
+        return failures
+    finally:
+        primary.close()
+        backup.close()
+
+
+def check_stream_hedge(pool: ClientPool, hedge_delay: float) -> List[str]:
+    """أول جزء بطيء: يفوز المزود التالي بالسباق دون reset ويُغلق بث الخاسر"""
+    slow, fast = StubServer(chunks=("بطيء",), delay=hedge_delay * 10), StubServer(chunks=("س", "ر"))
+    try:
+        sequence = events([provider(pool, "slow", slow), provider(pool, "fast", fast)],
+                          "hedged", hedge_delay)
+        expected = [("delta", "fast"), ("delta", "fast"), ("done", "fast"), ("text", "سر")]
+        failures = [] if sequence == expected else [f"الأحداث {sequence}"]
+        if not slow.wait_disconnected():
+            failures.append("بث المزود الخاسر لم يُغلق")
+        return failures
+    finally:
+        slow.close()
+        fast.close()
+
+
+def run_checks(hedge_delay: float = 0.3) -> bool:
+    pool = ClientPool()
+    checks = [
+        ("السباق المتحوط بعد المهلة وإلغاء الخاسر", lambda: check_hedge_delay(pool, hedge_delay)),
+        ("الانتقال فور فشل المزود", lambda: check_hedge_on_error(pool, hedge_delay)),
+        ("انقطاع البث ثم reset (متحوط)", lambda: check_stream_reset(pool, hedge_delay, "hedged")),
+        ("انقطاع البث ثم reset (تسلسلي)", lambda: check_stream_reset(pool, hedge_delay, "sequential")),
+        ("توقف البث ثم reset", lambda: check_stream_stall(pool, hedge_delay)),
+        ("سباق أول جزء في البث", lambda: check_stream_hedge(pool, hedge_delay)),
+    ]
+
+    print(f"📊 فحص المزودين مقابل خوادم وهمية (مهلة التحوط {hedge_delay} ثانية)")
+    passed = True
+    for name, check in checks:
+        failures = check()
+        passed = passed and not failures
+        print(f"   {'✅' if not failures else '❌'} {name}")
+        for failure in failures:
+            print(f"      - {failure}")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="فحص السباق المتحوط والانتقال أثناء البث بخوادم محلية")
+    parser.add_argument("--hedge-delay", type=float, default=0.3, help="مهلة التحوط بالثواني")
+
+    args = parser.parse_args()
+
+    sys.exit(0 if run_checks(hedge_delay=args.hedge_delay) else 1)
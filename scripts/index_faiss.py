@@ -5,34 +5,231 @@ scripts/index_faiss.py - فهرسة القوانين في FAISS
 import os
 import sys
 import json
+import hashlib
 import argparse
 from pathlib import Path
 
 # إضافة المسار للأدوات
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import numpy as np
 from sentence_transformers import SentenceTransformer
-import faiss
+import resources
 from config import Config
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline
+from chunk_store import ChunkStore
+from chunker import chunk_file
+from index_factory import INDEX_TYPES, write_quality_report
+from index_shards import SHARD_BY, create_snapshot_index, load_snapshot_index, save_snapshot_index
+from lexical_index import LexicalIndex, LexicalIndexBuilder, build_from_stores
+from metadata_store import MetadataStore
+from snapshots import Snapshot, SnapshotStore, new_stores, store_path
+from vector_store import VectorStore
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list:
-    """تقسيم النص إلى أجزاء متداخلة"""
-    words = text.split()
-    chunks = []
+def describe_file(file_path: Path) -> tuple:
+    """استخراج الدولة ونوع القانون من اسم الملف"""
+    country = "unknown"
+    doc_type = "unknown"
     
-    i = 0
-    while i < len(words):
-        chunk = " ".join(words[i:i + chunk_size])
-        chunks.append(chunk)
-        i += chunk_size - overlap
+    if "yemen" in file_path.name.lower():
+        country = "Yemen"
+    elif "egypt" in file_path.name.lower():
+        country = "Egypt"
+    elif "saudi" in file_path.name.lower():
+        country = "Saudi Arabia"
     
-    return chunks
+    if "civil" in file_path.name.lower():
+        doc_type = "قانون مدني"
+    elif "criminal" in file_path.name.lower():
+        doc_type = "قانون جنائي"
+    elif "labor" in file_path.name.lower():
+        doc_type = "قانون عمل"
+    elif "commercial" in file_path.name.lower():
+        doc_type = "قانون تجاري"
+    
+    return country, doc_type
+
+def read_file_chunks(file_path: Path):
+    """قراءة ملف وتقسيمه إلى مواد كمولد (النص، البيانات الوصفية)"""
+    
+    country, doc_type = describe_file(file_path)
+    
+    for i, (chunk, info) in enumerate(chunk_file(file_path, Config.CHUNK_MAX_WORDS)):
+        yield chunk, {
+            "source": str(file_path),
+            "country": country,
+            "type": doc_type,
+            "chunk": i,
+            "article": info["article"],
+            "section": info["section"],
+            "preview": chunk[:100],
+            "title": f"{doc_type} - {country}"
+        }
+
+def file_hash(file_path: Path) -> str:
+    """بصمة محتوى الملف"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def list_data_files(data_dir: str) -> list:
+    """الملفات النصية القابلة للفهرسة"""
+    data_path = Path(data_dir)
+    return sorted(list(data_path.glob("**/*.txt")) + list(data_path.glob("**/*.json")))
+
+def load_manifest(manifest_file: str) -> dict:
+    """تحميل سجل الملفات المفهرسة (البصمة ونطاق المعرفات لكل ملف)"""
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, manifest_file: str):
+    """حفظ السجل بشكل ذري"""
+    tmp_file = manifest_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, manifest_file)
+
+def iter_file_chunks(files: list, start_id: int, manifest_files: dict,
+                     hashes: dict = None):
+    """مرحلة القراءة والتقسيم: إنتاج (المعرف، النص، البيانات الوصفية) ملفاً بعد ملف
+
+    يسجل نطاق المعرفات والبصمة لكل ملف في manifest_files.
+    """
+    next_id = start_id
+    
+    for file_path in files:
+        file_path = Path(file_path)
+        print(f"📖 معالجة: {file_path.name}")
+        
+        entry = {
+            "hash": hashes[str(file_path)] if hashes else file_hash(file_path),
+            "ids": [next_id, next_id]
+        }
+        manifest_files[str(file_path)] = entry
+        
+        # الملف يُقرأ ويُقسم أثناء التضمين، فيُحدَّث نطاق المعرفات بعد كل جزء
+        try:
+            for chunk, meta in read_file_chunks(file_path):
+                yield next_id, chunk, meta
+                next_id += 1
+                entry["ids"][1] = next_id
+        except Exception as e:
+            print(f"  ✗ خطأ في معالجة {file_path.name}: {e}")
+            # الأجزاء المضافة قبل الخطأ تُحذف في التحديث التالي
+            entry["hash"] = None
+            continue
+        
+        print(f"  ✓ تمت معالجة {entry['ids'][1] - entry['ids'][0]} جزء")
+
+def _open_cache(model_name: str) -> EmbeddingCache:
+    """ذاكرة التضمينات المشتركة مع محرك البحث"""
+    return EmbeddingCache(Config.EMBEDDING_CACHE_DIR, model_name, Config.EMBEDDING_CACHE_MAX_ENTRIES)
+
+def _report_cache(cache: EmbeddingCache):
+    if cache is not None:
+        stats = cache.statistics()
+        print(f"🗃️ ذاكرة التضمينات: {stats['hits']} إصابة، {stats['misses']} إخفاق "
+              f"({stats['hit_rate']:.0%})")
+        cache.close()
+
+def _next_free_id(store: MetadataStore, chunk_store: ChunkStore, manifest: dict) -> int:
+    """أول معرف لم يستخدم (المحرك قد يضيف أجزاء لا يعرفها السجل)"""
+    return max(manifest.get("next_id", 0), store.next_id(), len(chunk_store))
+
+def _write_quality(path: str, vector_store: VectorStore, ids):
+    """تقرير الذاكرة وrecall@k لكل نوع فهرس على عينة من المتجهات الأصلية"""
+    try:
+        report = write_quality_report(path, vector_store.sample(ids, Config.INDEX_EVAL_SAMPLE),
+                                      list(Config.INDEX_EVAL_MODES),
+                                      num_queries=Config.INDEX_EVAL_QUERIES,
+                                      rescore_factor=Config.FAISS_RESCORE_FACTOR,
+                                      nprobe=Config.FAISS_NPROBE, ef_search=Config.FAISS_EF_SEARCH,
+                                      **Config.FAISS_INDEX_PARAMS)
+    except Exception as e:
+        # التقرير للمقارنة فقط ولا يمنع نشر النسخة
+        print(f"⚠️ تعذر قياس أنواع الفهارس: {e}")
+        return
+    
+    print(f"📊 مقارنة أنواع الفهارس ({len(report)}):")
+    for row in report:
+        print(f"   - {row['mode']:<8} {row['bytes_per_vector']:>8.1f} بايت/متجه "
+              f"recall@k={row['recall_at_k']:.3f} "
+              f"(بعد إعادة الحساب: {row.get('recall_at_k_rescored', row['recall_at_k']):.3f})")
+
+def _publish(snapshots: SnapshotStore, index, manifest: dict,
+             write_lexical, write_quality=None) -> Snapshot:
+    """كتابة الفهرس (أو أجزائه) وفهرس BM25 والسجل في نسخة مؤقتة ثم نشرها دفعة واحدة"""
+    snapshot = snapshots.begin()
+    try:
+        save_snapshot_index(index, snapshot)
+        write_lexical(snapshot.lexical_dir)
+        if write_quality is not None:
+            write_quality(snapshot.quality_path)
+        save_manifest(manifest, snapshot.manifest_path)
+        return snapshots.publish(snapshot)
+    except Exception:
+        snapshots.abort(snapshot)
+        raise
+
+def _open_snapshots(snapshots_dir: str, meta_file: str, chunks_path: str,
+                    vectors_path: str) -> SnapshotStore:
+    """مجلد النسخ؛ حذف النسخ القديمة يحرر البيانات الوصفية وملفات المخازن التي لم تعد مستخدمة"""
+    return SnapshotStore(
+        snapshots_dir, Config.FAISS_SNAPSHOTS_KEEP,
+        release=lambda stores, ranges: resources.release_ids(stores, ranges, meta_file),
+        retire=lambda stores: resources.retire_stores(stores, meta_file, chunks_path, vectors_path)
+    )
+
+def _live_ids(manifest: dict) -> np.ndarray:
+    """معرفات أجزاء الملفات المفهرسة في السجل"""
+    ranges = [np.arange(*entry["ids"], dtype='int64') for entry in manifest.get("files", {}).values()]
+    return np.concatenate(ranges) if ranges else np.empty(0, dtype='int64')
+
+def _import_legacy(snapshots: SnapshotStore):
+    """ترحيل فهرس قديم محفوظ خارج مجلد النسخ"""
+    snapshots.import_legacy(Config.FAISS_INDEX_PATH, Config.FAISS_PARTITIONS_DIR,
+                            Config.LEXICAL_INDEX_DIR, Config.FAISS_MANIFEST_PATH)
 
 def index_documents(data_dir: str = "data", 
-                   index_file: str = "faiss.index",
-                   meta_file: str = "metadata.json",
-                   model_name: str = "all-MiniLM-L6-v2"):
-    """فهرسة جميع المستندات النصية"""
+                   snapshots_dir: str = "snapshots",
+                   meta_file: str = "metadata.db",
+                   chunks_path: str = "chunks",
+                   vectors_path: str = "vectors.f32",
+                   model_name: str = "all-MiniLM-L6-v2",
+                   index_type: str = "flat",
+                   incremental: bool = False,
+                   workers: int = 1,
+                   batch_size: int = 64,
+                   use_cache: bool = True,
+                   shards: int = 1,
+                   shard_by: str = "country"):
+    """فهرسة جميع المستندات النصية ونشرها كنسخة جديدة
+
+    shards > 1: الفهرس يُكتب أجزاءً (حسب الدولة أو المعرف) يخدم كل منها عملية مستقلة.
+    """
+    
+    snapshots = _open_snapshots(snapshots_dir, meta_file, chunks_path, vectors_path)
+    _import_legacy(snapshots)
+    current = snapshots.current()
+    
+    if incremental:
+        manifest = load_manifest(current.manifest_path) if current else {}
+        if (manifest.get("model") == model_name and manifest.get("index_type") == index_type
+                and manifest.get("shards", 1) == max(shards, 1)
+                and (shards <= 1 or manifest.get("shard_by") == shard_by)):
+            result = update_index(data_dir, snapshots, meta_file, chunks_path, vectors_path, manifest,
+                                  workers=workers, batch_size=batch_size,
+                                  use_cache=use_cache)
+            if result is not None:
+                return result
+        print("⚠️ لا يمكن التحديث التزايدي، سيتم إعادة بناء الفهرس كاملاً")
     
     print("🚀 بدء عملية الفهرسة...")
     
@@ -40,107 +237,230 @@ def index_documents(data_dir: str = "data",
     model = SentenceTransformer(model_name)
     print(f"✅ تم تحميل النموذج: {model_name}")
     
-    texts = []
-    metadata = []
+    manifest = {"model": model_name, "index_type": index_type, "files": {}}
+    if shards > 1:
+        manifest.update(shards=shards, shard_by=shard_by)
     
     # البحث عن ملفات نصية
-    data_path = Path(data_dir)
-    txt_files = list(data_path.glob("**/*.txt")) + list(data_path.glob("**/*.json"))
+    txt_files = list_data_files(data_dir)
     
     print(f"🔍 وجدت {len(txt_files)} ملف للفهرسة")
     
-    for file_path in txt_files:
-        try:
-            print(f"📖 معالجة: {file_path.name}")
-            
-            # قراءة الملف
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # استخراج المعلومات من اسم الملف
-            country = "unknown"
-            doc_type = "unknown"
-            
-            if "yemen" in file_path.name.lower():
-                country = "Yemen"
-            elif "egypt" in file_path.name.lower():
-                country = "Egypt"
-            elif "saudi" in file_path.name.lower():
-                country = "Saudi Arabia"
-            
-            if "civil" in file_path.name.lower():
-                doc_type = "قانون مدني"
-            elif "criminal" in file_path.name.lower():
-                doc_type = "قانون جنائي"
-            elif "labor" in file_path.name.lower():
-                doc_type = "قانون عمل"
-            elif "commercial" in file_path.name.lower():
-                doc_type = "قانون تجاري"
-            
-            # تقسيم النص
-            chunks = chunk_text(content)
-            
-            for i, chunk in enumerate(chunks):
-                texts.append(chunk)
-                metadata.append({
-                    "source": str(file_path),
-                    "country": country,
-                    "type": doc_type,
-                    "chunk": i,
-                    "preview": chunk[:100],
-                    "title": f"{doc_type} - {country}"
-                })
-                
-            print(f"  ✓ تمت معالجة {len(chunks)} جزء")
-            
-        except Exception as e:
-            print(f"  ✗ خطأ في معالجة {file_path.name}: {e}")
+    # المخازن بلا نسخة منشورة تستخدمها تُحذف
+    if current is None:
+        resources.retire_stores(None, meta_file, chunks_path, vectors_path)
+    
+    # جيل مخازن جديد بمعرفات تبدأ من الصفر: التطبيقات العاملة تقرأ مخازن النسخة المنشورة
+    # حتى النهاية، وملفات الجيل السابق تُحذف مع حذف آخر نسخة منه
+    stores = new_stores()
+    manifest["stores"] = stores
+    store = MetadataStore(store_path(meta_file, stores))
+    chunk_store = ChunkStore(store_path(chunks_path, stores))
+    vector_store = VectorStore(store_path(vectors_path, stores))
+    start_id = 0
+    
+    index = None
+    lexical = LexicalIndexBuilder()
+    
+    def write_batch(ids, texts, metas, embeddings):
+        """مرحلة الكتابة: إضافة الدفعة إلى الفهرس والمخازن"""
+        nonlocal index
+        if index is None:
+            index = create_snapshot_index(embeddings.shape[1], index_type, Config.FAISS_INDEX_PARAMS,
+                                          shards, shard_by)
+        countries = [meta["country"] for meta in metas]
+        index.add(embeddings, countries, ids=ids)
+        lexical.add(ids, texts, countries)
+        chunk_store.append(texts, ids)
+        vector_store.append(ids, embeddings)
+        store.append(metas, ids)
+    
+    snapshot = None
+    try:
+        # قراءة ← تضمين متوازي ← كتابة، دفعة بعد دفعة
+        cache = _open_cache(model_name) if use_cache else None
+        with EmbeddingPipeline(model, batch_size=batch_size, workers=workers,
+                               write_batch_size=Config.INDEX_WRITE_BATCH, cache=cache) as pipeline:
+            total = pipeline.run(iter_file_chunks(txt_files, start_id, manifest["files"]),
+                                 write_batch)
+        _report_cache(cache)
+        
+        if total:
+            # نشر الفهرسين والسجل معاً
+            manifest["next_id"] = start_id + total
+            snapshot = _publish(snapshots, index, manifest, lexical.save,
+                                lambda path: _write_quality(path, vector_store, range(start_id, start_id + total)))
+    finally:
+        store.close()
+        chunk_store.close()
+        if snapshot is None:
+            # جيل المخازن الجديد لا تستخدمه أي نسخة
+            resources.retire_stores(stores, meta_file, chunks_path, vectors_path)
     
-    if not texts:
+    if snapshot is None:
         print("⚠️ لا توجد نصوص للفهرسة!")
         return False
     
-    print(f"🔢 جاري تضمين {len(texts)} جزء نصي...")
+    print(f"✅ تم إنشاء الفهرس بنجاح!")
+    print(f"📊 إحصائيات:")
+    print(f"   - عدد الأجزاء: {total}")
+    print(f"   - أبعاد التضمين: {index.dim}")
+    print(f"   - عدد الدول: {len(index.partition_sizes())}")
+    print(f"   - نوع الفهرس: {index.description}")
+    if shards > 1:
+        print(f"   - الأجزاء ({shard_by}): {[shard.ntotal for shard in index.shards]}")
+    print(f"   - حجم الفهرس: {snapshot.index_size_mb():.2f} MB")
+    print(f"   - النسخة المنشورة: {snapshot.path}")
+    print(f"   - ملف البيانات: {store.db_path}")
+    print(f"   - ملف النصوص: {chunk_store.data_path}")
+    print(f"   - المتجهات الأصلية: {vector_store.path} ({vector_store.size_mb():.2f} MB)")
     
-    # تضمين النصوص
-    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+    return True
+
+def update_index(data_dir: str, snapshots: SnapshotStore, meta_file: str,
+                 chunks_path: str, vectors_path: str, manifest: dict,
+                 workers: int = 1, batch_size: int = 64, use_cache: bool = True):
+    """تحديث تزايدي: تضمين الملفات الجديدة/المعدلة فقط وحذف متجهات الملفات المحذوفة/المعدلة
+
+    يعيد None إذا كان الفهرس الحالي لا يدعم حذف المتجهات (يلزم إعادة البناء).
+    """
     
-    # إنشاء الفهرس
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
+    print("🚀 بدء التحديث التزايدي...")
     
-    # حفظ الفهرس
-    faiss.write_index(index, index_file)
+    current = snapshots.current()
+    index = load_snapshot_index(current, index_type=manifest["index_type"],
+                                index_params=Config.FAISS_INDEX_PARAMS)
+    if not index.supports_removal:
+        return None
     
-    # حفظ البيانات الوصفية
-    with open(meta_file, 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    # مقارنة بصمات الملفات بالسجل
+    files = {str(path): file_hash(path) for path in list_data_files(data_dir)}
+    indexed = manifest.get("files", {})
     
-    print(f"✅ تم إنشاء الفهرس بنجاح!")
-    print(f"📊 إحصائيات:")
-    print(f"   - عدد الأجزاء: {len(texts)}")
-    print(f"   - أبعاد التضمين: {dim}")
-    print(f"   - حجم الفهرس: {os.path.getsize(index_file) / (1024*1024):.2f} MB")
-    print(f"   - ملف الفهرس: {index_file}")
-    print(f"   - ملف البيانات: {meta_file}")
+    changed = [path for path, digest in files.items()
+               if path in indexed and indexed[path]["hash"] != digest]
+    added = [path for path in files if path not in indexed]
+    deleted = [path for path in indexed if path not in files]
+    
+    print(f"🔍 جديد: {len(added)} | معدل: {len(changed)} | محذوف: {len(deleted)}")
+    
+    # الأجزاء الجديدة تُضاف إلى جيل مخازن النسخة الحالية
+    stores = manifest.get("stores")
+    store = MetadataStore(store_path(meta_file, stores))
+    chunk_store = ChunkStore(store_path(chunks_path, stores))
+    vector_store = VectorStore(store_path(vectors_path, stores))
+    
+    # نطاقات الأجزاء المحذوفة أو المعدلة تُسجل في النسخة الجديدة
+    manifest.pop("retired", None)
+    
+    if not (added or changed or deleted):
+        if not LexicalIndex.exists(current.lexical_dir):
+            # نسخة أنشئت قبل إضافة BM25
+            _publish(snapshots, index, manifest,
+                     lambda lexical_dir: build_from_stores(store, chunk_store, lexical_dir))
+        store.close()
+        chunk_store.close()
+        print("✅ الفهرس محدث، لا توجد تغييرات")
+        return True
+    
+    # معرفات المتجهات التي يجب حذفها
+    retired = [list(indexed[path]["ids"]) for path in changed + deleted]
+    stale_ids = np.concatenate([np.arange(*ids, dtype='int64') for ids in retired]) \
+        if retired else np.empty(0, dtype='int64')
+    
+    next_id = _next_free_id(store, chunk_store, manifest)
+    total = 0
+    
+    # قوائم BM25 للأجزاء الجديدة فقط، تُدمج مع فهرس النسخة الحالية عند النشر
+    lexical = LexicalIndexBuilder()
+    
+    # النصوص والبيانات الوصفية الجديدة أولاً: لا تظهر للقراء حتى تنشر النسخة
+    if added or changed:
+        model = SentenceTransformer(manifest["model"])
+        
+        def write_batch(ids, texts, metas, embeddings):
+            countries = [meta["country"] for meta in metas]
+            chunk_store.append(texts, ids)
+            vector_store.append(ids, embeddings)
+            store.append(metas, ids)
+            index.add(embeddings, countries, ids=ids)
+            lexical.add(ids, texts, countries)
+        
+        cache = _open_cache(manifest["model"]) if use_cache else None
+        with EmbeddingPipeline(model, batch_size=batch_size, workers=workers,
+                               write_batch_size=Config.INDEX_WRITE_BATCH, cache=cache) as pipeline:
+            total = pipeline.run(iter_file_chunks(added + changed, next_id, indexed, files),
+                                 write_batch)
+        _report_cache(cache)
+    
+    index.remove(stale_ids)
+    
+    for path in deleted:
+        indexed.pop(path)
+    manifest["files"] = indexed
+    manifest["next_id"] = next_id + total
+    if retired:
+        manifest["retired"] = retired
+    
+    def write_lexical(lexical_dir: str):
+        """فهرس BM25 السابق بدون الأجزاء المحذوفة مع قوائم الأجزاء الجديدة"""
+        if LexicalIndex.exists(current.lexical_dir):
+            lexical.save(lexical_dir, previous=LexicalIndex(current.lexical_dir), exclude=stale_ids)
+        else:
+            build_from_stores(store, chunk_store, lexical_dir, exclude=stale_ids)
+    
+    # نشر النسخة الجديدة؛ البيانات الوصفية القديمة تبقى للتطبيقات التي ما زالت تخدم النسخة السابقة
+    _publish(snapshots, index, manifest, write_lexical,
+             lambda path: _write_quality(path, vector_store, _live_ids(manifest)))
+    
+    store.close()
+    chunk_store.close()
+    
+    print(f"✅ تم التحديث: أضيف {total} جزء وحذف {len(stale_ids)} جزء")
+    print(f"   - إجمالي الأجزاء: {index.ntotal}")
     
     return True
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="فهرسة القوانين في FAISS")
     parser.add_argument("--data-dir", default="data", help="مجلد البيانات")
-    parser.add_argument("--index-file", default=Config.FAISS_INDEX_PATH, help="مسار الفهرس")
-    parser.add_argument("--meta-file", default=Config.FAISS_METADATA_PATH, help="مسار البيانات الوصفية")
-    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="نموذج التضمين")
+    parser.add_argument("--snapshots-dir", default=Config.FAISS_SNAPSHOTS_DIR, help="مجلد نسخ الفهرس المنشورة")
+    parser.add_argument("--meta-file", default=Config.FAISS_METADATA_DB_PATH, help="مسار قاعدة البيانات الوصفية")
+    parser.add_argument("--chunks-path", default=Config.FAISS_CHUNKS_PATH, help="مسار مخزن نصوص الأجزاء")
+    parser.add_argument("--vectors-path", default=Config.FAISS_VECTORS_PATH,
+                        help="مسار المتجهات الأصلية (لإعادة الحساب الدقيق فوق الفهارس المضغوطة)")
+    parser.add_argument("--model", default=Config.EMBEDDING_MODEL, help="نموذج التضمين")
+    parser.add_argument("--index-type", default=Config.FAISS_INDEX_TYPE, choices=INDEX_TYPES,
+                        help="نوع الفهرس")
+    parser.add_argument("--incremental", action="store_true",
+                        help="تضمين الملفات الجديدة/المعدلة فقط بدلاً من إعادة البناء")
+    parser.add_argument("--workers", type=int, default=Config.EMBED_WORKERS,
+                        help="عدد عمليات التضمين المتوازية")
+    parser.add_argument("--batch-size", type=int, default=Config.EMBED_BATCH_SIZE,
+                        help="حجم دفعة التضمين")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="تعطيل ذاكرة التضمينات المؤقتة")
+    parser.add_argument("--shards", type=int, default=Config.FAISS_SHARDS,
+                        help="عدد أجزاء الفهرس (لكل جزء خادم مستقل، انظر scripts/shard_server.py)")
+    parser.add_argument("--shard-by", default=Config.FAISS_SHARD_BY, choices=SHARD_BY,
+                        help="توزيع الأجزاء حسب الدولة أو حسب المعرف")
     
     args = parser.parse_args()
     
     success = index_documents(
         data_dir=args.data_dir,
-        index_file=args.index_file,
+        snapshots_dir=args.snapshots_dir,
         meta_file=args.meta_file,
-        model_name=args.model
+        chunks_path=args.chunks_path,
+        vectors_path=args.vectors_path,
+        model_name=args.model,
+        index_type=args.index_type,
+        incremental=args.incremental,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        use_cache=not args.no_cache,
+        shards=args.shards,
+        shard_by=args.shard_by
     )
     
     if success:
@@ -0,0 +1,70 @@
+"""
+scripts/shard_server.py - تشغيل خادم جزء من الفهرس المقسم (أو خوادم كل الأجزاء)
+"""
+
+import os
+import sys
+import signal
+import argparse
+import subprocess
+
+# إضافة المسار للأدوات
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resources
+from config import Config
+from index_shards import read_layout
+from shard_service import ShardServer, shard_address, socket_dir
+from snapshots import SnapshotStore
+
+def run_all(snapshots_dir: str, sockets: str) -> int:
+    """عملية مستقلة لكل جزء في النسخة المنشورة حتى تتوقف (Ctrl+C يوقفها كلها)"""
+    current = SnapshotStore(snapshots_dir).current()
+    if current is None or not current.is_sharded:
+        print("❌ النسخة المنشورة غير مقسمة (أعد الفهرسة بـ --shards)")
+        return 1
+
+    count = read_layout(current.shards_dir)["count"]
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                          "--snapshots-dir", snapshots_dir, "--socket-dir", sockets,
+                          "--shard", str(shard)])
+        for shard in range(count)
+    ]
+    print(f"🚀 تم تشغيل {count} خادم أجزاء في {sockets}")
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.send_signal(signal.SIGINT)
+        for process in processes:
+            process.wait()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="خادم أجزاء الفهرس المقسم")
+    parser.add_argument("--snapshots-dir", default=Config.FAISS_SNAPSHOTS_DIR, help="مجلد نسخ الفهرس المنشورة")
+    parser.add_argument("--socket-dir", default=None,
+                        help="مجلد المقابس (الافتراضي مجلد خاص بمجلد النسخ داخل DATA_DIR)")
+    parser.add_argument("--shard", type=int, default=None,
+                        help="رقم الجزء (بدونه تُشغّل خوادم كل الأجزاء)")
+
+    args = parser.parse_args()
+    sockets = args.socket_dir or Config.FAISS_SHARD_SOCKET_DIR or socket_dir(args.snapshots_dir)
+
+    if args.shard is None:
+        sys.exit(run_all(args.snapshots_dir, sockets))
+
+    server = ShardServer(args.snapshots_dir, args.shard, shard_address(sockets, args.shard),
+                         authkey=Config.FAISS_SHARD_AUTHKEY,
+                         io_flags=resources.index_io_flags(),
+                         keep=Config.FAISS_SNAPSHOTS_KEEP)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"⏹️ توقف خادم الجزء {args.shard}")
+    except RuntimeError as e:
+        print(f"⚠️ {e}")
+        sys.exit(1)
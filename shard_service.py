@@ -0,0 +1,397 @@
+"""
+shard_service.py - خادم لكل جزء من الفهرس عبر مقبس Unix، ومنسق يوزع الاستعلامات عليها ويدمج النتائج
+"""
+
+import atexit
+import hashlib
+import os
+import secrets
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing import AuthenticationError
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from index_shards import load_shard, merge_results, read_layout, target_shards
+from snapshots import SHARDS_DIR, SnapshotStore
+
+_FAMILY = "AF_UNIX"
+_SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts", "shard_server.py")
+# أقصى طول لمسار مقبس Unix (sun_path بدون الصفر الأخير)
+_MAX_SOCKET_PATH = 107
+
+
+def socket_dir(snapshots_root: str) -> str:
+    """مجلد المقابس الافتراضي: داخل DATA_DIR وخاص بمجلد النسخ"""
+    digest = hashlib.sha1(os.path.abspath(snapshots_root).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(Config.DATA_DIR, "shards", f"sockets-{digest}")
+
+
+def shard_address(sockets: str, shard: int) -> str:
+    address = os.path.join(sockets, f"shard-{shard:03d}.sock")
+    if len(os.fsencode(address)) > _MAX_SOCKET_PATH:
+        raise ValueError(f"مسار المقبس أطول من {_MAX_SOCKET_PATH} حرفاً: {address} "
+                         f"(حدد مجلداً أقصر في FAISS_SHARD_SOCKET_DIR)")
+    return address
+
+
+def secure_dir(path: str) -> str:
+    """إنشاء مجلد خاص بالمستخدم الحالي، ورفض مجلد موجود يملكه غيره أو يصل إليه غيره"""
+    # المجلدات الوسيطة الناقصة تُنشأ بنفس الصلاحيات (makedirs يطبق mode على الأخير فقط)
+    missing = []
+    current = os.path.abspath(path)
+    while not os.path.lexists(current):
+        missing.append(current)
+        current = os.path.dirname(current)
+    for directory in reversed(missing):
+        try:
+            os.mkdir(directory, 0o700)
+        except FileExistsError:
+            pass
+
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) != 0o700:
+        raise PermissionError(f"المجلد {path} يجب أن يكون مجلداً يملكه المستخدم الحالي بصلاحيات 0700 "
+                              f"(المالك {info.st_uid}، الصلاحيات {oct(stat.S_IMODE(info.st_mode))})")
+    return path
+
+
+def load_authkey(path: Optional[str] = None) -> bytes:
+    """مفتاح المصادقة المشترك: يُقرأ من الملف، أو يُولد فيه (0600) عند أول تشغيل"""
+    path = path or Config.FAISS_SHARD_AUTHKEY_PATH
+    directory = secure_dir(os.path.dirname(path))
+
+    if not os.path.lexists(path):
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_hex(32).encode('ascii'))
+            # الربط يفشل إذا سبقته عملية أخرى، فيقرأ الطرفان نفس المفتاح
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    info = os.lstat(path)
+    if not stat.S_ISREG(info.st_mode) or info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError(f"ملف المفتاح {path} يجب أن يملكه المستخدم الحالي بصلاحيات 0600")
+    with open(path, 'rb') as f:
+        authkey = f.read().strip()
+    if not authkey:
+        raise PermissionError(f"ملف المفتاح {path} فارغ")
+    return authkey
+
+
+class ShardServer:
+    """عملية تحمّل جزءاً واحداً من كل نسخة منشورة وتجيب على طلبات البحث فيه
+
+    الطلب يحدد النسخة، فكل استعلامات الطلب الواحد تُجاب من نفس النسخة في كل الأجزاء
+    حتى لو نُشرت نسخة أحدث أثناء البحث.
+    """
+
+    def __init__(self, snapshots_root: str, shard: int, address: str,
+                 authkey: Optional[bytes] = None, io_flags: int = 0, keep: int = 2):
+        self.snapshots = SnapshotStore(snapshots_root)
+        self.shard = shard
+        self.address = address
+        # الطلبات والردود pickle، فلا يُقبل اتصال بدون مصادقة
+        self.authkey = authkey or Config.FAISS_SHARD_AUTHKEY or load_authkey()
+        self.io_flags = io_flags
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        # النسخ المحملة من الأقدم إلى الأحدث
+        self._indexes: Dict[str, object] = {}
+
+    def _index(self, generation: str):
+        """جزء هذه العملية من النسخة المطلوبة (يُحمّل مرة واحدة)"""
+        index = self._indexes.get(generation)
+        if index is not None:
+            return index
+
+        with self._lock:
+            generation_lock = self._loading.setdefault(generation, threading.Lock())
+        with generation_lock:
+            index = self._indexes.get(generation)
+            if index is None:
+                shards_dir = os.path.join(self.snapshots.root, generation, SHARDS_DIR)
+                index = load_shard(shards_dir, self.shard, index_params=Config.FAISS_INDEX_PARAMS,
+                                   io_flags=self.io_flags)
+                index.set_search_params(nprobe=Config.FAISS_NPROBE, ef_search=Config.FAISS_EF_SEARCH)
+                with self._lock:
+                    self._indexes[generation] = index
+                    self._loading.pop(generation, None)
+                    # النسخ القديمة تُحرر بعد تحميل الأحدث
+                    while len(self._indexes) > self.keep:
+                        self._indexes.pop(next(iter(self._indexes)))
+                print(f"✅ الجزء {self.shard}: تم تحميل النسخة {generation} ({index.ntotal} مستند)")
+        return index
+
+    def _dispatch(self, request: tuple):
+        kind = request[0]
+        if kind == "search":
+            _, generation, query, top_k, country, nprobe, ef_search = request
+            return self._index(generation).search(query, top_k, country,
+                                                  nprobe=nprobe, ef_search=ef_search)
+        if kind == "load":
+            return self._index(request[1]).ntotal
+        if kind == "ping":
+            return os.getpid()
+        raise ValueError(f"طلب غير معروف: {kind}")
+
+    def _handle(self, conn: Connection):
+        """طلبات اتصال واحد بالتتابع؛ كل اتصال في خيط مستقل"""
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    response = ("ok", self._dispatch(request))
+                except Exception as e:
+                    response = ("error", f"{type(e).__name__}: {e}")
+                try:
+                    conn.send(response)
+                except OSError:
+                    return
+
+    def _remove_stale_socket(self):
+        """مقبس متروك من عملية انتهت يمنع الربط؛ مقبس يرد عليه خادم آخر يعني أن الجزء مخدوم"""
+        if not os.path.exists(self.address):
+            return
+        try:
+            Client(self.address, family=_FAMILY, authkey=self.authkey).close()
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(self.address)
+            return
+        raise RuntimeError(f"الجزء {self.shard} مخدوم من عملية أخرى: {self.address}")
+
+    def serve_forever(self):
+        secure_dir(os.path.dirname(self.address))
+        self._remove_stale_socket()
+
+        listener = Listener(self.address, family=_FAMILY, authkey=self.authkey)
+        print(f"🚀 خادم الجزء {self.shard} يعمل على {self.address}")
+
+        # تحميل النسخة الحالية في الخلفية حتى لا ينتظرها أول استعلام
+        generation = self.snapshots.current_generation()
+        if generation is not None:
+            threading.Thread(target=self._index, args=(generation,), daemon=True).start()
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+
+class ShardCoordinator:
+    """توزيع الاستعلام على خوادم الأجزاء بالتوازي وجمع نتائجها
+
+    يحتفظ باتصالات مفتوحة لكل جزء، ويشغّل خادم الجزء غير المتاح عند autostart.
+    الجزء الذي يفشل أو يتأخر يُستبعد من نتائج هذا الاستعلام فقط.
+    """
+
+    def __init__(self, snapshots_root: str, sockets: Optional[str] = None,
+                 authkey: Optional[bytes] = None, timeout: float = 5.0,
+                 autostart: bool = True, start_timeout: float = 60.0, max_workers: int = 16):
+        self.snapshots_root = snapshots_root
+        self.sockets = secure_dir(sockets or socket_dir(snapshots_root))
+        self.authkey = authkey or Config.FAISS_SHARD_AUTHKEY or load_authkey()
+        self.timeout = timeout
+        self.autostart = autostart
+        self.start_timeout = start_timeout
+
+        self._lock = threading.Lock()
+        self._idle: Dict[int, List[Connection]] = {}
+        self._servers: Dict[int, subprocess.Popen] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard")
+
+        self.requests = 0
+        self.shard_errors = 0
+        self._latencies = deque(maxlen=1000)
+        atexit.register(self.close)
+
+    def _connect(self, shard: int) -> Connection:
+        address = shard_address(self.sockets, shard)
+        try:
+            return Client(address, family=_FAMILY, authkey=self.authkey)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if not self.autostart:
+                raise
+        self._start_server(shard)
+        return Client(address, family=_FAMILY, authkey=self.authkey)
+
+    def _start_server(self, shard: int):
+        """تشغيل خادم الجزء وانتظار مقبسه"""
+        address = shard_address(self.sockets, shard)
+        with self._lock:
+            process = self._servers.get(shard)
+            if process is None or process.poll() is not None:
+                print(f"🚀 تشغيل خادم الجزء {shard}")
+                command = [sys.executable, _SERVER_SCRIPT, "--snapshots-dir", self.snapshots_root,
+                           "--shard", str(shard), "--socket-dir", self.sockets]
+                # الخادم يستخدم مفتاح هذا المنسق نفسه
+                env = dict(os.environ, FAISS_SHARD_AUTHKEY=os.fsdecode(self.authkey))
+                self._servers[shard] = process = subprocess.Popen(command, env=env)
+
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None and not os.path.exists(address):
+                raise RuntimeError(f"توقف خادم الجزء {shard} (رمز الخروج {process.returncode})")
+            try:
+                Client(address, family=_FAMILY, authkey=self.authkey).close()
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                time.sleep(0.05)
+        raise TimeoutError(f"لم يبدأ خادم الجزء {shard} خلال {self.start_timeout:.0f} ثانية")
+
+    def _call(self, shard: int, request: tuple, timeout: Optional[float] = None):
+        """إرسال طلب إلى جزء واحد؛ اتصال انقطع (إعادة تشغيل الخادم) يُعاد مرة بآخر جديد"""
+        timeout = timeout or self.timeout
+        for attempt in range(2):
+            with self._lock:
+                idle = self._idle.setdefault(shard, [])
+                conn = idle.pop() if idle else None
+            fresh = conn is None
+            if fresh:
+                conn = self._connect(shard)
+
+            try:
+                conn.send(request)
+                if not conn.poll(timeout):
+                    raise TimeoutError(f"تجاوز الجزء {shard} المهلة ({timeout} ثانية)")
+                status, payload = conn.recv()
+            except (EOFError, OSError) as e:
+                conn.close()
+                if fresh or attempt:
+                    raise
+                continue
+            except BaseException:
+                # رد متأخر قد يصل لاحقاً على هذا الاتصال، فلا يعاد استخدامه
+                conn.close()
+                raise
+
+            with self._lock:
+                self._idle[shard].append(conn)
+            if status != "ok":
+                raise RuntimeError(f"الجزء {shard}: {payload}")
+            return payload
+
+    def load(self, generation: str, shards: List[int]):
+        """تحميل النسخة في خوادم الأجزاء قبل توجيه الاستعلامات إليها (يُستدعى أثناء التحميل في الخلفية)"""
+        futures = [self._executor.submit(self._call, shard, ("load", generation), self.start_timeout)
+                   for shard in shards]
+        for future in futures:
+            future.result()
+
+    def search(self, generation: str, shards: List[int], query: np.ndarray, top_k: int,
+               country: Optional[str] = None, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """نتائج كل جزء متاح [(distances, ids)] لنفس النسخة"""
+        start = time.perf_counter()
+        request = ("search", generation, np.ascontiguousarray(query, dtype='float32'),
+                   top_k, country, nprobe, ef_search)
+
+        if len(shards) == 1:
+            futures = None
+            calls = [lambda: self._call(shards[0], request)]
+        else:
+            futures = [self._executor.submit(self._call, shard, request) for shard in shards]
+            calls = [future.result for future in futures]
+
+        results = []
+        for shard, call in zip(shards, calls):
+            try:
+                results.append(call())
+            except Exception as e:
+                with self._lock:
+                    self.shard_errors += 1
+                print(f"⚠️ استُبعد الجزء {shard} من النتائج: {e}")
+
+        with self._lock:
+            self.requests += 1
+            self._latencies.append((time.perf_counter() - start) * 1000.0)
+        return results
+
+    def statistics(self) -> Dict:
+        with self._lock:
+            latencies = np.asarray(self._latencies) if self._latencies else np.zeros(1)
+            return {
+                'requests': self.requests,
+                'shard_errors': self.shard_errors,
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p95': float(np.percentile(latencies, 95)),
+                'servers_started': len(self._servers),
+                'sockets': self.sockets
+            }
+
+    def close(self):
+        """إغلاق الاتصالات وإيقاف الخوادم التي شغّلها هذا المنسق"""
+        with self._lock:
+            for connections in self._idle.values():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
+            servers, self._servers = list(self._servers.values()), {}
+        for process in servers:
+            if process.poll() is None:
+                process.terminate()
+        self._executor.shutdown(wait=False)
+
+
+class RemoteShardedIndex:
+    """فهرس نسخة مقسمة بنفس واجهة البحث في PartitionedIndex، والمتجهات في خوادم الأجزاء"""
+
+    def __init__(self, coordinator: ShardCoordinator, generation: str, shards_dir: str):
+        self.coordinator = coordinator
+        self.generation = generation
+        self.layout = read_layout(shards_dir)
+        coordinator.load(generation, target_shards(self.layout))
+
+    @property
+    def dim(self) -> int:
+        return self.layout["dim"]
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard["ntotal"] for shard in self.layout["shards"])
+
+    @property
+    def quantized(self) -> bool:
+        return self.layout["quantized"]
+
+    @property
+    def description(self) -> str:
+        return self.layout["description"]
+
+    def partition_sizes(self) -> Dict[str, int]:
+        sizes: Dict[str, int] = {}
+        for shard in self.layout["shards"]:
+            for country, count in shard["partitions"].items():
+                sizes[country] = sizes.get(country, 0) + count
+        return sizes
+
+    def search(self, query: np.ndarray, top_k: int,
+               country: Optional[str] = None,
+               nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.ascontiguousarray(query, dtype='float32')
+        results = self.coordinator.search(self.generation, target_shards(self.layout, country),
+                                          query, top_k, country, nprobe, ef_search)
+        return merge_results(results, len(query), top_k)
@@ -0,0 +1,253 @@
+"""
+snapshots.py - نسخ مرقمة من ملفات الفهرس تُنشر بشكل ذري عبر مؤشر CURRENT
+"""
+
+import json
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional
+
+# أسماء الملفات داخل كل نسخة
+INDEX_FILE = "faiss.index"
+PARTITIONS_DIR = "partitions"
+LEXICAL_DIR = "lexical"
+MANIFEST_FILE = "manifest.json"
+QUALITY_FILE = "quality.json"
+SHARDS_DIR = "shards"
+
+_POINTER = "CURRENT"
+_TMP_PREFIX = ".tmp-"
+_STALE_TMP_SECONDS = 24 * 3600
+
+
+def new_stores() -> str:
+    """اسم جيل جديد من المخازن (البيانات الوصفية والنصوص والمتجهات) لإعادة بناء كاملة"""
+    return f"{time.time_ns():020d}"
+
+
+def store_path(path: str, stores: Optional[str]) -> str:
+    """مسار مخزن في جيل مخازن (metadata.db ← metadata.<الجيل>.db)
+
+    بدون جيل: المسار المعد نفسه (نسخ أنشئت قبل فصل المخازن لكل إعادة بناء).
+    """
+    if not stores:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{stores}{ext}"
+
+
+def _fsync_path(path: str):
+    """مزامنة ملف أو مجلد مع القرص"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        # بعض الأنظمة لا تدعم مزامنة المجلدات
+        pass
+    finally:
+        os.close(fd)
+
+
+class Snapshot:
+    """مسارات ملفات نسخة واحدة من الفهرس"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.generation = os.path.basename(path)
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self.partitions_dir = os.path.join(path, PARTITIONS_DIR)
+        self.lexical_dir = os.path.join(path, LEXICAL_DIR)
+        self.manifest_path = os.path.join(path, MANIFEST_FILE)
+        self.quality_path = os.path.join(path, QUALITY_FILE)
+        # النسخة المقسمة على عدة عمليات: مجلد لكل جزء بدلاً من الفهرس العام
+        self.shards_dir = os.path.join(path, SHARDS_DIR)
+
+    @property
+    def stores(self) -> Optional[str]:
+        """جيل المخازن الذي تشير معرفات هذه النسخة إلى صفوفه (من السجل)"""
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("stores")
+
+    @property
+    def is_sharded(self) -> bool:
+        return os.path.isdir(self.shards_dir)
+
+    def index_size_mb(self) -> float:
+        """حجم ملفات FAISS في النسخة (الفهرس العام وفهارس الدول والأجزاء)"""
+        total = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        for directory in (self.partitions_dir, self.shards_dir):
+            for base, _, files in os.walk(directory):
+                total += sum(os.path.getsize(os.path.join(base, name))
+                             for name in files if name.endswith(".index"))
+        return total / (1024 * 1024)
+
+
+class SnapshotStore:
+    """مجلد النسخ: كل نسخة تُكتب في مجلد مؤقت ثم تُنقل وتُنشر بتبديل CURRENT
+
+    القارئ يرى النسخة السابقة كاملة أو الجديدة كاملة، ولا يرى نسخة نصف مكتوبة أبداً.
+
+    سجل كل نسخة يحدد جيل مخازنها ("stores")، وقد يحوي "retired": نطاقات [بداية، نهاية)
+    لمعرفات أزالتها النسخة من سابقتها. بياناتها تبقى ما دامت نسخة أقدم تستخدمها محفوظة،
+    وتُمرر إلى release عند حذف آخر نسخة منها؛ وجيل المخازن الذي لا تستخدمه أي نسخة باقية
+    يُمرر إلى retire لحذف ملفاته.
+    """
+
+    def __init__(self, root: str, keep: int = 2,
+                 release: Optional[Callable[[Optional[str], List[List[int]]], None]] = None,
+                 retire: Optional[Callable[[Optional[str]], None]] = None):
+        self.root = root
+        self.keep = keep
+        self.release = release
+        self.retire = retire
+
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.root, _POINTER)
+
+    def current_generation(self) -> Optional[str]:
+        """اسم النسخة المنشورة (قراءة ملف صغير، مناسبة للفحص قبل كل استعلام)"""
+        try:
+            with open(self.pointer_path, 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current(self) -> Optional[Snapshot]:
+        """النسخة المنشورة حالياً"""
+        generation = self.current_generation()
+        if generation is None:
+            return None
+        return Snapshot(os.path.join(self.root, generation))
+
+    def begin(self) -> Snapshot:
+        """مجلد مؤقت لكتابة نسخة جديدة"""
+        os.makedirs(self.root, exist_ok=True)
+        # الاسم يتزايد مع الزمن، فالترتيب الأبجدي هو ترتيب النشر
+        generation = f"{time.time_ns():020d}"
+        path = os.path.join(self.root, _TMP_PREFIX + generation)
+        os.makedirs(path)
+        return Snapshot(path)
+
+    def publish(self, snapshot: Snapshot) -> Snapshot:
+        """مزامنة النسخة المؤقتة ثم نقلها وتبديل المؤشر إليها"""
+        for directory, _, files in os.walk(snapshot.path):
+            for name in files:
+                _fsync_path(os.path.join(directory, name))
+            _fsync_path(directory)
+
+        final_path = os.path.join(self.root, snapshot.generation[len(_TMP_PREFIX):])
+        os.rename(snapshot.path, final_path)
+
+        tmp_pointer = self.pointer_path + ".tmp"
+        with open(tmp_pointer, 'w', encoding='utf-8') as f:
+            f.write(os.path.basename(final_path))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_pointer, self.pointer_path)
+        _fsync_path(self.root)
+
+        self.prune()
+        return Snapshot(final_path)
+
+    def abort(self, snapshot: Snapshot):
+        """حذف نسخة مؤقتة لم تكتمل"""
+        shutil.rmtree(snapshot.path, ignore_errors=True)
+
+    def generations(self) -> List[str]:
+        """النسخ المكتملة من الأقدم إلى الأحدث"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if not name.startswith(_TMP_PREFIX) and name != _POINTER
+                      and os.path.isdir(os.path.join(self.root, name)))
+
+    def _manifest(self, generation: str) -> Dict:
+        path = os.path.join(self.root, generation, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _clear_retired(self, generation: str):
+        """إزالة النطاقات المحررة من سجل نسخة باقية حتى لا تُحرر مرة أخرى"""
+        path = os.path.join(self.root, generation, MANIFEST_FILE)
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        manifest.pop("retired", None)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def prune(self):
+        """حذف النسخ القديمة والمؤقتة المتروكة، مع إبقاء آخر keep نسخ
+
+        القراء الذين ما زالوا يستخدمون نسخة محذوفة لا يتأثرون: الفهرس محمل في الذاكرة
+        أو مربوط بملف يبقى متاحاً حتى يُغلق.
+        """
+        generations = self.generations()
+        kept = set(generations[-self.keep:]) | {self.current_generation()}
+        removed = [name for name in generations if name not in kept]
+
+        if removed and (self.release is not None or self.retire is not None):
+            oldest = next(name for name in generations if name in kept)
+            try:
+                manifests = {name: self._manifest(name) for name in generations}
+                live = {manifests[name].get("stores") for name in generations if name in kept}
+
+                if self.release is not None:
+                    # بعد حذف النسخ الأقدم لا تستخدم أي نسخة باقية ما أزالته أقدم نسخة باقية
+                    # (نطاقات الأجيال غير المستخدمة تُحذف مع ملفاتها)
+                    retired: Dict[Optional[str], List[List[int]]] = {}
+                    for name in removed + [oldest]:
+                        stores = manifests[name].get("stores")
+                        if stores in live:
+                            retired.setdefault(stores, []).extend(manifests[name].get("retired", []))
+                    for stores, ranges in retired.items():
+                        if ranges:
+                            self.release(stores, ranges)
+                    if manifests[oldest].get("retired"):
+                        self._clear_retired(oldest)
+
+                if self.retire is not None:
+                    for stores in {manifests[name].get("stores") for name in removed} - live:
+                        self.retire(stores)
+            except Exception as e:
+                # النسخ تبقى حتى تنجح المحاولة عند النشر التالي، فلا تضيع نطاقاتها
+                print(f"⚠️ تعذر تحرير بيانات النسخ القديمة: {e}")
+                removed = []
+
+        for name in removed:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+        # نسخة مؤقتة قد تكون قيد الكتابة من عملية أخرى، فلا تُحذف إلا إذا كانت متروكة
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(_TMP_PREFIX) and time.time() - os.path.getmtime(path) > _STALE_TMP_SECONDS:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def import_legacy(self, index_path: str, partitions_dir: Optional[str] = None,
+                      lexical_dir: Optional[str] = None,
+                      manifest_path: Optional[str] = None) -> Optional[Snapshot]:
+        """نسخ ملفات فهرس قديمة (خارج مجلد النسخ) في أول نسخة منشورة"""
+        if self.current_generation() is not None or not os.path.exists(index_path):
+            return None
+
+        snapshot = self.begin()
+        try:
+            shutil.copy2(index_path, snapshot.index_path)
+            if partitions_dir and os.path.isdir(partitions_dir):
+                shutil.copytree(partitions_dir, snapshot.partitions_dir)
+            if lexical_dir and os.path.isdir(lexical_dir):
+                shutil.copytree(lexical_dir, snapshot.lexical_dir)
+            if manifest_path and os.path.exists(manifest_path):
+                shutil.copy2(manifest_path, snapshot.manifest_path)
+        except Exception:
+            self.abort(snapshot)
+            raise
+
+        print(f"✅ تم ترحيل الفهرس القديم إلى نسخة منشورة: {index_path}")
+        return self.publish(snapshot)
@@ -0,0 +1,104 @@
+"""
+vector_store.py - المتجهات الأصلية (float32) على القرص بقراءة mmap لإعادة الحساب الدقيق
+"""
+
+import os
+import threading
+from typing import Iterable, Optional
+
+import numpy as np
+
+# رأس الملف: عدد الأبعاد (int64)
+_HEADER_BYTES = 8
+
+
+class VectorStore:
+    """صف لكل معرف FAISS؛ الفهرس المضغوط في الذاكرة والمتجهات الدقيقة تُقرأ من القرص عند الحاجة
+
+    الملف للإضافة فقط مثل مخزن النصوص، فالمعرفات المحذوفة أو المتخطاة تبقى صفوفاً صفرية.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.memmap] = None
+        self._size = -1
+
+    def _mapped(self) -> Optional[np.memmap]:
+        """ربط الملف بالذاكرة (أو إعادة ربطه إذا كبر)"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return None
+            size = os.path.getsize(self.path)
+            if size != self._size:
+                dim = int(np.fromfile(self.path, dtype='<i8', count=1)[0])
+                rows = (size - _HEADER_BYTES) // (dim * 4)
+                self._vectors = np.memmap(self.path, dtype='<f4', mode='r',
+                                          offset=_HEADER_BYTES, shape=(rows, dim)) if rows else None
+                self._size = size
+            return self._vectors
+
+    def __len__(self) -> int:
+        vectors = self._mapped()
+        return 0 if vectors is None else len(vectors)
+
+    def append(self, ids: Iterable[int], vectors: np.ndarray):
+        """إضافة متجهات بمعرفاتها (المعرفات تصاعدية)"""
+        ids = np.asarray(list(ids), dtype='int64')
+        vectors = np.ascontiguousarray(vectors, dtype='<f4')
+        if len(ids) == 0:
+            return
+
+        with self._lock:
+            dim = vectors.shape[1]
+            if not os.path.exists(self.path):
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                np.asarray([dim], dtype='<i8').tofile(self.path)
+
+            rows = (os.path.getsize(self.path) - _HEADER_BYTES) // (dim * 4)
+            if ids[0] < rows or np.any(np.diff(ids) <= 0):
+                raise ValueError(f"معرف المتجه {int(ids[0])} موجود مسبقاً في المخزن")
+
+            # الصفوف الصفرية للمعرفات المتخطاة
+            block = np.zeros((int(ids[-1]) + 1 - rows, dim), dtype='<f4')
+            block[ids - rows] = vectors
+
+            with open(self.path, 'r+b') as f:
+                # صف ناقص من كتابة سابقة متوقفة يُستبدل
+                f.seek(_HEADER_BYTES + rows * dim * 4)
+                f.truncate()
+                block.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def get_many(self, ids: Iterable[int]) -> np.ndarray:
+        """متجهات عدة معرفات (صفرية للمعرفات غير الموجودة)"""
+        ids = np.asarray(list(ids), dtype='int64')
+        vectors = self._mapped()
+        if vectors is None:
+            return np.zeros((len(ids), 0), dtype='float32')
+
+        found = (ids >= 0) & (ids < len(vectors))
+        result = np.zeros((len(ids), vectors.shape[1]), dtype='float32')
+        result[found] = vectors[ids[found]]
+        return result
+
+    def sample(self, ids: Iterable[int], size: int, seed: int = 0) -> np.ndarray:
+        """متجهات عينة عشوائية من المعرفات المعطاة (لقياس دقة أنواع الفهارس)"""
+        ids = np.asarray(list(ids), dtype='int64')
+        if len(ids) > size:
+            ids = np.sort(np.random.default_rng(seed).choice(ids, size, replace=False))
+        return self.get_many(ids)
+
+    def size_mb(self) -> float:
+        return os.path.getsize(self.path) / (1024 * 1024) if os.path.exists(self.path) else 0.0
+
+    def close(self):
+        with self._lock:
+            self._vectors, self._size = None, -1
+
+    def remove_files(self):
+        """حذف الملف (لإعادة البناء الكاملة)"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
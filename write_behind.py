@@ -0,0 +1,154 @@
+"""
+write_behind.py - كتابة مؤجلة على دفعات: طابور محدود وخيط واحد يجمع العمليات في معاملات
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# عمليات التحكم في الطابور (لا تُمرر إلى دالة الكتابة)
+_FLUSH = "_flush"
+_STOP = "_stop"
+
+BLOCK = "block"          # الطابور ممتلئ: ينتظر المستدعي مكاناً (لا يضيع شيء)
+DROP_LOGS = "drop_logs"  # الطابور ممتلئ: تُهمل العمليات القابلة للإهمال، وينتظر الباقي
+
+
+class WriteBehindQueue:
+    """عمليات (النوع، البيانات) تُكتب في الخلفية بدفعات عبر write_batch
+
+    الدفعة تُكتب عند بلوغ max_batch عملية أو بعد flush_interval ثانية من أول عملية فيها.
+    flush() ينتظر حتى تُكتب كل العمليات السابقة له، وclose() يكتب الباقي ثم يوقف الخيط.
+    on_written (اختياري) يُستدعى بكل دفعة بعد انتهاء محاولة كتابتها، نجحت أو فشلت.
+    put() يعيد False إذا لم يقبل الطابور العملية (بعد الإغلاق أو توقف الخيط، أو إهمالها)،
+    وعندها يكتبها المستدعي بنفسه إن لم تكن قابلة للإهمال.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Tuple[str, Dict]]], None],
+                 flush_interval: float = 0.2, max_batch: int = 200, max_size: int = 10000,
+                 policy: str = BLOCK, name: str = "write-behind",
+                 on_written: Optional[Callable[[List[Tuple[str, Dict]]], None]] = None):
+        self.write_batch = write_batch
+        self.on_written = on_written
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.policy = policy
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._closed = False
+        # الإضافة والإغلاق متعاقبان: كل عملية مقبولة تسبق علامة الإيقاف في الطابور
+        self._put_lock = threading.Lock()
+        self._counts = {'written': 0, 'batches': 0, 'dropped': 0, 'failed': 0}
+        self._counts_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def accepting(self) -> bool:
+        """الطابور مفتوح وخيط الكتابة يعمل"""
+        return not self._closed and self._thread.is_alive()
+
+    def _count(self, name: str, value: int = 1):
+        with self._counts_lock:
+            self._counts[name] += value
+
+    def put(self, kind: str, payload: Dict, droppable: bool = False) -> bool:
+        """إضافة عملية؛ يعيد False إذا أُهملت لامتلاء الطابور أو لم يعد الطابور يقبل عمليات"""
+        with self._put_lock:
+            if not self.accepting:
+                return False
+            if droppable and self.policy == DROP_LOGS:
+                try:
+                    self._queue.put_nowait((kind, payload))
+                    return True
+                except queue.Full:
+                    self._count('dropped')
+                    return False
+            # الانتظار لا يستمر إذا توقف خيط الكتابة
+            while True:
+                try:
+                    self._queue.put((kind, payload), timeout=1.0)
+                    return True
+                except queue.Full:
+                    if not self._thread.is_alive():
+                        return False
+
+    def flush(self, timeout: float = None) -> bool:
+        """انتظار كتابة كل ما سبق؛ يعيد False عند انتهاء المهلة"""
+        if self._closed:
+            return True
+        if not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self._queue.put((_FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """كتابة الباقي وإيقاف الخيط (يُستدعى عند إيقاف المنصة)"""
+        with self._put_lock:
+            if self._closed:
+                return
+            self._closed = True
+        try:
+            self._queue.put((_STOP, None), timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def statistics(self) -> Dict:
+        with self._counts_lock:
+            return dict(self._counts, queued=self._queue.qsize())
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # جمع الدفعة حتى حدها أو انتهاء المهلة، أو فوراً عند طلب flush/الإيقاف
+            while len(items) < self.max_batch and items[-1][0] not in (_FLUSH, _STOP):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            batch = [item for item in items if item[0] not in (_FLUSH, _STOP)]
+            if batch:
+                self._write(batch)
+                if self.on_written is not None:
+                    try:
+                        self.on_written(batch)
+                    except Exception as e:
+                        # الخيط يبقى يعمل، وإلا علق flush() والإضافة بلا نهاية
+                        print(f"⚠️ خطأ بعد كتابة دفعة من {len(batch)} عملية: {e}")
+            for kind, payload in items:
+                if kind == _FLUSH:
+                    payload.set()
+            if items[-1][0] == _STOP:
+                if self._queue.empty():
+                    return
+                # عمليات أُضيفت قبل الإغلاق مباشرة
+                self._queue.put((_STOP, None))
+
+    def _write(self, batch: List[Tuple[str, Dict]]):
+        """الدفعة في معاملة واحدة؛ إذا فشلت تُكتب كل عملية وحدها حتى لا تُفقد الباقية بسبب واحدة"""
+        try:
+            self.write_batch(batch)
+            self._count('written', len(batch))
+            self._count('batches')
+            return
+        except Exception as e:
+            print(f"⚠️ فشلت كتابة دفعة من {len(batch)} عملية: {e}")
+        if len(batch) == 1:
+            self._count('failed')
+            return
+        for item in batch:
+            self._write([item])